@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class HistoryCache:
+    """
+    Bounded LRU/TTL cache of recent symptom logs per patient (oldest first), as
+    (log_id, LogInput) pairs converted once when read or submitted.
+    submit_log writes through with upsert() so the next request skips Firestore.
+    """
+
+    def __init__(self, ttl_seconds=300, max_entries=1024, max_logs=10):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_logs = max_logs
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, patient_id):
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is None or entry[1] < time.monotonic():
+                self._entries.pop(patient_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(patient_id)
+            self.hits += 1
+            return list(entry[0])
+
+    def set(self, patient_id, logs):
+        with self._lock:
+            self._entries[patient_id] = (list(logs[-self.max_logs:]), time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(patient_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def upsert(self, patient_id, log_id, log):
+        """Replaces the cached log with this id, or appends it as the newest entry."""
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is None:
+                return
+            logs = list(entry[0])
+            for index, (cached_id, _) in enumerate(logs):
+                if cached_id == log_id:
+                    logs[index] = (log_id, log)
+                    break
+            else:
+                logs.append((log_id, log))
+            self._entries[patient_id] = (logs[-self.max_logs:], entry[1])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "patients": len(self._entries),
+        }
+
+
+def create_history_cache():
+    """Builds the cache from HISTORY_CACHE_* environment variables."""
+    return HistoryCache(
+        ttl_seconds=float(os.getenv("HISTORY_CACHE_TTL_SECONDS", "300")),
+        max_entries=int(os.getenv("HISTORY_CACHE_MAX_PATIENTS", "1024")),
+    )
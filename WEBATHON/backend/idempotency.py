@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Responses kept on patient_stats/{patientId} for retries that miss the in-memory cache
+RECENT_RESULTS = 20
+
+
+class ResponseCache:
+    """
+    Bounded LRU/TTL map of log_id -> submit_log response.
+    A retried submission found here is answered without touching Firestore.
+    """
+
+    def __init__(self, ttl_seconds=86400, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, log_id):
+        with self._lock:
+            entry = self._entries.get(log_id)
+            if entry is None or entry[1] < time.monotonic():
+                self._entries.pop(log_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(log_id)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, log_id, response):
+        with self._lock:
+            self._entries[log_id] = (response, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(log_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+def remember(recent_results, log_id, response):
+    """recent_results (oldest first, [{"log_id": ..., **response}]) with this response appended."""
+    kept = [item for item in recent_results if item.get("log_id") != log_id]
+    kept.append({"log_id": log_id, **response})
+    return kept[-RECENT_RESULTS:]
+
+
+def find(recent_results, log_id):
+    """Stored response for log_id, or None."""
+    for item in recent_results:
+        if item.get("log_id") == log_id:
+            return {key: value for key, value in item.items() if key != "log_id"}
+    return None
+
+
+def create_response_cache():
+    """Builds the cache from IDEMPOTENCY_* environment variables."""
+    return ResponseCache(
+        ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")),
+        max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000")),
+    )
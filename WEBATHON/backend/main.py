@@ -1,7 +1,9 @@
-﻿from datetime import datetime
+﻿from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import Literal, Optional
 import os
-import statistics
+import threading
+import time
 
 import firebase_admin
 from dotenv import load_dotenv
@@ -10,6 +12,15 @@ from fastapi.middleware.cors import CORSMiddleware
 from firebase_admin import credentials, firestore
 from pydantic import BaseModel
 
+from history_cache import create_history_cache
+from idempotency import create_response_cache, find, remember
+from rolling_stats import PatientStats
+from scoring import timing
+from scoring.rules import vitals_rules
+from scoring.schema import LogInput, attribute
+from scoring.vitals import HISTORY_FIELDS, evaluate, evaluate_batch, stack_history
+from stale_monitor import STAGES, FirestoreLease, PatientStatsSource, StaleLogMonitor
+
 load_dotenv()
 
 # Initialize Firebase Admin
@@ -23,8 +34,107 @@ if not firebase_admin._apps:
     firebase_admin.initialize_app(cred)
 
 db = firestore.client()
+history_cache = create_history_cache()
+submitted_logs = create_response_cache()
+
+
+class LayerTimings:
+    """Count, total and max time per risk engine layer (scoring.timing.LAYER_TIMER)."""
+
+    def __init__(self):
+        self._layers = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, layer, seconds):
+        with self._lock:
+            entry = self._layers.setdefault(layer, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                layer: {
+                    "count": count,
+                    "mean_us": round(total / count * 1e6, 2),
+                    "max_us": round(longest * 1e6, 2),
+                }
+                for layer, (count, total, longest) in self._layers.items()
+            }
+
+
+# ENGINE_TIMINGS=1 times every risk engine layer (see /api/engine_timings)
+engine_timings = LayerTimings() if os.getenv("ENGINE_TIMINGS") == "1" else None
+timing.LAYER_TIMER = engine_timings
+
+STALE_ALERTS = {
+    "stale": ("STALE_DATA", "YELLOW", "No symptom log for {hours} hours: data is stale"),
+    "missed": ("MISSED_LOG", "RED", "No symptom log for {hours} hours: daily logs missed"),
+}
+
+
+@firestore.transactional
+def write_stale_alert(transaction, patient_id: str, stage: str, last_log_at: float) -> bool:
+    """
+    Writes a stale/missed-log alert unless patient_stats shows a newer log, and
+    records the stage on patient_stats (reset by the next scored log). The
+    document id is fixed by patient, stage and last log, so an alert repeated
+    by another process or after a restart is not written twice.
+    """
+    alert_type, risk, message = STALE_ALERTS[stage]
+    stats_ref = db.collection("patient_stats").document(patient_id)
+    alert_ref = db.collection("alerts").document(f"{alert_type}-{patient_id}-{int(last_log_at)}")
+    snapshot = stats_ref.get(field_paths=["last_log_at"], transaction=transaction)
+    stored = (snapshot.to_dict() or {}).get("last_log_at") if snapshot.exists else None
+    if stored is not None and stored > last_log_at:
+        return False
+
+    if not alert_ref.get(field_paths=["type"], transaction=transaction).exists:
+        hours = int((datetime.now().timestamp() - last_log_at) // 3600)
+        transaction.create(alert_ref, {
+            "patientId": patient_id,
+            "type": alert_type,
+            "message": message.format(hours=hours),
+            "risk": risk,
+            "acknowledged": False,
+            "createdAt": datetime.now(),
+            "lastLogAt": datetime.fromtimestamp(last_log_at),
+        })
+    transaction.set(stats_ref, {"stale_alerted": STAGES.index(stage) + 1}, merge=True)
+    return True
+
+
+def raise_stale_alert(patient_id: str, stage: str, last_log_at: float) -> bool:
+    return write_stale_alert(db.transaction(), patient_id, stage, last_log_at)
+
+
+# Patients who stop logging are flagged by a background scheduler
+# (STALE_MONITOR=0 disables it). Its state is derived from patient_stats, and
+# of all running instances only the holder of monitor_state/stale_logs_leader
+# raises alerts.
+stale_poll_seconds = float(os.getenv("STALE_POLL_SECONDS", "60"))
+stale_monitor = StaleLogMonitor(
+    raise_stale_alert,
+    stale_hours=vitals_rules.get().stale_hours,
+    missed_hours=float(os.getenv("MISSED_LOG_HOURS", "48")),
+    source=PatientStatsSource(db),
+    lease=FirestoreLease(db, ttl_seconds=3 * stale_poll_seconds),
+    poll_seconds=stale_poll_seconds,
+)
 
-app = FastAPI(title="Post-Op Guardian API")
+
+@asynccontextmanager
+async def lifespan(app):
+    enabled = os.getenv("STALE_MONITOR", "1") != "0"
+    if enabled:
+        stale_monitor.start()
+    yield
+    if enabled:
+        stale_monitor.stop()
+
+
+app = FastAPI(title="Post-Op Guardian API", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -63,280 +173,65 @@ class RiskResponse(BaseModel):
     trend_risk: Literal["GREEN", "YELLOW", "RED"]
 
 
-CONFIG = {
-    "critical_spo2": 90,
-    "low_spo2": 94,
-    "high_temp": 38,
-    "very_high_temp": 39,
-    "severe_pain": 7,
-    "extreme_pain": 9,
-    "missing_penalty": 12,
-    "stale_hours": 24,
-}
-
-
-def compute_dynamic_baseline(history, window=5):
-    """Median baseline from recent stable days."""
-    if not history:
-        return None
-
-    recent = [
-        h
-        for h in history[-window:]
-        if h.get("temperature", 0) < 38 and h.get("spo2", 100) >= 94
-    ] or history[-window:]
-
-    def med(key):
-        vals = [d[key] for d in recent if d.get(key) is not None]
-        return statistics.median(vals) if vals else None
-
-    return {
-        "heart_rate": med("heart_rate"),
-        "temperature": med("temperature"),
-        "spo2": med("spo2"),
-    }
-
-
-def validate_inputs(data):
-    """Reject physiologically impossible values."""
-    issues = []
-
-    if data.get("heart_rate") is not None:
-        if not (30 <= data["heart_rate"] <= 220):
-            issues.append("Invalid heart rate reading")
-
-    if data.get("spo2") is not None:
-        if not (70 <= data["spo2"] <= 100):
-            issues.append("Invalid SpO2 reading")
-
-    if data.get("temperature") is not None:
-        if not (34 <= data["temperature"] <= 42):
-            issues.append("Invalid temperature reading")
-
-    if data.get("pain") is not None:
-        if not (0 <= data["pain"] <= 10):
-            issues.append("Invalid pain score")
-
-    return issues
-
-
-def hours_since(ts):
-    if ts is None:
-        return None
-    return (datetime.now() - ts).total_seconds() / 3600
-
-
-def news_like_score(data):
-    """Physiological early warning scoring."""
-    score = 0
-    reasons = []
-
-    temp = data.get("temperature")
-    if temp is not None:
-        if temp >= 39:
-            score += 3
-            reasons.append("High fever (>=39)")
-        elif temp >= 38:
-            score += 2
-            reasons.append("Fever (>=38)")
-
-    spo2 = data.get("spo2")
-    if spo2 is not None:
-        if spo2 < CONFIG["critical_spo2"]:
-            return 10, ["Critical hypoxia"]
-        if spo2 < CONFIG["low_spo2"]:
-            score += 3
-            reasons.append("Low oxygen")
-
-    hr = data.get("heart_rate")
-    if hr is not None:
-        if hr >= 130:
-            score += 3
-            reasons.append("Severe tachycardia")
-        elif hr >= 110:
-            score += 2
-            reasons.append("Tachycardia")
-
-    return score, reasons
-
-
-def trend_analysis(history, current_data):
-    """Clinically calibrated trend detection."""
-    if not history or len(history) < 3:
-        return 0, []
-
-    penalties = 0
-    reasons = []
-
-    temps = [h.get("temperature") for h in history if h.get("temperature") is not None]
-    pains = [h.get("pain") for h in history if h.get("pain") is not None]
-
-    current_temp = current_data.get("temperature")
-    current_pain = current_data.get("pain")
-
-    if len(temps) >= 3 and all(t >= 38 for t in temps[-3:]):
-        if current_temp and current_temp >= 38:
-            penalties += 2
-            reasons.append("Persistent fever (active)")
-        else:
-            penalties += 1
-            reasons.append("Recent fever history (monitor)")
-
-    if len(pains) >= 3 and pains[-1] > pains[-2] > pains[-3]:
-        if current_pain and current_pain >= 7:
-            penalties += 2
-            reasons.append("Pain worsening trend")
-        else:
-            penalties += 1
-            reasons.append("Pain trend improving but monitor")
-
-    return penalties, reasons
-
-
-def evaluate_patient_ultra(data, history=None, surgery_type="general", baseline=None):
-    """Rule-based post-op risk engine."""
-    if not data:
-        return {
-            "risk": "NORMAL",
-            "score": 0,
-            "confidence": 0,
-            "alerts": ["No data provided"],
-            "missing_fields": [],
-            "recommended_action": "Provide patient data",
-        }
-
-    alerts = []
-    score = 0
-    critical = False
-    missing = []
-
-    validation_issues = validate_inputs(data)
-    alerts.extend(validation_issues)
-
-    if baseline is None and history:
-        baseline = compute_dynamic_baseline(history)
-
-    required = ["temperature", "spo2", "pain", "heart_rate"]
-    for field_name in required:
-        if data.get(field_name) is None:
-            missing.append(field_name)
-
-    hrs = hours_since(data.get("timestamp"))
-    if hrs is not None and hrs > CONFIG["stale_hours"]:
-        alerts.append("Data is stale")
-
-    if data.get("spo2") is not None and data["spo2"] < CONFIG["critical_spo2"]:
-        critical = True
-        alerts.append("CRITICAL: Oxygen dangerously low")
-
-    if data.get("breathlessness") is True:
-        critical = True
-        alerts.append("CRITICAL: Breathing difficulty")
-
-    phys_score, phys_reasons = news_like_score(data)
-    score += phys_score
-    alerts.extend(phys_reasons)
-
-    pain = data.get("pain")
-    if pain is not None:
-        if pain >= CONFIG["extreme_pain"]:
-            score += 3
-            alerts.append("Extreme pain")
-        elif pain >= CONFIG["severe_pain"]:
-            score += 2
-            alerts.append("Severe pain")
-
-    if data.get("wound_discharge"):
-        score += 3
-        alerts.append("Possible wound infection")
-
-    if data.get("missed_doses", 0) >= 3:
-        score += 2
-        alerts.append("Multiple medication doses missed")
-
-    t_score, t_alerts = trend_analysis(history or [], data)
-    score += t_score
-    alerts.extend(t_alerts)
-
-    if baseline and data.get("heart_rate") and baseline.get("heart_rate"):
-        if data["heart_rate"] > baseline["heart_rate"] + 20:
-            score += 1
-            alerts.append("HR elevated from personal baseline")
-
-    if surgery_type == "cardiac" and data.get("spo2", 100) < 95:
-        score += 1
-        alerts.append("Cardiac patient oxygen caution")
-
-    if critical:
-        risk = "CRITICAL"
-    elif score >= 9:
-        risk = "CRITICAL"
-    elif score >= 4:
-        risk = "WARNING"
-    else:
-        risk = "NORMAL"
-
-    confidence = 95
-    if not history or len(history) < 3:
-        confidence -= 5
-
-    confidence -= len(missing) * CONFIG["missing_penalty"]
-
-    if hrs and hrs > CONFIG["stale_hours"]:
-        confidence -= 20
-
-    if validation_issues:
-        confidence -= 25
-
-    confidence = max(0, confidence)
-
-    if risk == "CRITICAL":
-        action = "Immediate medical attention required"
-    elif risk == "WARNING":
-        action = "Doctor review within 24 hours"
-    else:
-        action = "Continue routine monitoring"
-
-    return {
-        "risk": risk,
-        "score": score,
-        "confidence": confidence,
-        "alerts": alerts,
-        "missing_fields": missing,
-        "recommended_action": action,
-    }
-
-
-def map_log_to_engine_input(log_data: dict) -> dict:
-    """Maps app symptom-log shape to risk-engine expected fields."""
-    return {
-        "temperature": log_data.get("temperature"),
-        "spo2": log_data.get("spo2"),
-        "pain": log_data.get("pain") if log_data.get("pain") is not None else log_data.get("pain_score"),
-        "heart_rate": log_data.get("heart_rate"),
-        "breathlessness": bool(log_data.get("breathlessness", False)),
-        "wound_discharge": bool(log_data.get("wound_discharge", log_data.get("discharge", False))),
-        "missed_doses": log_data.get("missed_doses", 1 if log_data.get("antibiotics_taken") is False else 0),
-        "timestamp": datetime.now(),
-    }
-
-
-def fetch_patient_history(patient_id: str, limit: int = 10) -> list[dict]:
-    """Loads recent symptom logs and converts them to engine input format."""
+class ScoreBatchRequest(BaseModel):
+    """Columnar engine inputs; every list holds one entry per patient."""
+    patient_ids: list[str]
+    temperature: Optional[list[Optional[float]]] = None
+    spo2: Optional[list[Optional[float]]] = None
+    pain: Optional[list[Optional[float]]] = None
+    heart_rate: Optional[list[Optional[float]]] = None
+    breathlessness: Optional[list[bool]] = None
+    wound_discharge: Optional[list[bool]] = None
+    missed_doses: Optional[list[int]] = None
+    history: Optional[list[list[dict]]] = None
+    surgery_type: str = "general"
+
+
+# symptom_logs fields the history layers read (through LogInput.from_symptom_log):
+# history queries select() only these and skip the risk_details blobs
+# submit_log writes back
+ENGINE_LOG_FIELDS = [
+    "temperature", "spo2", "pain", "pain_score", "heart_rate", "breathlessness",
+    "wound_discharge", "discharge", "missed_doses", "antibiotics_taken", "createdAt",
+]
+
+
+def fetch_patient_history(patient_id: str, limit: int = 10, exclude_log_id: Optional[str] = None) -> list[LogInput]:
+    """Loads recent symptom logs as LogInputs, oldest first (cached per patient, converted once)."""
+    entries = history_cache.get(patient_id) if limit <= history_cache.max_logs else None
+    if entries is None:
+        try:
+            logs_ref = db.collection("symptom_logs")
+            query = (
+                logs_ref.where("patientId", "==", patient_id)
+                .order_by("createdAt", direction=firestore.Query.DESCENDING)
+                .limit(max(limit, history_cache.max_logs))
+                .select(ENGINE_LOG_FIELDS)
+            )
+
+            entries = [(doc.id, LogInput.from_symptom_log(doc.to_dict())) for doc in query.stream()]
+            entries.reverse()
+            history_cache.set(patient_id, entries)
+        except Exception as exc:
+            print(f"History fetch failed for {patient_id}: {exc}")
+            return []
+    return [log for log_id, log in entries if log_id != exclude_log_id][-limit:]
+
+
+def load_patient_stats(patient_id: str, exclude_log_id: Optional[str] = None, transaction=None) -> tuple[PatientStats, list[dict]]:
+    """
+    Reads the patient's rolling stats (bootstrapped from history the first time)
+    and the responses to their latest submissions, stored alongside.
+    """
     try:
-        logs_ref = db.collection("symptom_logs")
-        query = (
-            logs_ref.where("patientId", "==", patient_id)
-            .order_by("createdAt", direction=firestore.Query.DESCENDING)
-            .limit(limit)
-        )
-
-        docs = [doc.to_dict() for doc in query.stream()]
-        docs.reverse()
-        return [map_log_to_engine_input(item) for item in docs]
+        snapshot = db.collection("patient_stats").document(patient_id).get(transaction=transaction)
+        data = snapshot.to_dict() if snapshot.exists else None
+        # Documents with only the stale monitor's backfilled last_log_at hold no stats yet
+        if data and "count" in data:
+            return PatientStats.from_dict(data), data.get("recent_results", [])
     except Exception as exc:
-        print(f"History fetch failed for {patient_id}: {exc}")
-        return []
+        print(f"Stats fetch failed for {patient_id}: {exc}")
+    return PatientStats.from_history(fetch_patient_history(patient_id, exclude_log_id=exclude_log_id)), []
 
 
 def risk_to_traffic_label(risk: str) -> Literal["GREEN", "YELLOW", "RED"]:
@@ -348,51 +243,142 @@ def risk_to_traffic_label(risk: str) -> Literal["GREEN", "YELLOW", "RED"]:
     return mapping.get(risk, "GREEN")
 
 
+@firestore.transactional
+def store_result(transaction, log: SymptomLog, log_input: LogInput) -> tuple[dict, bool]:
+    """
+    Scores the log against the patient's rolling stats and writes the result
+    and the updated stats in one transaction, which Firestore runs again if
+    patient_stats changed in the meantime. Returns the response and whether it
+    is new (False for a log_id already answered).
+    """
+    stats, recent_results = load_patient_stats(log.patientId, exclude_log_id=log.log_id, transaction=transaction)
+    stored = find(recent_results, log.log_id)
+    if stored is not None:
+        return stored, False
+
+    result = evaluate(
+        log_input,
+        surgery_type="general",
+        baseline=None,
+        stats=stats,
+    )
+    stats.push(log_input)
+
+    final_risk = risk_to_traffic_label(result["risk"])
+    message = "; ".join(result["alerts"]) if result["alerts"] else result["recommended_action"]
+
+    risk_fields = {
+        "risk": final_risk,
+        "rule_risk": final_risk,
+        "trend_risk": final_risk,
+        "risk_assessed_at": datetime.now(),
+        "risk_details": result,
+    }
+    response = {
+        "risk": final_risk,
+        "message": message,
+        "rule_risk": final_risk,
+        "trend_risk": final_risk,
+    }
+    transaction.update(db.collection("symptom_logs").document(log.log_id), risk_fields)
+    transaction.set(db.collection("patient_stats").document(log.patientId), {
+        **stats.to_dict(),
+        "recent_results": remember(recent_results, log.log_id, response),
+        # Lets the stale-log monitor of any instance pick the log up
+        "updated_at": time.time(),
+    })
+    return response, True
+
+
 @app.post("/api/submit_log", response_model=RiskResponse)
 async def submit_log(log: SymptomLog):
-    """Submit symptom log and return rule-engine risk in existing response format."""
+    """
+    Submit symptom log and return rule-engine risk in existing response format.
+    Retries with the same log_id get the first response back; the stats are not
+    pushed twice and nothing is written again.
+    """
+    cached = submitted_logs.get(log.log_id)
+    if cached is not None:
+        return RiskResponse(**cached)
     try:
-        log_dict = log.dict()
-        history = fetch_patient_history(log.patientId)
-        engine_input = map_log_to_engine_input(log_dict)
-
-        result = evaluate_patient_ultra(
-            engine_input,
-            history=history,
-            surgery_type="general",
-            baseline=None,
-        )
-
-        final_risk = risk_to_traffic_label(result["risk"])
-        message = "; ".join(result["alerts"]) if result["alerts"] else result["recommended_action"]
-
-        log_ref = db.collection("symptom_logs").document(log.log_id)
-        log_ref.update(
-            {
-                "risk": final_risk,
-                "rule_risk": final_risk,
-                "trend_risk": final_risk,
-                "risk_assessed_at": datetime.now(),
-                "risk_details": result,
-            }
-        )
+        log_input = LogInput.from_symptom_log(log.dict())
+        response, is_new = store_result(db.transaction(), log, log_input)
+        if is_new:
+            history_cache.upsert(log.patientId, log.log_id, log_input)
+            stale_monitor.observe(log.patientId, log_input.logged_at)
+        submitted_logs.set(log.log_id, response)
 
-        return RiskResponse(
-            risk=final_risk,
-            message=message,
-            rule_risk=final_risk,
-            trend_risk=final_risk,
-        )
+        return RiskResponse(**response)
 
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Error processing log: {str(exc)}")
 
 
+@app.post("/api/score_batch")
+async def score_batch(req: ScoreBatchRequest):
+    """Score a whole cohort in one vectorized pass of the rule engine."""
+    n = len(req.patient_ids)
+    columns = {}
+    for name in ["temperature", "spo2", "pain", "heart_rate", "breathlessness", "wound_discharge", "missed_doses"]:
+        values = getattr(req, name)
+        if values is None:
+            continue
+        if len(values) != n:
+            raise HTTPException(status_code=400, detail=f"'{name}' must have {n} entries")
+        columns[attribute(name)] = [float("nan") if v is None else v for v in values]
+    columns.setdefault("temperature", [float("nan")] * n)
+
+    history = lengths = None
+    if req.history is not None:
+        if len(req.history) != n:
+            raise HTTPException(status_code=400, detail=f"'history' must have {n} entries")
+        history, lengths = stack_history(
+            [[LogInput.from_symptom_log(item) for item in items] for items in req.history],
+            HISTORY_FIELDS,
+        )
+
+    results = evaluate_batch(
+        columns,
+        history=history,
+        history_lengths=lengths,
+        surgery_type=req.surgery_type,
+    )
+
+    return {
+        "results": [
+            {"patientId": patient_id, "risk": risk_to_traffic_label(result["risk"]), "result": result}
+            for patient_id, result in zip(req.patient_ids, results)
+        ]
+    }
+
+
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok", "message": "Post-Op Guardian API is running"}
 
 
+@app.get("/api/cache_stats")
+async def cache_stats():
+    return history_cache.stats()
+
+
+@app.get("/api/idempotency_stats")
+async def idempotency_stats():
+    return submitted_logs.stats()
+
+
+@app.get("/api/stale_monitor")
+async def stale_monitor_stats():
+    return stale_monitor.stats()
+
+
+@app.get("/api/engine_timings")
+async def engine_timings_stats():
+    if engine_timings is None:
+        return {"enabled": False, "layers": {}}
+    return {"enabled": True, "layers": engine_timings.stats()}
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,111 @@
+from bisect import bisect_left, insort
+from collections import deque
+
+BASELINE_FIELDS = ("temperature", "spo2", "heart_rate")
+
+
+def _median(sorted_values):
+    n = len(sorted_values)
+    if n == 0:
+        return None
+    mid = n // 2
+    if n % 2:
+        return sorted_values[mid]
+    return (sorted_values[mid - 1] + sorted_values[mid]) / 2
+
+
+def _is_stable(entry):
+    temp = entry.get("temperature")
+    spo2 = entry.get("spo2")
+    return (temp is None or temp < 38) and (spo2 is None or spo2 >= 94)
+
+
+class PatientStats:
+    """
+    Rolling per-patient state that replaces the history fetch in submit_log.
+
+    Tracks what scoring.vitals.evaluate reads from history: the entry count, the
+    last three temperature and pain readings for trend_analysis, and sorted
+    windows of the last `window` entries for compute_dynamic_baseline medians
+    (O(log n) insert/evict, O(1) median), and the newest log time for the
+    stale-log monitor. Serializes to a small dict stored in
+    patient_stats/{patientId}.
+    """
+
+    def __init__(self, window=5):
+        self.window = window
+        self.count = 0
+        self.recent = deque()
+        self.last_temps = deque(maxlen=3)
+        self.last_pains = deque(maxlen=3)
+        self.stable_entries = 0
+        self.last_log_at = None
+        self._all = {field: [] for field in BASELINE_FIELDS}
+        self._stable = {field: [] for field in BASELINE_FIELDS}
+
+    def push(self, entry):
+        """Adds one LogInput as the newest history entry."""
+        self.count += 1
+        if entry.logged_at is not None and (self.last_log_at is None or entry.logged_at > self.last_log_at):
+            self.last_log_at = entry.logged_at
+        if entry.temperature is not None:
+            self.last_temps.append(entry.temperature)
+        if entry.pain_score is not None:
+            self.last_pains.append(entry.pain_score)
+        self._add_to_window({field: getattr(entry, field) for field in BASELINE_FIELDS})
+
+    def _add_to_window(self, values):
+        if len(self.recent) == self.window:
+            self._update_sorted(self.recent.popleft(), remove=True)
+        self.recent.append(values)
+        self._update_sorted(values, remove=False)
+
+    def _update_sorted(self, values, remove):
+        stable = _is_stable(values)
+        if stable:
+            self.stable_entries += -1 if remove else 1
+        for field, value in values.items():
+            if value is None:
+                continue
+            targets = [self._all[field]] + ([self._stable[field]] if stable else [])
+            for sorted_values in targets:
+                if remove:
+                    del sorted_values[bisect_left(sorted_values, value)]
+                else:
+                    insort(sorted_values, value)
+
+    def baseline(self):
+        """Same result as compute_dynamic_baseline over the full history."""
+        if self.count == 0:
+            return None
+        source = self._stable if self.stable_entries else self._all
+        return {field: _median(source[field]) for field in BASELINE_FIELDS}
+
+    def to_dict(self):
+        return {
+            "window": self.window,
+            "count": self.count,
+            "recent": list(self.recent),
+            "last_temps": list(self.last_temps),
+            "last_pains": list(self.last_pains),
+            "last_log_at": self.last_log_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls(window=data.get("window", 5))
+        for values in data.get("recent", []):
+            stats._add_to_window({field: values.get(field) for field in BASELINE_FIELDS})
+        stats.count = data.get("count", 0)
+        stats.last_temps.extend(data.get("last_temps", []))
+        stats.last_pains.extend(data.get("last_pains", []))
+        stats.last_log_at = data.get("last_log_at")
+        return stats
+
+    @classmethod
+    def from_history(cls, history):
+        """Bootstraps the state from an oldest-first list of LogInputs."""
+        stats = cls()
+        for entry in history:
+            stats.push(entry)
+        return stats
@@ -1,5 +1,7 @@
 ﻿const express = require('express');
 const cors = require('cors');
+const fs = require('fs');
+const path = require('path');
 
 const app = express();
 app.use(cors({ origin: ['http://localhost:3000', 'http://localhost:3001', 'http://localhost:3002', 'http://localhost:3003', 'http://localhost:3004', 'http://localhost:5173'] }));
@@ -9,16 +11,67 @@ app.get('/api/health', (req, res) => {
   res.json({ status: 'ok', message: 'Node backend running' });
 });
 
-const CONFIG = {
-  critical_spo2: 90,
-  low_spo2: 94,
-  high_temp: 38,
-  very_high_temp: 39,
-  severe_pain: 7,
-  extreme_pain: 9,
-  missing_penalty: 12,
-  stale_hours: 24,
-};
+// Thresholds, points and alert texts are shared with the Python engines via
+// rules/risk_rules.json; edits are picked up without a restart.
+const RULES_PATH = process.env.RISK_RULES_PATH || path.join(__dirname, '..', '..', 'rules', 'risk_rules.json');
+
+function compileTest(rule) {
+  if ('min' in rule) return (v) => v >= rule.min;
+  if ('below' in rule) return (v) => v < rule.below;
+  if ('equals' in rule) return (v) => v === rule.equals;
+  if ('truthy' in rule) return (v) => Boolean(v) === Boolean(rule.truthy);
+  throw new Error(`Rule for ${rule.field} has no condition`);
+}
+
+function compileLadders(entries) {
+  return entries.map((entry) => ({
+    field: entry.field,
+    steps: entry.steps.map((step) => ({ ...step, test: compileTest(step) })),
+  }));
+}
+
+function compileVitalsRules(spec) {
+  return {
+    ...spec,
+    critical: spec.critical.map((rule) => ({ ...rule, test: compileTest(rule) })),
+    physiology: compileLadders(spec.physiology),
+    symptoms: compileLadders(spec.symptoms),
+    surgery: Object.fromEntries(
+      Object.entries(spec.surgery || {}).map(([type, rule]) => [type, { ...rule, test: compileTest(rule) }]),
+    ),
+  };
+}
+
+let RULES = null;
+
+function loadRules() {
+  try {
+    RULES = compileVitalsRules(JSON.parse(fs.readFileSync(RULES_PATH, 'utf8')).vitals);
+  } catch (err) {
+    if (!RULES) throw err;
+    console.error(`Keeping previous risk rules, reload of ${RULES_PATH} failed: ${err.message}`);
+  }
+}
+
+loadRules();
+fs.watchFile(RULES_PATH, { interval: 2000 }, loadRules);
+
+function scoreLadders(ladders, data) {
+  let score = 0;
+  const reasons = [];
+
+  for (const { field, steps } of ladders) {
+    const value = data[field];
+    if (value == null) continue;
+    const step = steps.find((s) => s.test(value));
+    if (!step) continue;
+    if (step.overrides) return { score: step.points, reasons: [step.alert] };
+    score += step.points;
+    reasons.push(step.alert);
+  }
+
+  return { score, reasons };
+}
 
 function median(arr) {
   if (!arr || arr.length === 0) return null;
@@ -49,22 +102,9 @@ function compute_dynamic_baseline(history = [], window = 5) {
 }
 
 function validate_inputs(data) {
-  const issues = [];
-
-  if (data.heart_rate != null && !(data.heart_rate >= 30 && data.heart_rate <= 220)) {
-    issues.push('Invalid heart rate reading');
-  }
-  if (data.spo2 != null && !(data.spo2 >= 70 && data.spo2 <= 100)) {
-    issues.push('Invalid SpO2 reading');
-  }
-  if (data.temperature != null && !(data.temperature >= 34 && data.temperature <= 42)) {
-    issues.push('Invalid temperature reading');
-  }
-  if (data.pain != null && !(data.pain >= 0 && data.pain <= 10)) {
-    issues.push('Invalid pain score');
-  }
-
-  return issues;
+  return RULES.validation
+    .filter(({ field, min, max }) => data[field] != null && !(data[field] >= min && data[field] <= max))
+    .map(({ alert }) => alert);
 }
 
 function hours_since(ts) {
@@ -74,47 +114,12 @@ function hours_since(ts) {
 }
 
 function news_like_score(data) {
-  let score = 0;
-  const reasons = [];
-
-  const temp = data.temperature;
-  if (temp != null) {
-    if (temp >= 39) {
-      score += 3;
-      reasons.push('High fever (>=39)');
-    } else if (temp >= 38) {
-      score += 2;
-      reasons.push('Fever (>=38)');
-    }
-  }
-
-  const spo2 = data.spo2;
-  if (spo2 != null) {
-    if (spo2 < CONFIG.critical_spo2) {
-      return { score: 10, reasons: ['Critical hypoxia'] };
-    }
-    if (spo2 < CONFIG.low_spo2) {
-      score += 3;
-      reasons.push('Low oxygen');
-    }
-  }
-
-  const hr = data.heart_rate;
-  if (hr != null) {
-    if (hr >= 130) {
-      score += 3;
-      reasons.push('Severe tachycardia');
-    } else if (hr >= 110) {
-      score += 2;
-      reasons.push('Tachycardia');
-    }
-  }
-
-  return { score, reasons };
+  return scoreLadders(RULES.physiology, data);
 }
 
 function trend_analysis(history = [], current_data = {}) {
-  if (!history.length || history.length < 3) return { penalties: 0, reasons: [] };
+  const { min_history, fever, pain } = RULES.trend;
+  if (!history.length || history.length < min_history) return { penalties: 0, reasons: [] };
 
   let penalties = 0;
   const reasons = [];
@@ -125,24 +130,16 @@ function trend_analysis(history = [], current_data = {}) {
   const current_temp = current_data.temperature;
   const current_pain = current_data.pain;
 
-  if (temps.length >= 3 && temps.slice(-3).every((t) => t >= 38)) {
-    if (current_temp != null && current_temp >= 38) {
-      penalties += 2;
-      reasons.push('Persistent fever (active)');
-    } else {
-      penalties += 1;
-      reasons.push('Recent fever history (monitor)');
-    }
+  if (temps.length >= 3 && temps.slice(-3).every((t) => t >= fever.min)) {
+    const outcome = current_temp != null && current_temp >= fever.active.min ? fever.active : fever.otherwise;
+    penalties += outcome.points;
+    reasons.push(outcome.alert);
   }
 
   if (pains.length >= 3 && pains[pains.length - 1] > pains[pains.length - 2] && pains[pains.length - 2] > pains[pains.length - 3]) {
-    if (current_pain != null && current_pain >= 7) {
-      penalties += 2;
-      reasons.push('Pain worsening trend');
-    } else {
-      penalties += 1;
-      reasons.push('Pain trend improving but monitor');
-    }
+    const outcome = current_pain != null && current_pain >= pain.active.min ? pain.active : pain.otherwise;
+    penalties += outcome.points;
+    reasons.push(outcome.alert);
   }
 
   return { penalties, reasons };
@@ -177,74 +174,55 @@ function evaluate_patient_ultra(data, history = [], surgery_type = 'general', ba
   });
 
   const hrs = hours_since(data.timestamp);
-  if (hrs != null && hrs > CONFIG.stale_hours) {
+  const stale = hrs != null && hrs > RULES.stale_hours;
+  if (stale) {
     alerts.push('Data is stale');
   }
 
-  if (data.spo2 != null && data.spo2 < CONFIG.critical_spo2) {
-    critical = true;
-    alerts.push('CRITICAL: Oxygen dangerously low');
-  }
-
-  if (data.breathlessness === true) {
-    critical = true;
-    alerts.push('CRITICAL: Breathing difficulty');
-  }
+  RULES.critical.forEach((check) => {
+    if (data[check.field] != null && check.test(data[check.field])) {
+      critical = true;
+      alerts.push(check.alert);
+    }
+  });
 
   const phys = news_like_score(data);
   score += phys.score;
   alerts.push(...phys.reasons);
 
-  if (data.pain != null) {
-    if (data.pain >= CONFIG.extreme_pain) {
-      score += 3;
-      alerts.push('Extreme pain');
-    } else if (data.pain >= CONFIG.severe_pain) {
-      score += 2;
-      alerts.push('Severe pain');
-    }
-  }
-
-  if (data.wound_discharge) {
-    score += 3;
-    alerts.push('Possible wound infection');
-  }
-
-  if ((data.missed_doses ?? 0) >= 3) {
-    score += 2;
-    alerts.push('Multiple medication doses missed');
-  }
+  const symptoms = scoreLadders(RULES.symptoms, data);
+  score += symptoms.score;
+  alerts.push(...symptoms.reasons);
 
   const trend = trend_analysis(history, data);
   score += trend.penalties;
   alerts.push(...trend.reasons);
 
   if (baseline && data.heart_rate != null && baseline.heart_rate != null) {
-    if (data.heart_rate > baseline.heart_rate + 20) {
-      score += 1;
-      alerts.push('HR elevated from personal baseline');
+    if (data.heart_rate > baseline.heart_rate + RULES.baseline.heart_rate_margin) {
+      score += RULES.baseline.points;
+      alerts.push(RULES.baseline.alert);
     }
   }
 
-  if (surgery_type === 'cardiac' && (data.spo2 ?? 100) < 95) {
-    score += 1;
-    alerts.push('Cardiac patient oxygen caution');
+  const surgeryCheck = RULES.surgery[surgery_type];
+  if (surgeryCheck && surgeryCheck.test(data[surgeryCheck.field] ?? surgeryCheck.missing)) {
+    score += surgeryCheck.points;
+    alerts.push(surgeryCheck.alert);
   }
 
-  let risk = 'NORMAL';
-  if (critical || score >= 9) risk = 'CRITICAL';
-  else if (score >= 4) risk = 'WARNING';
+  const band = RULES.risk_bands.find((b) => score >= b.min_score) || RULES.risk_bands[RULES.risk_bands.length - 1];
+  const risk = critical ? RULES.risk_bands[0].risk : band.risk;
 
-  let confidence = 95;
-  if (!history.length || history.length < 3) confidence -= 5;
-  confidence -= missing.length * CONFIG.missing_penalty;
-  if (hrs != null && hrs > CONFIG.stale_hours) confidence -= 20;
-  if (validation_issues.length) confidence -= 25;
+  const penalties = RULES.confidence;
+  let confidence = penalties.base;
+  if (!history.length || history.length < RULES.trend.min_history) confidence -= penalties.short_history;
+  confidence -= missing.length * penalties.missing_field;
+  if (stale) confidence -= penalties.stale;
+  if (validation_issues.length) confidence -= penalties.invalid;
   confidence = Math.max(0, confidence);
 
-  let action = 'Continue routine monitoring';
-  if (risk === 'CRITICAL') action = 'Immediate medical attention required';
-  else if (risk === 'WARNING') action = 'Doctor review within 24 hours';
+  const action = RULES.recommended_actions[risk];
 
   return {
     risk,
@@ -0,0 +1,316 @@
+import heapq
+import os
+import socket
+import threading
+import time
+import uuid
+
+from firebase_admin import firestore
+
+from scoring.schema import parse_time
+
+# Alert stages after a patient's last log: "stale" once no log arrived for
+# stale_hours, then "missed" after missed_hours; a new log starts over
+STAGES = ("stale", "missed")
+# Delay before an alert that could not be written is tried again
+RETRY_SECONDS = 60
+
+
+class StaleLogMonitor:
+    """
+    Flags patients who stop logging.
+
+    Keeps patient_id -> (last log time, stage) and a min-heap of the next
+    deadline of every tracked patient, so a new log or a due alert costs
+    O(log n) and nothing ever scans the patients. A new log leaves the old
+    heap entry behind; entries that no longer match the patient's state are
+    skipped when popped, and the heap is rebuilt once they outnumber the live
+    ones. Patients are dropped after their "missed" alert until they log again.
+
+    A daemon thread sleeps until the earliest deadline and hands due alerts to
+    on_alert(patient_id, stage, last_log_at), which returns False when the
+    patient turned out to have logged since. Times are POSIX seconds.
+
+    The state comes from Firestore, not from this process: with a `source`
+    the heap is seeded from every patient's stored last log time and alerted
+    stage, and every poll_seconds the logs written since (by any process) are
+    pulled in. With a `lease` only the process holding it raises alerts; the
+    others keep polling for the lease and seed afresh when they take it over.
+    """
+
+    def __init__(self, on_alert, stale_hours=24, missed_hours=48, source=None, lease=None, poll_seconds=60, clock=time.time):
+        self.on_alert = on_alert
+        self.deadlines = (stale_hours * 3600, missed_hours * 3600)
+        self.source = source
+        self.lease = lease
+        self.poll_seconds = poll_seconds
+        self.clock = clock
+        self.raised = {stage: 0 for stage in STAGES}
+        self.skipped = 0
+        self.failed = 0
+        self.leading = False
+        self._polled_at = None
+        self._patients = {}
+        self._heap = []
+        self._stopped = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+
+    def _push(self, patient_id, last_log_at, stage, due=None):
+        if due is None:
+            due = last_log_at + self.deadlines[stage]
+        heapq.heappush(self._heap, (due, patient_id, last_log_at, stage))
+        if self._heap[0][1] == patient_id:
+            self._wake.notify()
+        if len(self._heap) > 2 * len(self._patients) + 64:
+            self._rebuild()
+
+    def _rebuild(self):
+        self._heap = [
+            (last_log_at + self.deadlines[stage], patient_id, last_log_at, stage)
+            for patient_id, (last_log_at, stage) in self._patients.items()
+        ]
+        heapq.heapify(self._heap)
+
+    def observe(self, patient_id, logged_at, stage=0):
+        """
+        Records a log (or, with `stage`, a log whose first alerts were already
+        raised); older than the last one known for the patient is ignored.
+        """
+        with self._lock:
+            current = self._patients.get(patient_id)
+            if current is not None and current[0] >= logged_at:
+                return
+            if stage >= len(STAGES):
+                self._patients.pop(patient_id, None)
+                return
+            self._patients[patient_id] = (logged_at, stage)
+            self._push(patient_id, logged_at, stage)
+
+    def seed(self, patients):
+        """Replaces the state with (patient_id, last_log_at, alerted stages) entries."""
+        with self._lock:
+            self._patients = {
+                patient_id: (last_log_at, stage)
+                for patient_id, last_log_at, stage in patients
+                if stage < len(STAGES)
+            }
+            self._rebuild()
+            self._wake.notify()
+
+    def pop_due(self, now):
+        """Alerts due at `now` as (patient_id, stage, last_log_at), advancing each patient."""
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, patient_id, last_log_at, stage = heapq.heappop(self._heap)
+                if self._patients.get(patient_id) != (last_log_at, stage):
+                    continue
+                due.append((patient_id, STAGES[stage], last_log_at))
+                if stage + 1 < len(STAGES):
+                    self._patients[patient_id] = (last_log_at, stage + 1)
+                    self._push(patient_id, last_log_at, stage + 1)
+                else:
+                    del self._patients[patient_id]
+        return due
+
+    def _retry(self, patient_id, stage, last_log_at):
+        """Puts an alert that failed back in the heap, unless the patient logged since."""
+        stage = STAGES.index(stage)
+        with self._lock:
+            current = self._patients.get(patient_id)
+            if current is not None and current[0] > last_log_at:
+                return
+            self._patients[patient_id] = (last_log_at, stage)
+            self._push(patient_id, last_log_at, stage, due=self.clock() + RETRY_SECONDS)
+
+    def fire_due(self):
+        for patient_id, stage, last_log_at in self.pop_due(self.clock()):
+            try:
+                if self.on_alert(patient_id, stage, last_log_at) is False:
+                    self.skipped += 1
+                else:
+                    self.raised[stage] += 1
+            except Exception as exc:
+                self.failed += 1
+                print(f"Stale-log alert for {patient_id} failed, retrying: {exc}")
+                self._retry(patient_id, stage, last_log_at)
+
+    def poll(self):
+        """
+        Takes or renews the lease, seeds the state on taking it and otherwise
+        pulls in the logs stored since the last poll. Returns whether this
+        process raises the alerts.
+        """
+        leading = self.lease is None or self.lease.acquire()
+        if self.source is not None and leading:
+            started = self.clock()
+            if not self.leading:
+                self.source.backfill()
+                self.seed(self.source.load())
+            else:
+                # Writers stamp updated_at with their own clocks; one poll of slack
+                for patient_id, last_log_at, stage in self.source.changed_since(self._polled_at - self.poll_seconds):
+                    self.observe(patient_id, last_log_at, stage)
+            self._polled_at = started
+        self.leading = leading
+        return leading
+
+    def _poll_safely(self):
+        try:
+            return self.poll()
+        except Exception as exc:
+            print(f"Stale-log monitor poll failed: {exc}")
+            return self.leading
+
+    def start(self):
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="stale-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.lease is not None and self.leading:
+            try:
+                self.lease.release()
+            except Exception as exc:
+                print(f"Stale-log monitor lease could not be released: {exc}")
+        self.leading = False
+
+    def _run(self):
+        self._poll_safely()
+        next_poll = self.clock() + self.poll_seconds
+        while True:
+            with self._lock:
+                if self._stopped:
+                    return
+                wait = next_poll - self.clock()
+                if self._heap and self.leading:
+                    wait = min(wait, self._heap[0][0] - self.clock())
+                if wait > 0:
+                    self._wake.wait(wait)
+                if self._stopped:
+                    return
+            if self.clock() >= next_poll:
+                self._poll_safely()
+                next_poll = self.clock() + self.poll_seconds
+            if self.leading:
+                self.fire_due()
+
+    def stats(self):
+        with self._lock:
+            tracked = len(self._patients)
+            queued = len(self._heap)
+            next_due = self._heap[0][0] if self._heap else None
+        return {
+            "leading": self.leading,
+            "tracked": tracked,
+            "queued": queued,
+            "next_due": next_due,
+            "raised": dict(self.raised),
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }
+
+
+def _patient(doc):
+    data = doc.to_dict() or {}
+    return doc.id, data.get("last_log_at"), data.get("stale_alerted") or 0
+
+
+class PatientStatsSource:
+    """
+    Monitor state read from patient_stats/{patientId}: last_log_at and
+    updated_at are written with every scored log, stale_alerted (stages
+    already raised for that log) by the alert writer.
+    """
+
+    FIELDS = ["last_log_at", "stale_alerted"]
+
+    def __init__(self, db, collection="patient_stats", logs_collection="symptom_logs", marker=("monitor_state", "stale_logs_backfill")):
+        self.db = db
+        self.collection = collection
+        self.logs_collection = logs_collection
+        self.marker = marker
+
+    def load(self):
+        query = self.db.collection(self.collection).select(self.FIELDS)
+        return [patient for patient in map(_patient, query.stream()) if patient[1] is not None]
+
+    def changed_since(self, since):
+        query = self.db.collection(self.collection).where("updated_at", ">", since).select(self.FIELDS)
+        return [patient for patient in map(_patient, query.stream()) if patient[1] is not None]
+
+    def backfill(self):
+        """
+        Once per deployment (recorded in the marker document): stores the
+        latest symptom log time as last_log_at for patients that have none,
+        i.e. patients who stopped logging before the monitor existed.
+        """
+        marker = self.db.collection(self.marker[0]).document(self.marker[1])
+        if marker.get().exists:
+            return 0
+        latest = {}
+        for doc in self.db.collection(self.logs_collection).select(["patientId", "createdAt", "timestamp"]).stream():
+            data = doc.to_dict() or {}
+            logged_at = parse_time(data.get("createdAt") or data.get("timestamp"))
+            patient_id = data.get("patientId")
+            if patient_id and logged_at is not None and logged_at > latest.get(patient_id, float("-inf")):
+                latest[patient_id] = logged_at
+
+        @firestore.transactional
+        def fill(transaction, ref, logged_at):
+            snapshot = ref.get(field_paths=["last_log_at"], transaction=transaction)
+            if snapshot.exists and (snapshot.to_dict() or {}).get("last_log_at") is not None:
+                return False
+            transaction.set(ref, {"last_log_at": logged_at}, merge=True)
+            return True
+
+        filled = sum(
+            fill(self.db.transaction(), self.db.collection(self.collection).document(patient_id), logged_at)
+            for patient_id, logged_at in latest.items()
+        )
+        marker.set({"patients": len(latest), "filled": filled, "backfilled_at": time.time()})
+        return filled
+
+
+class FirestoreLease:
+    """
+    monitor_state/{name}: names the one process that runs the monitor until
+    expires_at. acquire() takes a free or expired lease, or renews our own.
+    """
+
+    def __init__(self, db, name="stale_logs_leader", collection="monitor_state", ttl_seconds=180, clock=time.time):
+        self.db = db
+        self.ref = db.collection(collection).document(name)
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def acquire(self):
+        @firestore.transactional
+        def claim(transaction):
+            snapshot = self.ref.get(transaction=transaction)
+            data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            now = self.clock()
+            if data.get("owner") not in (None, self.owner) and data.get("expires_at", 0) > now:
+                return False
+            transaction.set(self.ref, {"owner": self.owner, "expires_at": now + self.ttl_seconds})
+            return True
+
+        return claim(self.db.transaction())
+
+    def release(self):
+        @firestore.transactional
+        def drop(transaction):
+            snapshot = self.ref.get(transaction=transaction)
+            if snapshot.exists and (snapshot.to_dict() or {}).get("owner") == self.owner:
+                transaction.delete(self.ref)
+
+        drop(self.db.transaction())
@@ -0,0 +1,67 @@
+import importlib.util
+import itertools
+from pathlib import Path
+
+import firebase_admin
+import pytest
+from firebase_admin import credentials, firestore
+
+# Cross-app dependency: the Firestore stand-in is the backend app's
+# (backend/services, put on the path by the root pyproject's pytest
+# `pythonpath`), so these tests need the backend/ tree next to WEBATHON/.
+from services.memory_firestore import MemoryFirestoreClient
+
+MAIN = Path(__file__).resolve().parents[1] / "main.py"
+
+_patient_ids = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def db():
+    """The backend's in-memory Firestore stand-in, shared by the whole session."""
+    return MemoryFirestoreClient()
+
+
+@pytest.fixture(scope="session")
+def app_main(db):
+    """
+    main.py with Firestore replaced by `db`, imported as `webathon_main`
+    (the backend's main owns the name `main`). The stale monitor is not started.
+    """
+    patches = pytest.MonkeyPatch()
+    patches.setattr(firebase_admin, "initialize_app", lambda *args, **kwargs: None)
+    patches.setattr(credentials, "ApplicationDefault", lambda: None)
+    patches.setattr(firestore, "client", lambda: db)
+    patches.setenv("STALE_MONITOR", "0")
+    spec = importlib.util.spec_from_file_location("webathon_main", MAIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    patches.undo()
+    return module
+
+
+@pytest.fixture
+def client(app_main):
+    from fastapi.testclient import TestClient
+    return TestClient(app_main.app)
+
+
+@pytest.fixture
+def patient_id():
+    return f"patient-{next(_patient_ids)}"
+
+
+@pytest.fixture
+def symptom_log(db, patient_id):
+    """symptom_log(name, **changes): stores a symptom_logs document and returns its /api/submit_log body."""
+    def build(name, **changes):
+        log_id = f"{patient_id}-{name}"
+        log = {
+            "log_id": log_id, "patientId": patient_id, "pain_score": 3, "temperature": 37.0,
+            "redness_level": "low", "swelling_level": "low", "discharge": False, "mobility_level": "ok",
+            "sleep_hours": 7, "appetite": "ok", "fatigue": "low", "mood": "ok",
+            "antibiotics_taken": True, "pain_meds_taken": True, "dressing_changed": True, **changes,
+        }
+        db.collection("symptom_logs").document(log_id).set(log)
+        return log
+    return build
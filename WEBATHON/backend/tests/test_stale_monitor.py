@@ -0,0 +1,191 @@
+"""The stale-log monitor's state machine and the Firestore state it is derived from."""
+import pytest
+
+from stale_monitor import RETRY_SECONDS, FirestoreLease, PatientStatsSource, StaleLogMonitor
+
+HOUR = 3600
+
+
+class Clock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def fired():
+    return []
+
+
+@pytest.fixture
+def monitor(clock, fired):
+    def on_alert(patient_id, stage, last_log_at):
+        fired.append((patient_id, stage, last_log_at))
+    return StaleLogMonitor(on_alert, stale_hours=24, missed_hours=48, clock=clock)
+
+
+@pytest.fixture
+def source(db, patient_id):
+    """PatientStatsSource over collections of this test only."""
+    return PatientStatsSource(
+        db,
+        collection=f"{patient_id}-stats",
+        logs_collection=f"{patient_id}-logs",
+        marker=("monitor_state", f"{patient_id}-backfill"),
+    )
+
+
+def fire_at(monitor, clock, hours):
+    clock.now = hours * HOUR
+    monitor.fire_due()
+
+
+def test_stale_then_missed_then_dropped(monitor, clock, fired):
+    monitor.observe("p", 0)
+
+    fire_at(monitor, clock, 23.9)
+    assert fired == []
+    fire_at(monitor, clock, 24)
+    assert fired == [("p", "stale", 0)]
+    fire_at(monitor, clock, 48)
+    assert fired == [("p", "stale", 0), ("p", "missed", 0)]
+    assert monitor.stats()["tracked"] == 0
+    fire_at(monitor, clock, 200)
+    assert len(fired) == 2
+
+
+def test_new_log_restarts_the_deadlines(monitor, clock, fired):
+    monitor.observe("p", 0)
+    monitor.observe("p", 10 * HOUR)
+    # Arrives late: older than the log already seen
+    monitor.observe("p", 5 * HOUR)
+
+    fire_at(monitor, clock, 33.9)
+    assert fired == []
+    fire_at(monitor, clock, 34)
+    assert fired == [("p", "stale", 10 * HOUR)]
+
+
+def test_alert_for_a_patient_who_logged_since_is_skipped(clock):
+    monitor = StaleLogMonitor(lambda *alert: False, stale_hours=24, missed_hours=48, clock=clock)
+    monitor.observe("p", 0)
+
+    fire_at(monitor, clock, 24)
+
+    assert monitor.stats()["skipped"] == 1
+    assert monitor.stats()["raised"] == {"stale": 0, "missed": 0}
+
+
+def test_failed_alert_is_retried(clock):
+    attempts = []
+
+    def on_alert(patient_id, stage, last_log_at):
+        attempts.append(stage)
+        if len(attempts) == 1:
+            raise RuntimeError("Firestore unavailable")
+
+    monitor = StaleLogMonitor(on_alert, stale_hours=24, missed_hours=48, clock=clock)
+    monitor.observe("p", 0)
+    fire_at(monitor, clock, 24)
+    clock.now += RETRY_SECONDS
+    monitor.fire_due()
+
+    assert attempts == ["stale", "stale"]
+    assert monitor.stats()["failed"] == 1
+    assert monitor.stats()["raised"]["stale"] == 1
+
+
+def test_seed_resumes_from_the_alerted_stage(monitor, clock, fired):
+    monitor.seed([("fresh", 0, 0), ("stale", 0, 1), ("done", 0, 2)])
+
+    fire_at(monitor, clock, 48)
+
+    assert sorted(fired) == [("fresh", "missed", 0), ("fresh", "stale", 0), ("stale", "missed", 0)]
+
+
+def test_lease_has_one_holder_until_it_expires(db, clock, patient_id):
+    first = FirestoreLease(db, name=f"{patient_id}-leader", ttl_seconds=10, clock=clock)
+    second = FirestoreLease(db, name=f"{patient_id}-leader", ttl_seconds=10, clock=clock)
+
+    assert first.acquire()
+    assert not second.acquire()
+    clock.now = 5
+    assert first.acquire()
+    clock.now = 16
+    assert second.acquire()
+    assert not first.acquire()
+    second.release()
+    assert first.acquire()
+
+
+def test_only_the_lease_holder_tracks_patients(db, clock, fired, source, patient_id):
+    db.collection(source.collection).document("p").set({"last_log_at": 0.0})
+
+    def start():
+        lease = FirestoreLease(db, name=f"{patient_id}-leader", clock=clock)
+        return StaleLogMonitor(lambda *alert: fired.append(alert), source=source, lease=lease, clock=clock)
+
+    leader, follower = start(), start()
+
+    assert leader.poll()
+    assert not follower.poll()
+    assert leader.stats()["leading"] and not follower.stats()["leading"]
+    assert (leader.stats()["tracked"], follower.stats()["tracked"]) == (1, 0)
+
+
+def test_backfill_adds_patients_who_stopped_logging_before_the_monitor(db, source):
+    logs = db.collection(source.logs_collection)
+    logs.document("a").set({"patientId": "legacy", "createdAt": "2026-10-01T08:00:00+00:00"})
+    logs.document("b").set({"patientId": "legacy", "createdAt": "2026-10-02T08:00:00+00:00"})
+    db.collection(source.collection).document("current").set({"last_log_at": 5.0})
+
+    assert source.backfill() == 1
+    assert source.backfill() == 0
+    assert sorted(source.load()) == [("current", 5.0, 0), ("legacy", 1790928000.0, 0)]
+
+
+def test_new_leader_seeds_from_patient_stats(db, clock, fired, source):
+    db.collection(source.collection).document("p").set({"last_log_at": 0.0, "stale_alerted": 1})
+    monitor = StaleLogMonitor(lambda *alert: fired.append(alert), source=source, clock=clock)
+
+    monitor.poll()
+    fire_at(monitor, clock, 48)
+
+    assert fired == [("p", "missed", 0.0)]
+
+
+def test_logs_stored_by_other_processes_are_polled(db, clock, fired, source):
+    stats = db.collection(source.collection).document("p")
+    stats.set({"last_log_at": 0.0, "updated_at": 0.0})
+    monitor = StaleLogMonitor(lambda *alert: fired.append(alert), source=source, poll_seconds=60, clock=clock)
+    monitor.poll()
+
+    clock.now = 20 * HOUR
+    stats.set({"last_log_at": 20 * HOUR, "stale_alerted": 0, "updated_at": clock.now})
+    monitor.poll()
+    fire_at(monitor, clock, 30)
+
+    assert fired == []
+    fire_at(monitor, clock, 44)
+    assert fired == [("p", "stale", 20 * HOUR)]
+
+
+def test_stale_alert_is_written_once_and_recorded(app_main, client, db, patient_id, symptom_log):
+    client.post("/api/submit_log", json=symptom_log("L1"))
+    stats = db.collection("patient_stats").document(patient_id)
+    last_log_at = stats.get().to_dict()["last_log_at"]
+
+    assert app_main.raise_stale_alert(patient_id, "stale", last_log_at)
+    assert app_main.raise_stale_alert(patient_id, "stale", last_log_at)
+    assert not app_main.raise_stale_alert(patient_id, "stale", last_log_at - HOUR)
+
+    alerts = [doc.to_dict() for doc in db.collection("alerts").stream() if doc.to_dict()["patientId"] == patient_id]
+    assert [alert["type"] for alert in alerts] == ["STALE_DATA"]
+    assert stats.get().to_dict()["stale_alerted"] == 1
@@ -0,0 +1,47 @@
+"""Idempotent /api/submit_log and the patient_stats it keeps."""
+import threading
+
+from idempotency import create_response_cache
+
+
+def stats(db, patient_id):
+    return db.collection("patient_stats").document(patient_id).get().to_dict()
+
+
+def test_repeated_log_id_is_counted_once(client, db, patient_id, symptom_log):
+    log = symptom_log("L1", pain_score=8, temperature=38.9)
+    first = client.post("/api/submit_log", json=log)
+    repeat = client.post("/api/submit_log", json=log)
+
+    assert first.status_code == repeat.status_code == 200
+    assert repeat.json() == first.json()
+    assert stats(db, patient_id)["count"] == 1
+
+
+def test_repeat_after_restart_returns_stored_response(app_main, client, db, patient_id, symptom_log, monkeypatch):
+    log = symptom_log("L1", pain_score=8, temperature=38.9)
+    first = client.post("/api/submit_log", json=log).json()
+
+    # A new instance remembers nothing; patient_stats answers the retry
+    monkeypatch.setattr(app_main, "submitted_logs", create_response_cache())
+    repeat = client.post("/api/submit_log", json=log).json()
+
+    assert repeat == first
+    assert stats(db, patient_id)["count"] == 1
+
+
+def test_logs_submitted_together_are_all_counted(client, db, patient_id, symptom_log):
+    logs = [symptom_log(f"L{index}", pain_score=index) for index in range(4)]
+    codes = []
+    threads = [
+        threading.Thread(target=lambda log=log: codes.append(client.post("/api/submit_log", json=log).status_code))
+        for log in logs
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert codes == [200] * 4
+    assert stats(db, patient_id)["count"] == 4
+    assert len(stats(db, patient_id)["recent_results"]) == 4
@@ -0,0 +1,337 @@
+"""
+Cohort analytics over exported logs.
+
+Run from the backend directory:
+
+    python -m analytics.cohort --input exports/*.ndjson --patients patients.ndjson \
+        --partitions 16 --processes 4 --output cohort.json
+
+or over the compacted archive (python -m archive.compact):
+
+    python -m analytics.cohort --archive log_archive --collection daily_logs
+
+Inputs are read in chunks of --chunk-rows lines and spilled to columnar
+partition files by patient hash, so each partition holds whole patient
+histories and memory use is bounded by the largest partition, not the
+export. Partitions are aggregated independently (in --processes worker
+processes) into additive partial sums that are merged at the end.
+
+Reported per surgery type: fever incidence (patients and logs at or above
+FEVER_TEMPERATURE), mean pain slope over each patient's history and mean
+dynamic baseline; and per day post-op: the mean trailing pain slope
+TrendAnalyzer would have seen that day. Surgery type and date come from the
+log itself or from --patients (one patients document per line with an "id").
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import tempfile
+import zlib
+from collections import defaultdict
+from multiprocessing import Pool
+
+import numpy as np
+
+from analytics.groupby import dynamic_baselines, group_codes, group_slopes, rolling_slopes, sort_rows
+from archive.blocks import LogArchive, decode_value, to_datetime64
+from services.trend_analyzer import TREND_WINDOW
+
+FEVER_TEMPERATURE = 38.0
+NUMERIC_FIELDS = ("pain_score", "temperature", "spo2", "heart_rate")
+BASELINE_FIELDS = ("heart_rate", "temperature", "spo2")
+
+# daily_logs field names first, then the web app's symptom_logs spellings
+PATIENT_FIELDS = ("patient_id", "patientId")
+TIME_FIELDS = ("timestamp", "createdAt", "createdAtClient")
+UNKNOWN_SURGERY = "Unknown"
+
+
+def _first(record, names):
+    for name in names:
+        value = record.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+def _time(value):
+    """Log time as datetime64[ms]: ISO strings, datetimes or epoch seconds/milliseconds."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return np.datetime64(int(value if value > 1e11 else value * 1000), "ms")
+    return to_datetime64(value)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def columns_from_records(records, patients):
+    """Columnar arrays (see NUMERIC_FIELDS) for exported log documents."""
+    rows = []
+    for record in records:
+        patient_id = _first(record, PATIENT_FIELDS)
+        when = _time(_first(record, TIME_FIELDS))
+        if patient_id is None or np.isnat(when):
+            continue
+        info = patients.get(patient_id, {})
+        surgery_date = record.get("surgery_date") or info.get("surgery_date")
+        rows.append((
+            str(patient_id), when,
+            record.get("surgery_type") or info.get("surgery_type") or UNKNOWN_SURGERY,
+            _time(surgery_date) if surgery_date else np.datetime64("NaT", "ms"),
+            *(_number(record.get(field)) for field in NUMERIC_FIELDS),
+        ))
+    columns = {
+        "patient_id": np.array([row[0] for row in rows], dtype=str),
+        "time": np.array([row[1] for row in rows], dtype="datetime64[ms]"),
+        "surgery_type": np.array([row[2] for row in rows], dtype=str),
+        "surgery_date": np.array([row[3] for row in rows], dtype="datetime64[ms]"),
+    }
+    for index, field in enumerate(NUMERIC_FIELDS):
+        columns[field] = np.array([row[4 + index] for row in rows], dtype=float)
+    return columns
+
+
+def read_chunks(paths, chunk_rows, patients):
+    """Yields columnar chunks of at most `chunk_rows` logs from NDJSON files."""
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                records.append(json.loads(line))
+                if len(records) == chunk_rows:
+                    yield columns_from_records(records, patients)
+                    records = []
+    if records:
+        yield columns_from_records(records, patients)
+
+
+def _partition_of(patient_ids, partitions):
+    uniques, inverse = np.unique(patient_ids, return_inverse=True)
+    buckets = np.array([zlib.crc32(value.encode("utf-8")) % partitions for value in uniques.tolist()], dtype=np.int64)
+    return buckets[inverse.reshape(-1)]
+
+
+def spill_partitions(chunks, workdir, partitions):
+    """Writes every chunk's rows to .npz files per patient-hash partition. Returns partition file lists."""
+    files = defaultdict(list)
+    for number, chunk in enumerate(chunks):
+        if not len(chunk["patient_id"]):
+            continue
+        bucket = _partition_of(chunk["patient_id"], partitions)
+        for partition in np.unique(bucket).tolist():
+            rows = bucket == partition
+            path = os.path.join(workdir, f"part-{partition:04d}-{number:06d}.npz")
+            np.savez(path, **{name: column[rows] for name, column in chunk.items()})
+            files[partition].append(path)
+    return [files[partition] for partition in sorted(files)]
+
+
+def load_partition(paths):
+    parts = []
+    for path in paths:
+        with np.load(path, allow_pickle=False) as data:
+            parts.append({name: data[name] for name in data.files})
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def _archive_columns(archive_dir, collection, patient_ids, patients):
+    """Columns for some patients read from the compacted archive."""
+    archive = LogArchive(archive_dir)
+    records = []
+    for patient_id in patient_ids:
+        columns, kinds = archive.read(collection, patient_id, list(NUMERIC_FIELDS) + ["surgery_type", "surgery_date"])
+        if not columns:
+            continue
+        time_field = next(iter(columns))
+        names = list(columns)
+        for index in range(len(columns[time_field])):
+            record = {name: decode_value(kinds[name], columns[name][index]) for name in names}
+            record["patient_id"] = patient_id
+            record["timestamp"] = record.pop(time_field)
+            records.append(record)
+    return columns_from_records(records, patients)
+
+
+def aggregate(columns, max_day=90):
+    """Additive partial aggregates for one partition (whole patient histories)."""
+    result = {"by_surgery": {}, "by_day": {}}
+    if not len(columns["patient_id"]):
+        return result
+
+    codes, _ = group_codes(columns["patient_id"])
+    order = sort_rows(codes, columns["time"])
+    columns = {name: column[order] for name, column in columns.items()}
+    codes, patient_ids = group_codes(columns["patient_id"])
+    n_patients = len(patient_ids)
+
+    # Per-patient values, then summed per surgery type
+    first_row = np.unique(codes, return_index=True)[1]
+    surgery = columns["surgery_type"][first_row]
+    temperature = columns["temperature"]
+    febrile_logs = np.bincount(codes, temperature >= FEVER_TEMPERATURE, n_patients)
+    slopes = group_slopes(codes, columns["pain_score"], n_patients)
+    baselines = dynamic_baselines(codes, columns, n_patients)
+
+    for surgery_type in np.unique(surgery).tolist():
+        patients = surgery == surgery_type
+        entry = {
+            "patients": int(patients.sum()),
+            "febrile_patients": int((febrile_logs[patients] > 0).sum()),
+            "logs": int(np.bincount(codes, minlength=n_patients)[patients].sum()),
+            "febrile_logs": int(febrile_logs[patients].sum()),
+            "pain_slope_sum": float(slopes[patients].sum()),
+        }
+        for field in BASELINE_FIELDS:
+            values = baselines[field][patients]
+            known = ~np.isnan(values)
+            entry[f"baseline_{field}_sum"] = float(values[known].sum())
+            entry[f"baseline_{field}_count"] = int(known.sum())
+        result["by_surgery"][surgery_type] = entry
+
+    # Trailing pain slope per log, bucketed by day post-op
+    days = (columns["time"] - columns["surgery_date"]).astype("timedelta64[D]").astype(float)
+    days[np.isnat(columns["surgery_date"])] = np.nan
+    trailing = rolling_slopes(codes, columns["pain_score"], n_patients, TREND_WINDOW)
+    valid = ~np.isnan(days) & (days >= 0) & (days <= max_day)
+    day = days[valid].astype(np.int64)
+    sums = np.bincount(day, trailing[valid], max_day + 1)
+    counts = np.bincount(day, minlength=max_day + 1)
+    result["by_day"] = {
+        int(d): {"pain_slope_sum": float(sums[d]), "logs": int(counts[d])}
+        for d in np.nonzero(counts)[0]
+    }
+    return result
+
+
+def merge(partials):
+    merged = {"by_surgery": defaultdict(lambda: defaultdict(float)), "by_day": defaultdict(lambda: defaultdict(float))}
+    for partial in partials:
+        for section in ("by_surgery", "by_day"):
+            for key, values in partial[section].items():
+                for name, value in values.items():
+                    merged[section][key][name] += value
+    return merged
+
+
+def finalize(merged):
+    """Ratios and means from merged sums."""
+    def ratio(numerator, denominator):
+        return round(numerator / denominator, 4) if denominator else None
+
+    by_surgery = {}
+    for surgery_type, sums in sorted(merged["by_surgery"].items()):
+        by_surgery[surgery_type] = {
+            "patients": int(sums["patients"]),
+            "logs": int(sums["logs"]),
+            "fever_incidence": ratio(sums["febrile_patients"], sums["patients"]),
+            "febrile_log_rate": ratio(sums["febrile_logs"], sums["logs"]),
+            "mean_pain_slope": ratio(sums["pain_slope_sum"], sums["patients"]),
+            "mean_baseline": {
+                field: ratio(sums[f"baseline_{field}_sum"], sums[f"baseline_{field}_count"])
+                for field in BASELINE_FIELDS
+            },
+        }
+    by_day = {
+        day: {"logs": int(sums["logs"]), "mean_pain_slope": ratio(sums["pain_slope_sum"], sums["logs"])}
+        for day, sums in sorted(merged["by_day"].items())
+    }
+    return {"by_surgery_type": by_surgery, "pain_slope_by_day_post_op": by_day}
+
+
+# Worker state for multiprocessing (set once per process by the initializer)
+_worker = {}
+
+
+def _init_worker(patients, max_day, archive_dir, collection):
+    _worker.update(patients=patients, max_day=max_day, archive_dir=archive_dir, collection=collection)
+
+
+def _aggregate_files(paths):
+    return aggregate(load_partition(paths), _worker["max_day"])
+
+
+def _aggregate_archive(patient_ids):
+    columns = _archive_columns(_worker["archive_dir"], _worker["collection"], patient_ids, _worker["patients"])
+    return aggregate(columns, _worker["max_day"])
+
+
+def run(inputs=None, archive_dir=None, collection="daily_logs", patients=None,
+        partitions=16, processes=1, chunk_rows=100000, max_day=90):
+    """Cohort report from NDJSON exports (`inputs`) or the compacted archive (`archive_dir`)."""
+    patients = patients or {}
+    init_args = (patients, max_day, archive_dir, collection)
+    with tempfile.TemporaryDirectory(prefix="cohort-") as workdir:
+        if archive_dir:
+            patient_ids = LogArchive(archive_dir).patients(collection)
+            tasks = [patient_ids[i::partitions] for i in range(partitions)]
+            work = _aggregate_archive
+        else:
+            tasks = spill_partitions(read_chunks(inputs, chunk_rows, patients), workdir, partitions)
+            work = _aggregate_files
+
+        if processes > 1:
+            with Pool(processes, initializer=_init_worker, initargs=init_args) as pool:
+                partials = list(pool.imap_unordered(work, tasks))
+        else:
+            _init_worker(*init_args)
+            partials = [work(task) for task in tasks]
+    return finalize(merge(partials))
+
+
+def read_patients(path):
+    patients = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                patient_id = record.get("id") or record.get("patient_id")
+                if patient_id:
+                    patients[patient_id] = record
+    return patients
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Post-Op Guardian cohort analytics")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", nargs="+", help="NDJSON log exports (globs allowed)")
+    source.add_argument("--archive", help="compacted log archive directory")
+    parser.add_argument("--collection", default="daily_logs", help="archive collection to read")
+    parser.add_argument("--patients", help="NDJSON patients export with surgery_type/surgery_date")
+    parser.add_argument("--partitions", type=int, default=16, help="patient-hash partitions")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-rows", type=int, default=100000, help="logs read per chunk")
+    parser.add_argument("--max-day", type=int, default=90, help="last day post-op reported")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    inputs = [path for pattern in args.input or [] for path in sorted(glob.glob(pattern))]
+    if args.input and not inputs:
+        print(f"No input files match {args.input}", file=sys.stderr)
+        return 1
+
+    report = run(
+        inputs=inputs, archive_dir=args.archive, collection=args.collection,
+        patients=read_patients(args.patients) if args.patients else None,
+        partitions=args.partitions, processes=args.processes,
+        chunk_rows=args.chunk_rows, max_day=args.max_day,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Group-by forms of the per-patient trend helpers.
+
+Rows are logs from many patients, sorted by (group code, time) as returned by
+sort_rows(). Each function answers for every group at once what the scalar
+helper answers for one patient:
+
+    group_slopes        services.trend_analyzer.calculate_trend_slope over
+                        each group's full history
+    rolling_slopes      calculate_trend_slope over the trailing `window` logs
+                        ending at each row (what TrendAnalyzer sees that day)
+    dynamic_baselines   scoring.vitals.compute_dynamic_baseline at the
+                        end of each group's history
+
+Missing values count as 0 in slopes, as in calculate_trend_slope_batch.
+"""
+import numpy as np
+
+# compute_dynamic_baseline treats a day as stable below this temperature and at/above this SpO2
+STABLE_MAX_TEMPERATURE = 38
+STABLE_MIN_SPO2 = 94
+
+
+def group_codes(keys):
+    """Dense integer codes (0..n_groups-1) and the unique keys."""
+    uniques, codes = np.unique(np.asarray(keys), return_inverse=True)
+    return codes.reshape(-1), uniques
+
+
+def sort_rows(codes, times):
+    """Row order grouping the codes together, oldest first within each group."""
+    return np.lexsort((times, codes))
+
+
+def _bounds(codes, n_groups):
+    """Start offset of each group in sorted rows, and each row's position within its group."""
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    position = np.arange(len(codes)) - starts[codes]
+    return counts, starts, position
+
+
+def group_slopes(codes, values, n_groups):
+    """Least-squares slope of each group's values against 0..n-1 (0 for fewer than 2 logs)."""
+    y = np.nan_to_num(np.asarray(values, dtype=float))
+    counts, _, x = _bounds(codes, n_groups)
+    x = x.astype(float)
+
+    n = counts.astype(float)
+    sum_x = np.bincount(codes, x, n_groups)
+    sum_y = np.bincount(codes, y, n_groups)
+    sum_xy = np.bincount(codes, x * y, n_groups)
+    sum_xx = np.bincount(codes, x * x, n_groups)
+
+    denominator = n * sum_xx - sum_x * sum_x
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slopes = (n * sum_xy - sum_x * sum_y) / denominator
+    return np.where(counts >= 2, slopes, 0.0)
+
+
+def rolling_slopes(codes, values, n_groups, window):
+    """Slope over the last `window` logs (fewer at the start of a group) ending at each row."""
+    y = np.nan_to_num(np.asarray(values, dtype=float))
+    _, starts, position = _bounds(codes, n_groups)
+    index = np.arange(len(y), dtype=float)
+
+    # Prefix sums over all rows; a window is a difference of two prefixes
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    cum_iy = np.concatenate(([0.0], np.cumsum(index * y)))
+
+    m = np.minimum(position + 1, window)
+    end = np.arange(len(y)) + 1
+    begin = end - m
+    s_y = cum_y[end] - cum_y[begin]
+    # x runs 0..m-1 from the window's first row
+    s_xy = (cum_iy[end] - cum_iy[begin]) - begin * s_y
+
+    m = m.astype(float)
+    s_x = m * (m - 1) / 2
+    s_xx = (m - 1) * m * (2 * m - 1) / 6
+    denominator = m * s_xx - s_x * s_x
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slopes = (m * s_xy - s_x * s_y) / denominator
+    return np.where(m >= 2, slopes, 0.0)
+
+
+def group_medians(codes, values, mask, n_groups):
+    """Median of values[mask] per group, ignoring NaN (NaN for empty groups)."""
+    values = np.asarray(values, dtype=float)
+    use = mask & ~np.isnan(values)
+    group = codes[use]
+    ordered = np.lexsort((values[use], group))
+    group, sorted_values = group[ordered], values[use][ordered]
+
+    counts = np.bincount(group, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(n_groups, np.nan)
+    has = counts > 0
+    lower = starts[has] + (counts[has] - 1) // 2
+    upper = starts[has] + counts[has] // 2
+    medians[has] = (sorted_values[lower] + sorted_values[upper]) / 2
+    return medians
+
+
+def dynamic_baselines(codes, columns, n_groups, window=5):
+    """
+    Median heart_rate/temperature/spo2 of the stable logs among each group's
+    last `window` (all of those logs when none is stable). NaN where a group
+    has no value.
+    """
+    counts, _, position = _bounds(codes, n_groups)
+    in_window = position >= counts[codes] - window
+
+    temperature = columns.get("temperature")
+    spo2 = columns.get("spo2")
+    stable = in_window.copy()
+    if temperature is not None:
+        stable &= np.isnan(temperature) | (temperature < STABLE_MAX_TEMPERATURE)
+    if spo2 is not None:
+        stable &= np.isnan(spo2) | (spo2 >= STABLE_MIN_SPO2)
+    any_stable = np.bincount(codes, stable, n_groups) > 0
+    use = np.where(any_stable[codes], stable, in_window)
+
+    return {
+        field: group_medians(codes, columns[field], use, n_groups)
+        if columns.get(field) is not None else np.full(n_groups, np.nan)
+        for field in ("heart_rate", "temperature", "spo2")
+    }
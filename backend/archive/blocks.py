@@ -0,0 +1,311 @@
+"""
+Columnar archive of compacted log documents.
+
+Layout, one block per patient and ISO week:
+
+    <root>/<collection>/<patient_id>/<YYYY-Www>/block.json
+    <root>/<collection>/<patient_id>/<YYYY-Www>/<column>.npy
+
+Rows are sorted by the collection's time column. Each column is a plain .npy
+file, so readers memory-map only the columns they need and slicing a block
+by time returns views into the mapped files (no copy). Column kinds:
+
+    time    datetime64[ms], UTC (NaT when missing)
+    number  float64 (NaN when missing)
+    flag    int8: 1, 0, or -1 when missing
+    text    fixed-width unicode ("" when missing); other values are stored as JSON
+
+`_id` holds the source document ids.
+"""
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+DEFAULT_ARCHIVE_DIR = Path(__file__).resolve().parent.parent / "log_archive"
+
+MISSING_FLAG = -1
+
+
+def archive_dir():
+    return Path(os.getenv("LOG_ARCHIVE_DIR", str(DEFAULT_ARCHIVE_DIR)))
+
+
+def to_datetime64(value):
+    """datetime or ISO string -> numpy datetime64[ms] in UTC (NaT if unparseable)."""
+    if isinstance(value, np.datetime64):
+        return value.astype("datetime64[ms]")
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return np.datetime64("NaT", "ms")
+    if not isinstance(value, datetime):
+        return np.datetime64("NaT", "ms")
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(value, "ms")
+
+
+def week_key(value):
+    """ISO week ("2024-W07") of a datetime64 value."""
+    year, week, _ = value.astype("datetime64[ms]").astype(datetime).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _kind(values):
+    present = [value for value in values if value is not None]
+    if not present:
+        return None
+    if all(isinstance(value, bool) for value in present):
+        return "flag"
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+        return "number"
+    if all(isinstance(value, datetime) for value in present):
+        return "time"
+    return "text"
+
+
+def _text(value):
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else json.dumps(value, default=str)
+
+
+def encode_column(kind, values):
+    if kind == "time":
+        return np.array([to_datetime64(value) for value in values], dtype="datetime64[ms]")
+    if kind == "number":
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    if kind == "flag":
+        return np.array([MISSING_FLAG if value is None else bool(value) for value in values], dtype=np.int8)
+    return np.array([_text(value) for value in values], dtype=str)
+
+
+def decode_value(kind, value):
+    """One stored element back to a JSON-friendly Python value."""
+    if kind == "time":
+        return None if np.isnat(value) else str(value.astype("datetime64[ms]")) + "Z"
+    if kind == "number":
+        return None if np.isnan(value) else float(value)
+    if kind == "flag":
+        return None if value == MISSING_FLAG else bool(value)
+    return str(value)
+
+
+class Block:
+    """One compacted week of one patient's logs, memory-mapped on access."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "block.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.columns = self.meta["columns"]
+        self._mapped = {}
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    @property
+    def start(self):
+        return np.datetime64(self.meta["start"], "ms")
+
+    @property
+    def end(self):
+        return np.datetime64(self.meta["end"], "ms")
+
+    def column(self, name):
+        """Memory-mapped column (read-only)."""
+        if name not in self._mapped:
+            self._mapped[name] = np.load(self.path / f"{name}.npy", mmap_mode="r")
+        return self._mapped[name]
+
+    def rows(self, since=None, until=None):
+        """Slice of the rows with since <= time < until (the time column is sorted)."""
+        times = self.column(self.meta["time_field"])
+        lo = 0 if since is None else int(np.searchsorted(times, since, side="left"))
+        hi = len(times) if until is None else int(np.searchsorted(times, until, side="left"))
+        return slice(lo, hi)
+
+    def load(self):
+        """All columns read into memory (used when rewriting the block)."""
+        return {name: np.load(self.path / f"{name}.npy") for name in self.columns}
+
+
+def _missing_column(kind, count):
+    if kind == "text":
+        return np.full(count, "")
+    return np.full(count, _missing(kind), dtype=_dtype(kind))
+
+
+def _as_text(kind, column):
+    if kind == "text":
+        return column
+    return np.array([_text(decode_value(kind, value)) for value in column], dtype=str)
+
+
+def merge_rows(block, time_field, docs):
+    """
+    Columns and kinds of `block` (or None) plus the raw documents `docs`
+    ({"_id": ..., field: value}). A document id already in the block replaces
+    the stored row; rows end up sorted by time. A field whose kind differs
+    between old and new rows is stored as text.
+    """
+    names = list(dict.fromkeys(name for doc in docs for name in doc))
+    new_kinds = {name: _kind([doc.get(name) for doc in docs]) for name in names}
+    if time_field in new_kinds:
+        new_kinds[time_field] = "time"
+    new_kinds["_id"] = "text"
+
+    old_columns = block.load() if block is not None else {}
+    old_kinds = dict(block.columns) if block is not None else {}
+    old_rows = len(block) if block is not None else 0
+
+    kinds = dict(old_kinds)
+    for name, kind in new_kinds.items():
+        if kind is None:
+            continue
+        if name in kinds and kinds[name] != kind:
+            kinds[name] = "text"
+        else:
+            kinds.setdefault(name, kind)
+
+    columns = {}
+    for name, kind in kinds.items():
+        if name in old_columns:
+            old = old_columns[name] if old_kinds[name] == kind else _as_text(old_kinds[name], old_columns[name])
+        else:
+            old = _missing_column(kind, old_rows)
+        new = encode_column(kind, [doc.get(name) for doc in docs])
+        columns[name] = np.concatenate([old, new]) if old_rows else new
+
+    # Newest copy of each document wins, then order by time
+    ids = columns["_id"]
+    _, last = np.unique(ids[::-1], return_index=True)
+    keep = np.sort(len(ids) - 1 - last)
+    keep = keep[np.argsort(columns[time_field][keep], kind="stable")]
+    return {name: column[keep] for name, column in columns.items()}, kinds
+
+
+def write_block(path, time_field, columns, kinds):
+    """
+    Writes a block, replacing any previous version of it. The new block is
+    complete on disk before it is swapped in.
+    """
+    path = Path(path)
+    staging = path.with_name(path.name + ".tmp")
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir(parents=True)
+
+    for name, column in columns.items():
+        np.save(staging / f"{name}.npy", column, allow_pickle=False)
+
+    times = columns[time_field]
+    meta = {
+        "time_field": time_field,
+        "rows": len(times),
+        "start": str(times[0]),
+        "end": str(times[-1]),
+        "columns": kinds,
+    }
+    with open(staging / "block.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    previous = path.with_name(path.name + ".old")
+    if path.exists():
+        os.replace(path, previous)
+    os.replace(staging, path)
+    if previous.exists():
+        shutil.rmtree(previous)
+
+
+def _dtype(kind):
+    return {"time": "datetime64[ms]", "number": np.float64, "flag": np.int8}[kind]
+
+
+def _missing(kind):
+    return {"time": np.datetime64("NaT", "ms"), "number": np.nan, "flag": MISSING_FLAG}[kind]
+
+
+class LogArchive:
+    """Reader (and block locator for the compaction job) over an archive directory."""
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root is not None else archive_dir()
+
+    def patient_dir(self, collection, patient_id):
+        return self.root / collection / quote(patient_id, safe="")
+
+    def block_path(self, collection, patient_id, week):
+        return self.patient_dir(collection, patient_id) / week
+
+    def patients(self, collection):
+        directory = self.root / collection
+        if not directory.exists():
+            return []
+        return sorted(unquote(path.name) for path in directory.iterdir() if path.is_dir())
+
+    def blocks(self, collection, patient_id, since=None, until=None):
+        """Blocks overlapping [since, until), oldest first."""
+        since = None if since is None else to_datetime64(since)
+        until = None if until is None else to_datetime64(until)
+        directory = self.patient_dir(collection, patient_id)
+        if not directory.exists():
+            return []
+        blocks = []
+        for path in sorted(directory.iterdir()):
+            if not (path / "block.json").exists() or path.suffix in (".tmp", ".old"):
+                continue
+            block = Block(path)
+            if since is not None and block.end < since:
+                continue
+            if until is not None and block.start >= until:
+                continue
+            blocks.append(block)
+        return blocks
+
+    def read(self, collection, patient_id, fields, since=None, until=None):
+        """
+        Columns `fields` (plus the time column) for [since, until), oldest first.
+        A range inside one block comes back as views of the mapped files; ranges
+        spanning several blocks are concatenated. Fields absent from a block are
+        filled with missing values.
+        """
+        since = None if since is None else to_datetime64(since)
+        until = None if until is None else to_datetime64(until)
+        blocks = self.blocks(collection, patient_id, since, until)
+        if not blocks:
+            return {}, {}
+
+        time_field = blocks[0].meta["time_field"]
+        names = [time_field] + [field for field in fields if field != time_field]
+        kinds = {}
+        for block in blocks:
+            for name in names:
+                kind = block.columns.get(name)
+                if kind is None:
+                    continue
+                # A field stored with different kinds in different weeks is read as text
+                kinds[name] = kind if kinds.get(name, kind) == kind else "text"
+
+        parts = {name: [] for name in kinds}
+        for block in blocks:
+            rows = block.rows(since, until)
+            for name, kind in kinds.items():
+                if name not in block.columns:
+                    parts[name].append(_missing_column(kind, rows.stop - rows.start))
+                elif block.columns[name] != kind:
+                    parts[name].append(_as_text(block.columns[name], block.column(name)[rows]))
+                else:
+                    parts[name].append(block.column(name)[rows])
+
+        columns = {
+            name: arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+            for name, arrays in parts.items()
+        }
+        return columns, kinds
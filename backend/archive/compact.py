@@ -0,0 +1,143 @@
+"""
+Rolls old log documents out of Firestore into the columnar archive.
+
+Run from the backend directory:
+
+    python -m archive.compact --collection daily_logs --older-than-days 28
+
+Logs older than the cutoff are merged into per-patient, per-week blocks (see
+archive.blocks) and then deleted from Firestore. The newest --keep-recent logs
+of every patient always stay in Firestore, so the request path (history reads,
+trend bootstrap) never needs the archive. Re-running is safe: blocks are
+merged by document id and a log is only deleted after its block is on disk.
+"""
+import argparse
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from archive.blocks import Block, LogArchive, merge_rows, to_datetime64, week_key, write_block
+from services.firebase_service import _firestore, get_db
+
+# Patient and time fields per collection; daily_logs stores ISO strings,
+# symptom_logs (written by the web app) Firestore timestamps
+COLLECTIONS = {
+    "daily_logs": {"patient_field": "patient_id", "time_field": "timestamp", "iso_time": True},
+    "symptom_logs": {"patient_field": "patientId", "time_field": "createdAt", "iso_time": False},
+}
+
+MAX_BATCH_OPS = 500
+
+
+class Compactor:
+    def __init__(self, db, archive, collection, keep_recent=10, page_size=2000, delete=True):
+        config = COLLECTIONS[collection]
+        self.db = db
+        self.archive = archive
+        self.collection = collection
+        self.patient_field = config["patient_field"]
+        self.time_field = config["time_field"]
+        self.iso_time = config["iso_time"]
+        self.keep_recent = keep_recent
+        self.page_size = page_size
+        self.delete = delete
+        self._recent = {}
+
+    def _cutoff_value(self, cutoff):
+        return cutoff.replace(tzinfo=None).isoformat() if self.iso_time else cutoff
+
+    def _recent_ids(self, patient_id):
+        """Ids of the patient's newest logs, which stay in Firestore."""
+        if patient_id not in self._recent:
+            docs = self.db.collection(self.collection)\
+                .where(self.patient_field, "==", patient_id)\
+                .order_by(self.time_field, direction=_firestore().Query.DESCENDING)\
+                .limit(self.keep_recent)\
+                .select([self.time_field])\
+                .stream()
+            self._recent[patient_id] = {doc.id for doc in docs}
+        return self._recent[patient_id]
+
+    def run(self, cutoff):
+        """Compacts every log older than `cutoff` (aware datetime). Returns counters."""
+        totals = defaultdict(int)
+        query = self.db.collection(self.collection)\
+            .where(self.time_field, "<", self._cutoff_value(cutoff))\
+            .order_by(self.time_field)\
+            .limit(self.page_size)
+
+        last = None
+        while True:
+            page = list((query.start_after(last) if last is not None else query).stream())
+            if not page:
+                break
+            last = page[-1]
+            for name, count in self.compact_page(page).items():
+                totals[name] += count
+            if len(page) < self.page_size:
+                break
+        return dict(totals)
+
+    def compact_page(self, docs):
+        counts = defaultdict(int)
+        groups = defaultdict(list)
+        for doc in docs:
+            data = doc.to_dict()
+            patient_id = data.get(self.patient_field)
+            when = to_datetime64(data.get(self.time_field))
+            if not patient_id or str(when) == "NaT":
+                counts["skipped"] += 1
+                continue
+            if doc.id in self._recent_ids(patient_id):
+                counts["kept_recent"] += 1
+                continue
+            groups[(patient_id, week_key(when))].append({"_id": doc.id, **data})
+
+        archived = []
+        for (patient_id, week), rows in groups.items():
+            path = self.archive.block_path(self.collection, patient_id, week)
+            existing = Block(path) if (path / "block.json").exists() else None
+            columns, kinds = merge_rows(existing, self.time_field, rows)
+            write_block(path, self.time_field, columns, kinds)
+            archived.extend(row["_id"] for row in rows)
+            counts["blocks_written"] += 1
+        counts["archived"] += len(archived)
+
+        if self.delete and archived:
+            collection = self.db.collection(self.collection)
+            for start in range(0, len(archived), MAX_BATCH_OPS):
+                batch = self.db.batch()
+                for doc_id in archived[start:start + MAX_BATCH_OPS]:
+                    batch.delete(collection.document(doc_id))
+                batch.commit()
+            counts["deleted"] += len(archived)
+        return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact old Post-Op Guardian logs into the columnar archive")
+    parser.add_argument("--collection", choices=sorted(COLLECTIONS), default="daily_logs")
+    parser.add_argument("--older-than-days", type=float, default=28, help="archive logs older than this")
+    parser.add_argument("--keep-recent", type=int, default=10, help="newest logs per patient that always stay in Firestore")
+    parser.add_argument("--page-size", type=int, default=2000)
+    parser.add_argument("--archive-dir", help="archive root (default LOG_ARCHIVE_DIR or backend/log_archive)")
+    parser.add_argument("--keep-source", action="store_true", help="write blocks but leave the documents in Firestore")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    if db is None:
+        print("No Firestore client available (missing credentials?)", file=sys.stderr)
+        return 1
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+    compactor = Compactor(
+        db, LogArchive(args.archive_dir), args.collection,
+        keep_recent=args.keep_recent, page_size=args.page_size, delete=not args.keep_source,
+    )
+    totals = compactor.run(cutoff)
+    print(f"Compacted {args.collection} before {cutoff.isoformat()}: {totals}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
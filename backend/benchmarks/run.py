@@ -0,0 +1,253 @@
+"""
+Benchmarks for the scoring layers and the API round trip.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --patients 1000 --history 10 --missing-rate 0.1 --output bench.json
+
+serialize.* compares FastAPI's default response encoding with
+services.json_response on --serialize-logs raw log documents (Firestore
+timestamps included) per response.
+
+--pool-workers 1 2 4 8 adds the scoring pool (services.scoring_pool) at each
+worker count, to check that batch throughput grows with the cores.
+
+End-to-end runs use the in-memory Firestore stand-in (FIRESTORE_BACKEND=memory),
+so no Firebase project is needed (they need httpx for FastAPI's TestClient). Results are JSON with p50/p95/p99 latency
+(milliseconds) and throughput per benchmark.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+
+from benchmarks.synthetic import SyntheticCohort
+from models.log_model import DailyLog
+from models.log_record import LogRecord
+from services.json_response import FastJSONResponse
+from services.risk_engine import RiskEngine
+from services.scoring_pool import ScoringPool, columns_from_records
+from services.trend_analyzer import TrendAnalyzer, history_matrix
+from scoring import vitals
+from scoring.schema import LogInput
+
+
+def summarize(name, samples_ns, items_per_call=1):
+    """Latency percentiles (ms) and throughput (items/s) for one benchmark."""
+    samples = np.array(samples_ns, dtype=float) / 1e6
+    total_seconds = samples.sum() / 1e3
+    return {
+        "name": name,
+        "calls": len(samples),
+        "items_per_call": items_per_call,
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "throughput_per_s": len(samples) * items_per_call / total_seconds if total_seconds else 0.0,
+    }
+
+
+def timed(func, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter_ns()
+        func(*args)
+        samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+def bench_backend_layers(cohort, repeat):
+    engine = RiskEngine()
+    analyzer = TrendAnalyzer()
+    logs = cohort.daily_logs()
+    models = [
+        (LogRecord.from_model(DailyLog(**current)), [LogRecord.from_dict(log) for log in history])
+        for current, history in logs
+    ]
+
+    results = [
+        summarize("backend.log_record_from_dict", timed(LogRecord.from_dict, [(current,) for current, _ in logs])),
+        summarize("backend.run_rules", timed(engine.run_rules, [(log,) for log, _ in models])),
+        summarize("backend.trend_analyze", timed(analyzer.analyze, [(history,) for _, history in models])),
+        summarize("backend.calculate_risk", timed(engine.calculate_risk, models)),
+    ]
+
+    columns = {
+        field: [current[field] for current, _ in logs]
+        for field in ["pain_score", "temperature", "redness", "swelling", "discharge", "antibiotics_taken", "fatigue"]
+    }
+    histories = [history for _, history in models]
+
+    def batch():
+        pain, lengths = history_matrix(histories, "pain_score")
+        temperature, _ = history_matrix(histories, "temperature")
+        engine.calculate_risk_batch(columns, pain, temperature, lengths)
+
+    results.append(summarize("backend.calculate_risk_batch", timed(batch, [()] * repeat), len(logs)))
+    return results
+
+
+def bench_serialization(cohort, repeat, logs_per_response):
+    """Encoding of a /patient_logs-style payload of raw Firestore log documents."""
+    documents = []
+    for current, history in cohort.daily_logs():
+        for log in [current] + history:
+            documents.append({
+                **log,
+                # What Firestore returns for a server timestamp
+                "created_at": DatetimeWithNanoseconds.fromisoformat(log["timestamp"] + "+00:00"),
+                "risk": {"risk_level": "green", "risk_score": 0.0, "message": "ok", "escalation_action": "none"},
+            })
+            if len(documents) == logs_per_response:
+                break
+        if len(documents) == logs_per_response:
+            break
+    content = {"patient_id": "bench", "logs": documents}
+
+    def default():
+        return JSONResponse(jsonable_encoder(content)).body
+
+    def fast():
+        return FastJSONResponse(content).body
+
+    return [
+        summarize("serialize.jsonable_encoder", timed(default, [()] * repeat), len(documents)),
+        summarize("serialize.fast_json", timed(fast, [()] * repeat), len(documents)),
+    ]
+
+
+def bench_scoring_pool(cohort, repeat, worker_counts):
+    models = [
+        (LogRecord.from_model(DailyLog(**current)), [LogRecord.from_dict(log) for log in history])
+        for current, history in cohort.daily_logs()
+    ]
+    columns = columns_from_records([log for log, _ in models])
+    histories = [history for _, history in models]
+    pain, lengths = history_matrix(histories, "pain_score")
+    temperature, _ = history_matrix(histories, "temperature")
+
+    results = []
+    for workers in worker_counts:
+        pool = ScoringPool(workers=workers, min_batch=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            pool.start()
+        try:
+            samples = timed(pool.score_columns, [(columns, pain, temperature, lengths)] * repeat)
+        finally:
+            pool.stop()
+        results.append(summarize(f"pool.score_columns[workers={workers}]", samples, len(models)))
+    return results
+
+
+def bench_vitals_engine(cohort, repeat):
+    inputs = [
+        (LogInput.from_symptom_log(data), [LogInput.from_symptom_log(entry) for entry in history])
+        for data, history in cohort.engine_inputs()
+    ]
+
+    results = [
+        summarize("vitals.news_like_score", timed(vitals.news_like_score, [(data,) for data, _ in inputs])),
+        summarize("vitals.trend_analysis", timed(vitals.trend_analysis, [(history, data) for data, history in inputs])),
+        summarize("vitals.compute_dynamic_baseline", timed(vitals.compute_dynamic_baseline, [(history,) for _, history in inputs])),
+        summarize("vitals.evaluate", timed(vitals.evaluate, inputs)),
+    ]
+
+    columns = {
+        field: np.array([np.nan if getattr(data, field) is None else getattr(data, field) for data, _ in inputs], dtype=float)
+        for field in vitals.HISTORY_FIELDS + ["missed_doses", "logged_at"]
+    }
+    columns["breathlessness"] = np.array([data.breathlessness for data, _ in inputs])
+    columns["discharge"] = np.array([data.discharge for data, _ in inputs])
+
+    def batch():
+        history, lengths = vitals.stack_history([history for _, history in inputs])
+        vitals.evaluate_batch(columns, history, lengths)
+
+    results.append(summarize("vitals.evaluate_batch", timed(batch, [()] * repeat), len(inputs)))
+    return results
+
+
+def bench_api(cohort, requests):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    client = TestClient(app)
+    patient_ids = cohort.patient_ids()
+    payloads = [
+        cohort.daily_log(patient_ids[i % len(patient_ids)], day=i // len(patient_ids))
+        for i in range(requests)
+    ]
+
+    def post(payload):
+        response = client.post("/submit_log", json=payload)
+        response.raise_for_status()
+
+    def get(path):
+        client.get(path).raise_for_status()
+
+    # Alert stubs print to stdout; keep the JSON report clean
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [summarize("api.submit_log", timed(post, [(payload,) for payload in payloads]))]
+        reads = [(f"/risk/{patient_ids[i % len(patient_ids)]}",) for i in range(requests)]
+        results.append(summarize("api.get_risk", timed(get, reads)))
+        results.append(summarize("api.flagged_patients", timed(get, [("/flagged_patients",)] * min(requests, 100))))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Post-Op Guardian scoring benchmarks")
+    parser.add_argument("--patients", type=int, default=1000, help="synthetic cohort size")
+    parser.add_argument("--history", type=int, default=10, help="history logs per patient")
+    parser.add_argument("--missing-rate", type=float, default=0.1, help="probability an optional field is missing")
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions of each batch benchmark")
+    parser.add_argument("--requests", type=int, default=500, help="API requests per endpoint (0 to skip)")
+    parser.add_argument("--serialize-logs", type=int, default=1000, help="log documents per serialized response")
+    parser.add_argument("--pool-workers", type=int, nargs="*", default=[], help="scoring pool sizes to benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    def cohort():
+        return SyntheticCohort(args.patients, args.history, args.missing_rate, args.seed)
+
+    results = bench_backend_layers(cohort(), args.repeat)
+    results += bench_serialization(cohort(), args.repeat, args.serialize_logs)
+    if args.pool_workers:
+        results += bench_scoring_pool(cohort(), args.repeat, args.pool_workers)
+    results += bench_vitals_engine(cohort(), args.repeat)
+    if args.requests:
+        results += bench_api(cohort(), args.requests)
+
+    report = {
+        "config": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,82 @@
+import random
+from datetime import datetime, timedelta
+
+LEVELS = ["None", "Mild", "Moderate", "Severe"]
+
+
+class SyntheticCohort:
+    """
+    Reproducible synthetic patients for benchmarking.
+    `missing_rate` is the probability that an optional reading is left out.
+    """
+
+    def __init__(self, patients=1000, history=10, missing_rate=0.1, seed=42):
+        self.patients = patients
+        self.history = history
+        self.missing_rate = missing_rate
+        self.random = random.Random(seed)
+        self.start = datetime(2026, 1, 1)
+
+    def _maybe(self, value):
+        return None if self.random.random() < self.missing_rate else value
+
+    def daily_log(self, patient_id, day):
+        """DailyLog payload as posted to /submit_log."""
+        r = self.random
+        return {
+            "patient_id": patient_id,
+            "pain_score": r.randint(0, 10),
+            "temperature": round(r.gauss(37.2, 0.6), 1),
+            "redness": r.choice(LEVELS),
+            "swelling": r.choice(LEVELS),
+            "discharge": r.random() < 0.05,
+            "mobility": r.choice(["Bedridden", "Limited", "Normal"]),
+            "sleep_hours": round(r.uniform(3, 9), 1),
+            "appetite": r.choice(["Poor", "Normal"]),
+            "fatigue": r.choice(["Low", "Medium", "High"]),
+            "mood": r.choice(["Low", "Okay", "Good"]),
+            "antibiotics_taken": r.random() > 0.1,
+            "pain_meds_taken": r.random() > 0.1,
+            "dressing_changed": r.random() > 0.2,
+            "timestamp": (self.start + timedelta(days=day)).isoformat(),
+        }
+
+    def stored_log(self, patient_id, day):
+        """A daily_logs document as read back from Firestore (trend fields may be absent)."""
+        log = self.daily_log(patient_id, day)
+        for field in ("pain_score", "temperature"):
+            if self._maybe(log[field]) is None:
+                del log[field]
+        return log
+
+    def engine_input(self):
+        """Symptom-log payload for scoring.vitals (through LogInput.from_symptom_log)."""
+        r = self.random
+        return {
+            "temperature": self._maybe(round(r.gauss(37.4, 0.8), 1)),
+            "spo2": self._maybe(r.randint(86, 100)),
+            "pain": self._maybe(r.randint(0, 10)),
+            "heart_rate": self._maybe(r.randint(55, 140)),
+            "breathlessness": r.random() < 0.02,
+            "wound_discharge": r.random() < 0.05,
+            "missed_doses": r.randint(0, 3),
+        }
+
+    def patient_ids(self):
+        return [f"patient-{i:06d}" for i in range(self.patients)]
+
+    def daily_logs(self):
+        """(current log, newest-first history) per patient."""
+        cohort = []
+        for patient_id in self.patient_ids():
+            history = [self.stored_log(patient_id, day) for day in range(self.history)]
+            history.reverse()
+            cohort.append((self.daily_log(patient_id, self.history), history))
+        return cohort
+
+    def engine_inputs(self):
+        """(current input, oldest-first history) per patient."""
+        return [
+            (self.engine_input(), [self.engine_input() for _ in range(self.history)])
+            for _ in range(self.patients)
+        ]
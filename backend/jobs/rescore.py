@@ -0,0 +1,143 @@
+"""
+Nightly re-scoring of the whole cohort.
+
+Run from the backend directory:
+
+    python -m jobs.rescore --workers 8 --output rescore.ndjson
+
+Every patient with a patient_status document is re-scored the way
+GET /risk/{patient_id} scores them: the newest log against the logs before
+it, under the current rule spec and ML model. Patients are paged by id
+(--page-size); each page's histories are read with --fetch-threads
+concurrent Firestore queries, packed into columns and history matrices, and
+scored on the scoring pool (services.scoring_pool) across --workers
+processes (default: one per core) through shared memory. The result is
+merged into patient_status as latest_risk {risk_level, risk_score,
+scored_at}; --dry-run only reports it.
+
+Scoring throughput grows with the number of workers; Firestore reads usually
+bound the run, so raise --fetch-threads along with --workers.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from services.firebase_service import FirebaseService, _commit, _stream, get_db
+from services.history_cache import HistoryCache
+from services.rule_spec import RISK_LEVELS
+from services.scoring_pool import ScoringPool, columns_from_records
+from services.trend_analyzer import history_matrix
+
+MAX_BATCH_OPS = 500
+
+
+class Rescorer:
+    def __init__(self, db, pool, page_size=5000, fetch_threads=16, write=True):
+        self.db = db
+        self.pool = pool
+        self.page_size = page_size
+        self.fetch_threads = fetch_threads
+        self.write = write
+        # Cohort-wide reads would only evict each other, so nothing is cached
+        self.service = FirebaseService(client=db, cache=HistoryCache(max_entries=1))
+
+    def patient_pages(self):
+        """Patient ids from patient_status, one page at a time."""
+        query = self.db.collection("patient_status")\
+            .order_by("patient_id")\
+            .limit(self.page_size)\
+            .select(["patient_id"])
+        last = None
+        while True:
+            page = _stream(query.start_after(last) if last is not None else query)
+            if not page:
+                return
+            last = page[-1]
+            yield [doc.to_dict()["patient_id"] for doc in page]
+            if len(page) < self.page_size:
+                return
+
+    def score_page(self, patient_ids, fetcher):
+        """[(patient_id, risk value)] for the patients of one page that have logs."""
+        histories = list(fetcher.map(self.service.get_historical_logs, patient_ids))
+        scored = [(patient_id, logs) for patient_id, logs in zip(patient_ids, histories) if logs]
+        if not scored:
+            return []
+        columns = columns_from_records([logs[0] for _, logs in scored])
+        previous = [logs[1:] for _, logs in scored]
+        pain_history, lengths = history_matrix(previous, "pain_score")
+        temperature_history, _ = history_matrix(previous, "temperature")
+        values = self.pool.score_columns(columns, pain_history, temperature_history, lengths)
+        return [(patient_id, int(value)) for (patient_id, _), value in zip(scored, values.tolist())]
+
+    def save(self, results, scored_at):
+        for start in range(0, len(results), MAX_BATCH_OPS):
+            batch = self.db.batch()
+            for patient_id, value in results[start:start + MAX_BATCH_OPS]:
+                batch.set(self.db.collection("patient_status").document(patient_id), {
+                    "latest_risk": {
+                        "risk_level": RISK_LEVELS[value],
+                        "risk_score": float(value),
+                        "scored_at": scored_at,
+                    }
+                }, merge=True)
+            _commit(batch)
+
+    def run(self, output=None):
+        """Re-scores every patient. Returns counters (patients, scored, per risk level)."""
+        totals = Counter()
+        scored_at = datetime.now(timezone.utc).isoformat()
+        with ThreadPoolExecutor(max_workers=self.fetch_threads) as fetcher:
+            for patient_ids in self.patient_pages():
+                results = self.score_page(patient_ids, fetcher)
+                totals["patients"] += len(patient_ids)
+                totals["scored"] += len(results)
+                totals.update(RISK_LEVELS[value] for _, value in results)
+                if self.write:
+                    self.save(results, scored_at)
+                if output is not None:
+                    for patient_id, value in results:
+                        output.write(json.dumps({"patient_id": patient_id, "risk_level": RISK_LEVELS[value],
+                                                 "risk_score": float(value), "scored_at": scored_at}) + "\n")
+        return dict(totals)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score every Post-Op Guardian patient with the current rules and model")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scoring processes (0 scores in this process)")
+    parser.add_argument("--page-size", type=int, default=5000, help="patients scored per round")
+    parser.add_argument("--fetch-threads", type=int, default=16, help="concurrent history reads")
+    parser.add_argument("--output", help="also write one JSON line per patient to this file")
+    parser.add_argument("--dry-run", action="store_true", help="score without writing latest_risk")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    if db is None:
+        print("No Firestore client available (missing credentials?)", file=sys.stderr)
+        return 1
+
+    # Every page goes to the workers, however small
+    pool = ScoringPool(workers=args.workers, min_batch=1)
+    pool.start()
+    started = time.perf_counter()
+    try:
+        rescorer = Rescorer(db, pool, page_size=args.page_size, fetch_threads=args.fetch_threads,
+                            write=not args.dry_run)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as output:
+                totals = rescorer.run(output)
+        else:
+            totals = rescorer.run()
+    finally:
+        pool.stop()
+    print(f"Re-scored in {time.perf_counter() - started:.1f}s with {args.workers} workers: {totals}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
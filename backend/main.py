@@ -1,23 +1,112 @@
+from services import startup  # first import: starts the startup clock
+
+from contextlib import asynccontextmanager
+import asyncio
+import os
+
 from fastapi import FastAPI
-from routers import logs, alerts, patients
+from fastapi.responses import PlainTextResponse
+from ml import inference
+from routers import logs, alerts, patients, ingest, dashboard, archive
+from services.firebase_service import get_db, history_cache
+from services.alert_pipeline import alert_pipeline
+from services.dashboard_feed import dashboard_feed
+from services.idempotency import idempotency_store
+from services.response_cache import response_cache
+from services.scoring_pool import scoring_pool
+from services import metrics
 import uvicorn
-import firebase_admin
-from firebase_admin import credentials
 
-# Initialize Firebase
-cred = credentials.Certificate("firebase_key.json")
-firebase_admin.initialize_app(cred)
+startup.mark("imports_done_at_ms")
+
+# Dashboards follow alert commits through the live feed
+alert_pipeline.add_listener(dashboard_feed.alerts_written)
+
+# Firebase is initialized lazily by services.firebase_service.get_db() on first use
+# (FIRESTORE_BACKEND=memory swaps in the in-memory stand-in for local load testing)
+
+
+def _warm_up_firestore():
+    get_db()
+    startup.mark("firestore_ready_at_ms")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    startup.mark("ready_at_ms")
+    # Create the Firestore client in the background so the worker answers
+    # health checks right away; FIRESTORE_WARMUP=0 defers it to the first request.
+    if os.getenv("FIRESTORE_WARMUP", "1") != "0":
+        asyncio.get_running_loop().run_in_executor(None, _warm_up_firestore)
+    await alert_pipeline.start()
+    # The ML layer's model is loaded before traffic; ML_MODEL_REQUIRED=1 refuses to start without it
+    ml_status = await asyncio.get_running_loop().run_in_executor(None, inference.model_status)
+    if not ml_status["enabled"] and os.getenv("ML_MODEL_REQUIRED") == "1":
+        raise RuntimeError(f"ML_MODEL_REQUIRED=1 but the ML risk layer is disabled: {ml_status['reason']}")
+    # Scoring workers (SCORING_WORKERS) are spawned and warmed before traffic arrives
+    await asyncio.get_running_loop().run_in_executor(None, scoring_pool.start)
+    print(f"Startup: {startup.report()}")
+    yield
+    await alert_pipeline.stop()
+    scoring_pool.stop()
+
 
-app = FastAPI(title="Post-Op Guardian API", description="Recovery monitoring system backend")
+app = FastAPI(title="Post-Op Guardian API", description="Recovery monitoring system backend", lifespan=lifespan)
+
+# Latency, span and Firestore op metrics per route; PROFILE_SLOW_MS enables the slow-request profiler
+app.add_middleware(metrics.MetricsMiddleware, profiler=metrics.create_profiler())
 
 # Include routers
 app.include_router(logs.router, tags=["Logs"])
 app.include_router(alerts.router, tags=["Alerts"])
 app.include_router(patients.router, tags=["Patients"])
+app.include_router(ingest.router, tags=["Ingest"])
+app.include_router(dashboard.router, tags=["Dashboard"])
+app.include_router(archive.router, tags=["Archive"])
 
 @app.get("/")
 async def root():
     return {"message": "Post-Op Guardian Backend is running", "status": "healthy"}
 
+@app.get("/startup")
+async def startup_report():
+    """Startup phases: *_at_ms since application import began, others are durations"""
+    return startup.report()
+
+@app.get("/cache_stats")
+async def cache_stats():
+    """Hit/miss counters of the shared patient history cache"""
+    return history_cache.stats()
+
+@app.get("/response_cache_stats")
+async def response_cache_stats():
+    """Patient reads answered with 304, from memoized JSON, or rendered"""
+    return response_cache.stats()
+
+@app.get("/idempotency_stats")
+async def idempotency_stats():
+    """Log submissions answered from the dedup store (hits) vs. scored (misses)"""
+    return idempotency_store.stats()
+
+@app.get("/scoring_stats")
+async def scoring_stats():
+    """Scoring worker pool: workers, jobs sent to them and rows scored there"""
+    return scoring_pool.stats()
+
+@app.get("/ml_status")
+async def ml_status():
+    """Whether the ML risk layer has a model (and why not, when it is disabled)"""
+    return inference.model_status()
+
+@app.get("/alert_stats")
+async def alert_stats():
+    """Counters of the alert pipeline (created, coalesced, pushed, escalated, ...)"""
+    return alert_pipeline.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus text exposition of request latency, spans and Firestore reads/writes per route"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,98 @@
+import math
+
+import numpy as np
+
+
+class OrdinalScale(dict):
+    """
+    Case-insensitive ordinal encoding of a categorical DailyLog field.
+    Unknown values encode as NaN (imputed by the model); each new spelling is
+    lowercased once and then served from the dict.
+    """
+
+    MAX_SPELLINGS = 256
+
+    def __init__(self, levels):
+        super().__init__()
+        self.levels = {level.lower(): float(rank) for rank, level in enumerate(levels)}
+        self.update(self.levels)
+
+    def __missing__(self, value):
+        rank = self.levels.get(str(value).lower(), math.nan)
+        if len(self) < self.MAX_SPELLINGS:
+            self[value] = rank
+        return rank
+
+
+# Vocabularies of the Android app's spinners (res/values/arrays.xml)
+SCALES = {
+    "redness": OrdinalScale(["None", "Mild", "Moderate", "Severe"]),
+    "swelling": OrdinalScale(["None", "Mild", "Moderate", "Severe"]),
+    "mobility": OrdinalScale(["Normal", "Moderate", "Limited", "Bedridden"]),
+    "appetite": OrdinalScale(["Excellent", "Good", "Fair", "Poor"]),
+    "fatigue": OrdinalScale(["None", "Low", "Moderate", "High"]),
+    "mood": OrdinalScale(["Excellent", "Good", "Fair", "Poor", "Very Poor"]),
+}
+
+NUMERIC_FIELDS = ["pain_score", "temperature", "sleep_hours"]
+FLAG_FIELDS = ["discharge", "antibiotics_taken", "pain_meds_taken", "dressing_changed"]
+
+FEATURE_NAMES = NUMERIC_FIELDS + list(SCALES) + FLAG_FIELDS
+
+
+def _number(value):
+    return math.nan if value is None else float(value)
+
+
+def _rank(scale, value):
+    return math.nan if value is None else scale[value]
+
+
+def log_features(log):
+    """
+    Feature vector (FEATURE_NAMES order) read straight off a LogRecord or
+    DailyLog; missing fields become NaN, as in record_features.
+    """
+    scales = SCALES
+    return [
+        _number(log.pain_score),
+        _number(log.temperature),
+        _number(log.sleep_hours),
+        _rank(scales["redness"], log.redness),
+        _rank(scales["swelling"], log.swelling),
+        _rank(scales["mobility"], log.mobility),
+        _rank(scales["appetite"], log.appetite),
+        _rank(scales["fatigue"], log.fatigue),
+        _rank(scales["mood"], log.mood),
+        _number(log.discharge),
+        _number(log.antibiotics_taken),
+        _number(log.pain_meds_taken),
+        _number(log.dressing_changed),
+    ]
+
+
+def record_features(record):
+    """Feature vector for an exported daily_logs document (missing fields become NaN)."""
+    features = [_number(record.get(field)) for field in NUMERIC_FIELDS]
+    features.extend(_rank(scale, record.get(field)) for field, scale in SCALES.items())
+    features.extend(_number(record.get(field)) for field in FLAG_FIELDS)
+    return features
+
+
+def column_features(columns, n):
+    """
+    (n, len(FEATURE_NAMES)) matrix from columnar logs (field name -> sequence),
+    as passed to RiskEngine.calculate_risk_batch. Absent columns are NaN.
+    """
+    matrix = np.full((n, len(FEATURE_NAMES)), np.nan)
+    for index, field in enumerate(FEATURE_NAMES):
+        values = columns.get(field)
+        if values is None:
+            continue
+        scale = SCALES.get(field)
+        if scale is None:
+            matrix[:, index] = np.asarray(values, dtype=float)
+        else:
+            uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+            matrix[:, index] = np.array([scale[value] for value in uniques.tolist()])[inverse]
+    return matrix
@@ -0,0 +1,70 @@
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from ml.features import FEATURE_NAMES, column_features, log_features
+from ml.model import LogisticRiskModel
+
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parent / "risk_model.npz"
+
+_model = None
+_loaded = False
+_status = {"enabled": False, "path": None, "reason": "not loaded yet"}
+_lock = threading.Lock()
+
+
+def _load(path):
+    """(model, reason it is disabled) for the model file at `path`."""
+    if not path.exists():
+        # No model ships with the repo: it is trained from clinician-labelled exports
+        return None, (f"no model at {path}; train one with "
+                      f"`python -m ml.train --input <labelled logs> --output {path}` or set ML_MODEL_PATH")
+    model = LogisticRiskModel.load(path)
+    if model.feature_names != FEATURE_NAMES:
+        return None, f"model at {path} was trained on different features"
+    return model, None
+
+
+def get_model():
+    """
+    Loads the model on first use (ML_MODEL_PATH, default ml/risk_model.npz).
+    Returns None when there is no usable model; the ML layer then predicts 0,
+    which is logged once per process and reported by model_status().
+    """
+    global _model, _loaded, _status
+    if _loaded:
+        return _model
+
+    with _lock:
+        if not _loaded:
+            path = Path(os.getenv("ML_MODEL_PATH", str(DEFAULT_MODEL_PATH)))
+            _model, reason = _load(path)
+            _status = {"enabled": _model is not None, "path": str(path), "reason": reason}
+            if reason:
+                print(f"ML risk layer disabled: {reason}")
+            _loaded = True
+    return _model
+
+
+def model_status():
+    """Whether the ML layer is enabled, the model path and, if disabled, why."""
+    get_model()
+    return dict(_status)
+
+
+def predict_ml_risk(log):
+    """Layer 3: ML risk level (0=Green, 1=Yellow, 2=Red) for one LogRecord or DailyLog."""
+    model = get_model()
+    if model is None:
+        return 0
+    return model.predict_one(log_features(log))
+
+
+def predict_ml_risk_batch(logs, n):
+    """predict_ml_risk over columnar logs (field name -> sequence of length n)."""
+    model = get_model()
+    if model is None:
+        return np.zeros(n, dtype=np.int64)
+    return model.predict(column_features(logs, n))
@@ -1,6 +0,0 @@
-def predict_ml_risk(data):
-    """
-    ML Placeholder function.
-    Always returns 0 (Green/No Risk) to be replaced by actual model later.
-    """
-    return 0
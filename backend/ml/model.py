@@ -0,0 +1,84 @@
+import math
+from operator import mul
+
+import numpy as np
+
+
+class LogisticRiskModel:
+    """
+    Multinomial logistic regression over FEATURE_NAMES, stored as NumPy arrays.
+
+    Inputs are standardized with the training mean/scale; a missing (NaN)
+    feature is imputed with the mean, i.e. it contributes nothing. A class is
+    predicted only when its probability reaches `min_probability`, otherwise
+    the model answers 0 (green) and leaves the decision to the other layers.
+    """
+
+    def __init__(self, feature_names, mean, scale, coef, intercept, min_probability=0.5):
+        self.feature_names = list(feature_names)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.coef = np.asarray(coef, dtype=float)            # (n_classes, n_features)
+        self.intercept = np.asarray(intercept, dtype=float)  # (n_classes,)
+        self.min_probability = float(min_probability)
+
+        # Plain-Python copies for single-log scoring, where NumPy call overhead dominates
+        self._mean = self.mean.tolist()
+        self._inv_scale = (1.0 / self.scale).tolist()
+        self._weights = list(zip(self.intercept.tolist(), self.coef.tolist()))
+
+    def _standardize(self, features):
+        z = (np.asarray(features, dtype=float) - self.mean) / self.scale
+        return np.nan_to_num(z, nan=0.0)
+
+    def predict_proba(self, features):
+        """Class probabilities for an (n, n_features) matrix."""
+        logits = self._standardize(features) @ self.coef.T + self.intercept
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict(self, features):
+        """Risk level per row (0=Green, 1=Yellow, 2=Red)."""
+        probabilities = self.predict_proba(features)
+        levels = probabilities.argmax(axis=1)
+        confident = probabilities[np.arange(len(levels)), levels] >= self.min_probability
+        return np.where(confident, levels, 0)
+
+    def predict_one(self, features):
+        """predict() for a single feature vector, without NumPy."""
+        # NaN (value != value) is imputed with the mean, i.e. z = 0
+        z = [
+            (value - mean) * inv_scale if value == value else 0.0
+            for value, mean, inv_scale in zip(features, self._mean, self._inv_scale)
+        ]
+        logits = [intercept + sum(map(mul, weights, z)) for intercept, weights in self._weights]
+
+        top = max(logits)
+        level = logits.index(top)
+        if 1.0 / sum(math.exp(logit - top) for logit in logits) < self.min_probability:
+            return 0
+        return level
+
+    def save(self, path):
+        np.savez(
+            path,
+            feature_names=np.array(self.feature_names),
+            mean=self.mean,
+            scale=self.scale,
+            coef=self.coef,
+            intercept=self.intercept,
+            min_probability=np.array(self.min_probability),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                feature_names=data["feature_names"].tolist(),
+                mean=data["mean"],
+                scale=data["scale"],
+                coef=data["coef"],
+                intercept=data["intercept"],
+                min_probability=float(data["min_probability"]),
+            )
@@ -0,0 +1,114 @@
+"""
+Trains the ML risk layer from exported daily logs.
+
+Run from the backend directory:
+
+    python -m ml.train --input logs.ndjson --label outcome --output ml/risk_model.npz
+
+The input holds one daily_logs document per line (the /ingest_logs format)
+plus a label field: "green"/"yellow"/"red" or 0/1/2, e.g. the risk a
+clinician confirmed on review. Lines without a label are skipped.
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from ml.features import FEATURE_NAMES, record_features
+from ml.model import LogisticRiskModel
+from services.rule_spec import RISK_LEVELS
+
+
+def read_dataset(path, label_field):
+    features, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            label = record.get(label_field)
+            if label is None:
+                continue
+            if isinstance(label, str):
+                label = RISK_LEVELS.index(label.lower())
+            features.append(record_features(record))
+            labels.append(int(label))
+    return np.array(features, dtype=float).reshape(-1, len(FEATURE_NAMES)), np.array(labels, dtype=np.int64)
+
+
+def fit(features, labels, l2=1e-3, epochs=500, learning_rate=0.5, balanced=False, min_probability=0.5):
+    """Full-batch gradient descent on the L2-regularized softmax loss."""
+    n_classes = len(RISK_LEVELS)
+    mean = np.nanmean(features, axis=0)
+    scale = np.nanstd(features, axis=0)
+    mean = np.nan_to_num(mean)
+    scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+
+    x = np.nan_to_num((features - mean) / scale, nan=0.0)
+    y = np.eye(n_classes)[labels]
+    if balanced:
+        counts = np.maximum(y.sum(axis=0), 1)
+        weights = (len(labels) / (n_classes * counts))[labels]
+    else:
+        weights = np.ones(len(labels))
+    weights = weights / weights.sum()
+
+    coef = np.zeros((n_classes, x.shape[1]))
+    intercept = np.zeros(n_classes)
+    for _ in range(epochs):
+        logits = x @ coef.T + intercept
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        error = (probabilities - y) * weights[:, None]
+        coef -= learning_rate * (error.T @ x + l2 * coef)
+        intercept -= learning_rate * error.sum(axis=0)
+
+    return LogisticRiskModel(FEATURE_NAMES, mean, scale, coef, intercept, min_probability)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the Post-Op Guardian ML risk layer")
+    parser.add_argument("--input", required=True, help="NDJSON export of daily logs with labels")
+    parser.add_argument("--label", default="outcome", help="label field (green/yellow/red or 0/1/2)")
+    parser.add_argument("--output", default="ml/risk_model.npz")
+    parser.add_argument("--l2", type=float, default=1e-3)
+    parser.add_argument("--epochs", type=int, default=500)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--balanced", action="store_true", help="weight classes inversely to their frequency")
+    parser.add_argument("--min-probability", type=float, default=0.5,
+                        help="probability a class needs before the model escalates to it")
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction held out for evaluation")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    features, labels = read_dataset(args.input, args.label)
+    if len(labels) == 0:
+        print(f"No labelled logs in {args.input} (label field {args.label!r})", file=sys.stderr)
+        return 1
+
+    order = np.random.default_rng(args.seed).permutation(len(labels))
+    n_test = int(len(labels) * args.holdout)
+    test, train = order[:n_test], order[n_test:]
+
+    model = fit(
+        features[train], labels[train],
+        l2=args.l2, epochs=args.epochs, learning_rate=args.learning_rate,
+        balanced=args.balanced, min_probability=args.min_probability,
+    )
+    model.save(args.output)
+
+    print(f"Trained on {len(train)} logs, saved {args.output}")
+    if n_test:
+        predicted = model.predict(features[test])
+        print(f"Holdout accuracy: {(predicted == labels[test]).mean():.3f} on {n_test} logs")
+        for level, name in enumerate(RISK_LEVELS):
+            actual = labels[test] == level
+            if actual.any():
+                print(f"  {name}: recall {(predicted[actual] == level).mean():.3f} ({actual.sum()} logs)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
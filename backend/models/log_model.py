@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class DailyLog(BaseModel):
     patient_id: str
@@ -24,3 +24,28 @@ class DailyLog(BaseModel):
     dressing_changed: bool
     
     timestamp: Optional[str] = None
+    # Client-generated id of this submission; retries with the same id are deduplicated
+    log_id: Optional[str] = None
+
+class DailyLogBatch(BaseModel):
+    """Columnar batch of logs for cohort scoring; one list entry per patient."""
+    patient_id: List[str]
+    pain_score: List[int]
+    temperature: List[float]
+    redness: List[str]
+    swelling: List[str]
+    discharge: List[bool]
+    antibiotics_taken: List[bool]
+    fatigue: List[str]
+
+    # Only read by the ML layer; a column left out is imputed for every patient
+    mobility: Optional[List[str]] = None
+    sleep_hours: Optional[List[float]] = None
+    appetite: Optional[List[str]] = None
+    mood: Optional[List[str]] = None
+    pain_meds_taken: Optional[List[bool]] = None
+    dressing_changed: Optional[List[bool]] = None
+
+    # Optional history per patient, oldest first
+    pain_history: Optional[List[List[float]]] = None
+    temperature_history: Optional[List[List[float]]] = None
@@ -0,0 +1,58 @@
+from models.log_model import DailyLog
+
+# Every DailyLog field, plus the response stored with idempotent submissions
+FIELDS = tuple(DailyLog.model_fields) + ("risk",)
+
+
+class LogRecord:
+    """
+    Compact internal form of one daily log.
+
+    DailyLog validates requests and Firestore hands back plain dicts; the
+    scoring code (rules, trend, recovery, ML features) reads a LogRecord
+    instead. It is converted once at each boundary and read by attribute.
+    Fields missing from a stored document are None.
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, **values):
+        for name in FIELDS:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    def from_model(cls, log):
+        record = cls.__new__(cls)
+        for name in FIELDS[:-1]:
+            setattr(record, name, getattr(log, name))
+        record.risk = None
+        return record
+
+    @classmethod
+    def from_dict(cls, data):
+        """From a daily_logs document (unknown fields are dropped)."""
+        record = cls.__new__(cls)
+        get = data.get
+        for name in FIELDS:
+            setattr(record, name, get(name))
+        return record
+
+    def to_dict(self):
+        """daily_logs document; "log_id" and "risk" are only written when set."""
+        data = {name: getattr(self, name) for name in FIELDS[:-1]}
+        if self.log_id is None:
+            del data["log_id"]
+        if self.risk is not None:
+            data["risk"] = self.risk
+        return data
+
+    def to_model(self):
+        """DailyLog without re-validation (the record came from validated data)."""
+        return DailyLog.model_construct(**{name: getattr(self, name) for name in FIELDS[:-1]})
+
+    def __eq__(self, other):
+        if not isinstance(other, LogRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELDS)
+
+    def __repr__(self):
+        return f"LogRecord(patient_id={self.patient_id!r}, timestamp={self.timestamp!r})"
@@ -1,8 +1,14 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class RiskResponse(BaseModel):
     risk_level: str  # "green", "yellow", "red"
     risk_score: float
     message: str
     escalation_action: Optional[str] = None
+
+class PatientRiskResponse(RiskResponse):
+    patient_id: str
+
+class BatchRiskResponse(BaseModel):
+    results: List[PatientRiskResponse]
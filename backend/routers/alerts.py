@@ -1,13 +1,39 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List
+from services.async_firebase_service import AsyncFirebaseService
+from services.alert_pipeline import alert_pipeline
+from services.dashboard_feed import dashboard_feed
 
 router = APIRouter()
+firebase_service = AsyncFirebaseService()
 
 class AlertAcknowledge(BaseModel):
     alert_id: str
     doctor_id: str
 
+class BulkAlertAcknowledge(BaseModel):
+    alert_ids: List[str] = Field(..., min_length=1, max_length=1000)
+    doctor_id: str
+
+
+async def _acknowledge(alert_ids, doctor_id):
+    result = await firebase_service.acknowledge_alerts(alert_ids, doctor_id)
+    alert_pipeline.acknowledged(result["acknowledged"])
+    for patient_id in result["cleared_patients"]:
+        dashboard_feed.remove(patient_id)
+    return result
+
+
 @router.post("/acknowledge_alert")
 async def acknowledge_alert(req: AlertAcknowledge):
-    # Logic to update Firestore alert status to 'acknowledged'
+    result = await _acknowledge([req.alert_id], req.doctor_id)
+    if not result["acknowledged"]:
+        raise HTTPException(status_code=404, detail=f"No pending alert {req.alert_id}")
     return {"status": "success", "message": f"Alert {req.alert_id} acknowledged by {req.doctor_id}"}
+
+@router.post("/acknowledge_alerts")
+async def acknowledge_alerts(req: BulkAlertAcknowledge):
+    """Acknowledge many alerts at once; ids that are unknown or already acknowledged are skipped"""
+    result = await _acknowledge(req.alert_ids, req.doctor_id)
+    return {"status": "success", **result}
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from archive.blocks import LogArchive, decode_value
+from archive.compact import COLLECTIONS
+from services.json_response import FastJSONResponse
+
+router = APIRouter()
+log_archive = LogArchive()
+
+# Rows returned per request; narrow the range for more
+MAX_ARCHIVE_ROWS = 20000
+
+
+@router.get("/archive/{patient_id}", response_class=FastJSONResponse)
+async def get_archived_logs(
+    patient_id: str,
+    fields: str = Query(..., description="comma-separated log fields, e.g. temperature,pain_score"),
+    since: Optional[str] = Query(None, description="ISO date/time, inclusive (e.g. the surgery date)"),
+    until: Optional[str] = Query(None, description="ISO date/time, exclusive"),
+    collection: str = "daily_logs",
+):
+    """Compacted (older) logs of a patient as columns, oldest first. Recent logs stay on /patient_logs."""
+    if collection not in COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown collection {collection}")
+    columns, kinds = log_archive.read(collection, patient_id, [field for field in fields.split(",") if field], since, until)
+    rows = len(next(iter(columns.values()))) if columns else 0
+    if rows > MAX_ARCHIVE_ROWS:
+        raise HTTPException(status_code=413, detail=f"{rows} rows in range; at most {MAX_ARCHIVE_ROWS} per request")
+    return FastJSONResponse({
+        "patient_id": patient_id,
+        "collection": collection,
+        "rows": rows,
+        "columns": {
+            name: [decode_value(kinds[name], value) for value in column]
+            for name, column in columns.items()
+        },
+    })
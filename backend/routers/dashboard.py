@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from services.dashboard_feed import dashboard_feed
+from services.json_response import FastJSONResponse
+import asyncio
+
+router = APIRouter()
+
+# Comment line sent on idle streams so proxies keep the connection open
+KEEP_ALIVE_SECONDS = 15
+
+
+@router.get("/dashboard/stream")
+async def dashboard_stream(request: Request):
+    """
+    Server-Sent Events feed of flagged patients: a `snapshot` on connect, then
+    `upsert`/`remove` deltas as logs are scored and alerts acknowledged.
+    """
+    queue = await dashboard_feed.subscribe()
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), KEEP_ALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield event
+        finally:
+            dashboard_feed.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/dashboard/snapshot", response_class=FastJSONResponse)
+async def dashboard_snapshot():
+    """The feed's current view in one response (for clients without EventSource)"""
+    await dashboard_feed.load()
+    return FastJSONResponse(dashboard_feed.snapshot())
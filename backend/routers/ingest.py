@@ -0,0 +1,208 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from models.log_model import DailyLog
+from models.log_record import LogRecord
+from services.risk_engine import RiskEngine
+from services.async_firebase_service import AsyncFirebaseService
+from services.firebase_service import StaleTrendStats
+from services.alert_pipeline import alert_pipeline
+from services.idempotency import idempotency_store, log_document_id
+from services.patient_locks import patient_locks
+from datetime import datetime
+import codecs
+import json
+
+router = APIRouter()
+risk_engine = RiskEngine()
+firebase_service = AsyncFirebaseService()
+
+# Trend state kept per patient during one upload; flushed and cleared past this size
+MAX_TRACKED_PATIENTS = 10000
+# Times a batch is rescored when other writes for its patients got in between
+SAVE_ATTEMPTS = 5
+
+
+async def _read_lines(request):
+    """Yields decoded lines from the request body as chunks arrive."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+class IngestStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that leaves receive() to the body reader.
+    The stock class listens for client disconnects on receive() while streaming
+    (ASGI < 2.4) and would swallow the request body chunks we are still reading;
+    request.stream() raises ClientDisconnect itself.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+def _result_line(result):
+    return json.dumps(result) + "\n"
+
+
+async def _ingest(request):
+    writer = firebase_service.bulk_writer()
+    # patient_id -> [trend state, log_version it was read at] as of the last written batch
+    trend_stats = {}
+    # Scored logs of the batch being built: [line_number, record, document_id, risk_data]
+    pending = []
+    # document_id -> entry in `pending`, for logs with a log_id
+    pending_keys = {}
+    # Result lines of the batch, sent once it is written: dicts, or entries of `pending`
+    results = []
+
+    def score(entry, stats):
+        _, record, document_id, _ = entry
+        risk_data = risk_engine.calculate_risk(record, trend_stats=stats)
+        stats.push(record)
+        if document_id:
+            # Stored like submit_log does, so a later retry through submit_log finds it
+            record.risk = risk_data
+        entry[3] = risk_data
+
+    def add(entry, stats, log_version):
+        _, record, document_id, risk_data = entry
+        # Alerted once the log is written (its outbox entry goes in the same batch)
+        alert = risk_data if risk_data["risk_level"] in ["yellow", "red"] else None
+        return writer.add(record.patient_id, record, stats, log_version, document_id, alert)
+
+    async def rescore(patient_ids):
+        """Scores the batch's logs of `patient_ids` again against their stored trend state."""
+        for patient_id in patient_ids:
+            trend_stats[patient_id] = [*await firebase_service.get_trend_stats(patient_id)]
+        writer.clear()
+        for entry in pending:
+            patient_id = entry[1].patient_id
+            stats, log_version = trend_stats[patient_id]
+            if patient_id in patient_ids:
+                score(entry, stats)
+            add(entry, stats, log_version)
+
+    async def flush():
+        """Writes the batch and returns its result lines."""
+        patients = {entry[1].patient_id for entry in pending}
+        try:
+            async with patient_locks(patients):
+                for _ in range(SAVE_ATTEMPTS):
+                    try:
+                        _, written_alerts = await firebase_service.flush(writer)
+                        break
+                    except StaleTrendStats as e:
+                        # Another request or worker wrote logs for these patients since
+                        await rescore(set(e.args))
+                else:
+                    raise StaleTrendStats(*patients)
+            for patient_id in patients:
+                trend_stats[patient_id][1] += 1
+            for document_id, entry in pending_keys.items():
+                idempotency_store.set(document_id, entry[3])
+            for outbox_id, patient_id, risk_data in written_alerts:
+                alert_pipeline.submit(patient_id, risk_data, outbox_id)
+            lines = [_result_line(_ok_result(result) if isinstance(result, list) else result) for result in results]
+        except Exception as e:
+            print(f"Bulk write failed: {e}")
+            writer.clear()
+            # Scored ahead of what was stored; read again for the next batch
+            for patient_id in patients:
+                trend_stats.pop(patient_id, None)
+            lines = [_result_line(result) for result in results if not isinstance(result, list)]
+            lines.append(_result_line({
+                "status": "error",
+                "detail": f"Batch write failed: {e}",
+                "lines": [entry[0] for entry in pending]
+            }))
+        pending.clear()
+        pending_keys.clear()
+        results.clear()
+        return lines
+
+    line_number = 0
+    async for line in _read_lines(request):
+        line_number += 1
+        if not line.strip():
+            continue
+
+        try:
+            log = DailyLog(**json.loads(line))
+        except (ValueError, TypeError, ValidationError) as e:
+            results.append({"line": line_number, "status": "error", "detail": str(e)})
+            continue
+
+        document_id = log_document_id(log.patient_id, log.log_id) if log.log_id else None
+        if document_id in pending_keys:
+            remembered = pending_keys[document_id][3]
+        else:
+            remembered = idempotency_store.get(document_id) if document_id else None
+        if remembered is not None:
+            results.append({
+                "line": line_number,
+                "status": "duplicate",
+                "patient_id": log.patient_id,
+                "risk_level": remembered["risk_level"],
+                "risk_score": remembered["risk_score"]
+            })
+            continue
+
+        if not log.timestamp:
+            log.timestamp = datetime.utcnow().isoformat()
+
+        # Score in arrival order against the history accumulated so far
+        if log.patient_id not in trend_stats:
+            if len(trend_stats) >= MAX_TRACKED_PATIENTS:
+                for result_line in await flush():
+                    yield result_line
+                trend_stats.clear()
+            trend_stats[log.patient_id] = [*await firebase_service.get_trend_stats(log.patient_id)]
+        stats, log_version = trend_stats[log.patient_id]
+
+        entry = [line_number, LogRecord.from_model(log), document_id, None]
+        score(entry, stats)
+        pending.append(entry)
+        results.append(entry)
+        if document_id:
+            pending_keys[document_id] = entry
+        if add(entry, stats, log_version):
+            for result_line in await flush():
+                yield result_line
+
+    for result_line in await flush():
+        yield result_line
+
+
+def _ok_result(entry):
+    line_number, record, _, risk_data = entry
+    return {
+        "line": line_number,
+        "status": "ok",
+        "patient_id": record.patient_id,
+        "risk_level": risk_data["risk_level"],
+        "risk_score": risk_data["risk_score"]
+    }
+
+
+@router.post("/ingest_logs")
+async def ingest_logs(request: Request):
+    """
+    Bulk NDJSON ingestion: one DailyLog JSON object per line.
+    Streams back one result object per input line, once its batch is written;
+    logs are written in Firestore batches of up to 500 operations and alerts
+    go through the alert pipeline. A batch that raced other writes for its
+    patients is rescored against their stored trend state and written again.
+    Lines with a log_id already submitted recently come back as "duplicate"
+    and are not written again; a batch that cannot be written comes back as
+    one "error" object listing its lines.
+    """
+    return IngestStreamingResponse(_ingest(request), media_type="application/x-ndjson")
@@ -1,31 +1,101 @@
-from fastapi import APIRouter, HTTPException
-from models.log_model import DailyLog
-from models.response_model import RiskResponse
-from services.risk_engine import RiskEngine
-from services.firebase_service import FirebaseService
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException
+from models.log_model import DailyLog, DailyLogBatch
+from models.log_record import LogRecord
+from models.response_model import RiskResponse, BatchRiskResponse
+from services.risk_engine import risk_results
+from services.async_firebase_service import AsyncFirebaseService
+from services.firebase_service import StaleTrendStats
+from services.alert_pipeline import alert_pipeline
+from services.idempotency import idempotency_store, log_document_id
+from services.patient_locks import patient_lock
+from services.scoring_pool import scoring_pool
+from services.trend_analyzer import stack_values
 from datetime import datetime
 
 router = APIRouter()
-risk_engine = RiskEngine()
-firebase_service = FirebaseService()
+firebase_service = AsyncFirebaseService()
 
-@router.post("/submit_log", response_model=RiskResponse)
-async def submit_log(log: DailyLog):
+# Times a log is rescored when another worker wrote a log for the patient in between
+SAVE_ATTEMPTS = 5
+
+async def _score_and_save(log, document_id=None):
     # Set timestamp if not provided
     if not log.timestamp:
         log.timestamp = datetime.utcnow().isoformat()
-    
-    # Get historical logs for trend analysis
-    historical_logs = firebase_service.get_historical_logs(log.patient_id)
-    
-    # Calculate risk
-    risk_data = risk_engine.calculate_risk(log, historical_logs)
-    
-    # Save log to Firestore
-    firebase_service.save_log(log.patient_id, log.dict())
-    
-    # Save alert if risk is elevated
-    if risk_data["risk_level"] in ["yellow", "red"]:
-        firebase_service.create_alert(log.patient_id, risk_data)
-        
+
+    async with patient_lock(log.patient_id):
+        return await _score_and_save_locked(log, document_id)
+
+async def _score_and_save_locked(log, document_id):
+    record = LogRecord.from_model(log)
+    for _ in range(SAVE_ATTEMPTS):
+        # Get rolling trend state (before saving, so the new log is not part of it)
+        trend_stats, log_version = await firebase_service.get_trend_stats(log.patient_id)
+
+        # Calculate risk (on a scoring worker when SCORING_WORKERS is set)
+        risk_data = await scoring_pool.score(record, trend_stats=trend_stats)
+        # Elevated risk is alerted off the request path, through an outbox entry saved with the log
+        alert = risk_data if risk_data["risk_level"] in ["yellow", "red"] else None
+
+        # Save log and updated trend state, unless the state changed since it was read
+        trend_stats.push(record)
+        try:
+            if document_id is None:
+                outbox_id = await firebase_service.save_log(log.patient_id, record, trend_stats, log_version, alert)
+            else:
+                stored = await firebase_service.create_log(log.patient_id, document_id, record, trend_stats, risk_data, log_version, alert)
+                if stored is not None:
+                    # Retry of a log saved earlier (other worker or before a restart)
+                    return stored
+                outbox_id = document_id
+            break
+        except StaleTrendStats:
+            continue
+    else:
+        raise HTTPException(status_code=503, detail="Too many concurrent logs for this patient, please retry")
+
+    if alert is not None:
+        alert_pipeline.submit(log.patient_id, alert, outbox_id)
+    return risk_data
+
+@router.post("/submit_log", response_model=RiskResponse)
+async def submit_log(log: DailyLog, idempotency_key: Optional[str] = Header(None)):
+    """
+    Scores and saves one log. Send a `log_id` (or an Idempotency-Key header) to
+    make retries safe: a repeated submission returns the first response and
+    writes nothing.
+    """
+    key = log.log_id or idempotency_key
+    if not key:
+        return RiskResponse(**await _score_and_save(log))
+
+    document_id = log_document_id(log.patient_id, key)
+    risk_data = await idempotency_store.run(document_id, lambda: _score_and_save(log, document_id))
     return RiskResponse(**risk_data)
+
+@router.post("/score_batch", response_model=BatchRiskResponse)
+async def score_batch(batch: DailyLogBatch):
+    """Score a whole cohort in one vectorized pass (nothing is saved)."""
+    columns = batch.dict(exclude={"pain_history", "temperature_history"}, exclude_none=True)
+    n = len(batch.patient_id)
+    if any(len(values) != n for values in columns.values()):
+        raise HTTPException(status_code=400, detail="All batch columns must have the same length")
+
+    pain_history = temperature_history = lengths = None
+    if batch.pain_history is not None or batch.temperature_history is not None:
+        pains = batch.pain_history or [[] for _ in range(n)]
+        temps = batch.temperature_history or [[] for _ in range(n)]
+        if len(pains) != n or len(temps) != n:
+            raise HTTPException(status_code=400, detail="History must have one entry per patient")
+        pain_history, lengths = stack_values(pains)
+        temperature_history, _ = stack_values(temps)
+
+    # Large cohorts are split across the scoring workers
+    results = risk_results(await scoring_pool.score_columns_async(columns, pain_history, temperature_history, lengths))
+    return {
+        "results": [
+            {"patient_id": patient_id, **risk_data}
+            for patient_id, risk_data in zip(batch.patient_id, results)
+        ]
+    }
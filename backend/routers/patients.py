@@ -1,43 +1,77 @@
-from fastapi import APIRouter, HTTPException
-from services.firebase_service import FirebaseService
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import Optional
+from services.async_firebase_service import AsyncFirebaseService
+from services.json_response import FastJSONResponse
+from services.response_cache import response_cache
 from services.risk_engine import RiskEngine
-from models.log_model import DailyLog
+from services.rule_spec import daily_log_rules
 
 router = APIRouter()
-firebase_service = FirebaseService()
+firebase_service = AsyncFirebaseService()
 risk_engine = RiskEngine()
 
+MAX_RECOVERY_SCORE_IDS = 500
+
+# /risk, /patient_logs and /recovery_score carry an ETag (the patient's stored
+# log version) and answer If-None-Match with 304; see services.response_cache
+
 @router.get("/risk/{patient_id}")
-async def get_patient_risk(patient_id: str):
+async def get_patient_risk(patient_id: str, request: Request):
     """Get latest risk status for a patient"""
-    logs = firebase_service.get_historical_logs(patient_id)
-    if not logs:
-        return {"patient_id": patient_id, "risk_level": "green", "risk_score": 0.0, "message": "No logs yet"}
-    
-    latest_log_dict = logs[0]
-    # Convert dict to DailyLog model
-    latest_log = DailyLog(**latest_log_dict)
-    
-    risk_data = risk_engine.calculate_risk(latest_log, logs[1:])
-    return {
-        "patient_id": patient_id,
-        **risk_data
-    }
+    version = await firebase_service.get_log_version(patient_id)
+    # Rescoring under edited rules changes the response too
+    daily_log_rules.get()
+    etag = f"{version}-{daily_log_rules.fingerprint}"
+
+    async def build():
+        # At the ETag's version: this worker's cache may predate another worker's write
+        logs = await firebase_service.get_historical_logs(patient_id, log_version=version)
+        if not logs:
+            return {"patient_id": patient_id, "risk_level": "green", "risk_score": 0.0, "message": "No logs yet"}
+
+        # History entries are LogRecords, scored as they are (no re-validation)
+        risk_data = risk_engine.calculate_risk(logs[0], logs[1:])
+        return {
+            "patient_id": patient_id,
+            **risk_data
+        }
+
+    return await response_cache.respond(request, ("risk", patient_id), etag, build)
 
 @router.get("/patient_logs/{patient_id}")
-async def get_patient_logs(patient_id: str):
-    """Get historical logs for a patient"""
-    logs = firebase_service.get_historical_logs(patient_id)
-    return {"patient_id": patient_id, "logs": logs}
+async def get_patient_logs(patient_id: str, request: Request):
+    """Get historical logs for a patient (whole documents)"""
+    version = await firebase_service.get_log_version(patient_id)
 
-@router.get("/flagged_patients")
-async def get_flagged_patients():
-    """Get all patients with yellow or red risk status"""
-    flagged = firebase_service.get_flagged_patients()
-    return {"flagged": flagged}
+    async def build():
+        logs = await firebase_service.get_historical_logs(patient_id, "detail")
+        return {"patient_id": patient_id, "logs": logs}
+
+    return await response_cache.respond(request, ("logs", patient_id), version, build)
+
+@router.get("/flagged_patients", response_class=FastJSONResponse)
+async def get_flagged_patients(limit: int = Query(50, ge=1, le=1000), cursor: Optional[str] = None):
+    """Get patients with yellow or red risk status, one page at a time"""
+    return FastJSONResponse(await firebase_service.get_flagged_patients(limit, cursor))
 
 @router.get("/recovery_score/{patient_id}")
-async def get_recovery_score(patient_id: str):
+async def get_recovery_score(patient_id: str, request: Request):
     """Get recovery score for a patient"""
-    score = firebase_service.calculate_recovery_score(patient_id)
-    return {"patient_id": patient_id, "recovery_score": score}
+    version = await firebase_service.get_log_version(patient_id)
+
+    async def build():
+        score = await firebase_service.calculate_recovery_score(patient_id, version)
+        return {"patient_id": patient_id, "recovery_score": score}
+
+    return await response_cache.respond(request, ("recovery", patient_id), version, build)
+
+@router.get("/recovery_scores", response_class=FastJSONResponse)
+async def get_recovery_scores(ids: str = Query(..., description="comma-separated patient ids")):
+    """Recovery scores of many patients (e.g. a ward overview) in one batched read"""
+    patient_ids = list(dict.fromkeys(patient_id for patient_id in ids.split(",") if patient_id))
+    if not patient_ids:
+        raise HTTPException(status_code=400, detail="No patient ids given")
+    if len(patient_ids) > MAX_RECOVERY_SCORE_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_RECOVERY_SCORE_IDS} patient ids per request")
+    scores = await firebase_service.get_recovery_scores(patient_ids)
+    return FastJSONResponse({"recovery_scores": [{"patient_id": patient_id, "recovery_score": scores[patient_id]} for patient_id in patient_ids]})
@@ -0,0 +1,412 @@
+"""
+Alert fan-out off the request path.
+
+Request handlers call alert_pipeline.submit() with a yellow/red risk result and
+return immediately. A worker drains the queue and writes alerts in Firestore
+batches, coalescing repeats: while a patient has an open alert (opened less
+than ALERT_DEDUP_SECONDS ago) further results at the same or a lower level
+bump its `occurrences` counter instead of creating a new alert and paging the
+doctor again. A higher level opens a new alert.
+
+Red alerts page the patient's doctor. Pushes are collected for
+ALERT_PUSH_INTERVAL_SECONDS, grouped per device (several patients become one
+digest) and sent as FCM multicasts of up to 500 tokens, retried with backoff.
+A red alert nobody acknowledges within ALERT_ESCALATION_SECONDS is escalated
+to the caregiver by a scheduler; pending escalations are reloaded from
+Firestore at startup. Dedup state is per process.
+
+Nothing queued is lost with the process: every result comes with an
+alert_outbox entry committed together with its log, and the transaction that
+writes the alert deletes it. A batch that still fails after its retries is
+queued again after ALERT_RETRY_SECONDS. Every ALERT_OUTBOX_SWEEP_SECONDS the
+pipeline queues outbox entries older than that which it does not hold itself,
+i.e. those left behind by a worker that stopped or crashed. A result is
+counted only if its entry is still there when its batch commits, and a new
+alert is named after the entry of its first result, so an entry swept by
+several workers (or still being retried by its owner) is written once.
+
+PUSH_TRANSPORT=fcm sends through firebase_admin.messaging; the default "stub"
+transport only logs the pushes.
+"""
+import asyncio
+import heapq
+import os
+import random
+import time
+from collections import defaultdict, deque, namedtuple
+
+from services.firebase_service import FirebaseService
+from services.rule_spec import RISK_LEVELS
+
+OpenAlert = namedtuple("OpenAlert", "level alert_id expires_at")
+Push = namedtuple("Push", "role patient_id title body")
+
+# FCM accepts at most 500 tokens per multicast
+MAX_MULTICAST_TOKENS = 500
+
+
+class StubTransport:
+    """Logs pushes instead of sending them; keeps the most recent ones for inspection."""
+
+    def __init__(self, keep=1000):
+        self.sent = deque(maxlen=keep)
+
+    def send(self, tokens, title, body, data):
+        print(f"PUSH to {len(tokens)} device(s): {title}: {body}")
+        self.sent.append({"tokens": list(tokens), "title": title, "body": body, "data": dict(data)})
+        return []
+
+
+class FcmTransport:
+    """Firebase Cloud Messaging multicast (needs an initialized firebase_admin app)."""
+
+    def send(self, tokens, title, body, data):
+        """Sends one multicast. Returns the tokens worth retrying."""
+        from firebase_admin import exceptions, messaging
+
+        message = messaging.MulticastMessage(
+            tokens=list(tokens),
+            notification=messaging.Notification(title=title, body=body),
+            data=data,
+        )
+        response = messaging.send_each_for_multicast(message)
+        retryable = (exceptions.UnavailableError, exceptions.InternalError, messaging.QuotaExceededError)
+        return [
+            token
+            for token, result in zip(tokens, response.responses)
+            if not result.success and isinstance(result.exception, retryable)
+        ]
+
+
+def _message(pushes):
+    """(title, body, data) for one device: a single push as is, several as a digest."""
+    patient_ids = sorted({push.patient_id for push in pushes})
+    if len(pushes) == 1:
+        push = pushes[0]
+        return push.title, push.body, (("type", push.role), ("patient_ids", push.patient_id))
+    roles = {push.role for push in pushes}
+    role = roles.pop() if len(roles) == 1 else "digest"
+    title = pushes[0].title if len({push.title for push in pushes}) == 1 else "Post-Op Guardian alerts"
+    body = f"{len(patient_ids)} patients need attention: {', '.join(patient_ids)}"
+    return title, body, (("type", role), ("patient_ids", ",".join(patient_ids)))
+
+
+class AlertPipeline:
+    # Queued results written per Firestore commit: each costs at most three of
+    # its 500 writes (alert or occurrence bump, patient_status, outbox delete)
+    MAX_EVENTS_PER_BATCH = 500 // 3
+    # Expired dedup entries are swept once more patients than this are tracked
+    MAX_OPEN_ALERTS = 10000
+
+    def __init__(self, service=None, transport=None, dedup_seconds=3600, escalation_seconds=3600,
+                 push_interval=1.0, retries=3, backoff_seconds=0.5, retry_seconds=30, outbox_sweep_seconds=60):
+        self.service = service or FirebaseService()
+        self.transport = transport or StubTransport()
+        self.dedup_seconds = dedup_seconds
+        self.escalation_seconds = escalation_seconds
+        self.push_interval = push_interval
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.retry_seconds = retry_seconds
+        self.outbox_sweep_seconds = outbox_sweep_seconds
+
+        # alert_outbox ids of the results queued or being written here
+        self._outbox_ids = set()
+        self._open = {}
+        self._escalations = []
+        self._pushes = []
+        self._loop = None
+        self._tasks = []
+        self._listeners = []
+        self._counts = defaultdict(int)
+
+    def add_listener(self, callback):
+        """
+        Registers `async callback(alerts, repeats)`, awaited after every commit with
+        the alerts created and the repeats coalesced (see FirebaseService.write_alerts).
+        """
+        self._listeners.append(callback)
+
+    def submit(self, patient_id, risk_data, outbox_id=None, received_at=None):
+        """
+        Queues a yellow/red risk result saved with the alert_outbox entry
+        `outbox_id`. Must be called from the event loop; never blocks.
+        """
+        self._ensure_running()
+        if outbox_id is not None:
+            self._outbox_ids.add(outbox_id)
+        self._queue.put_nowait((patient_id, risk_data, received_at or time.time(), outbox_id))
+        self._counts["received"] += 1
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            loop.create_task(self._consume()),
+            loop.create_task(self._push_loop()),
+            loop.create_task(self._escalation_loop()),
+        ]
+
+    async def start(self):
+        """
+        Starts the workers; escalations of red alerts still pending are reloaded
+        in the background, and alert_outbox entries are swept from then on.
+        """
+        self._ensure_running()
+        self._tasks.append(self._loop.create_task(self._restore_escalations()))
+        self._tasks.append(self._loop.create_task(self._outbox_loop()))
+
+    async def sweep_outbox(self):
+        """Queues outbox entries older than outbox_sweep_seconds that this process does not hold."""
+        entries = await self._call(self.service.get_alert_outbox, time.time() - self.outbox_sweep_seconds)
+        swept = 0
+        for outbox_id, patient_id, risk_data, created_at in entries:
+            if outbox_id in self._outbox_ids or not patient_id or not risk_data:
+                continue
+            self.submit(patient_id, risk_data, outbox_id, created_at)
+            swept += 1
+        if swept:
+            self._counts["recovered"] += swept
+            print(f"Queued {swept} alert(s) left in the outbox")
+        return swept
+
+    async def _outbox_loop(self):
+        while True:
+            try:
+                await self.sweep_outbox()
+            except Exception as e:
+                print(f"Alert outbox sweep failed: {e}")
+            await asyncio.sleep(self.outbox_sweep_seconds)
+
+    async def _restore_escalations(self):
+        try:
+            pending = await self._call(self.service.get_pending_escalations)
+        except Exception as e:
+            print(f"Could not restore alert escalations: {e}")
+            return
+        for alert_id, patient_id, created_at in pending:
+            created = created_at.timestamp() if hasattr(created_at, "timestamp") else time.time()
+            self._schedule_escalation(created + self.escalation_seconds, alert_id, patient_id)
+        if pending:
+            print(f"Restored {len(pending)} pending alert escalation(s)")
+
+    async def stop(self, timeout=10.0):
+        """Writes what is still queued, sends the collected pushes and stops the workers."""
+        if self._loop is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Alert pipeline stopped with {len(self._outbox_ids)} result(s) unwritten; "
+                  "they stay in the alert outbox")
+        await self._flush_pushes()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def acknowledged(self, alert_ids):
+        """Ends the dedup window of acknowledged alerts: the next result opens a new alert."""
+        alert_ids = set(alert_ids)
+        self._open = {
+            patient_id: alert
+            for patient_id, alert in self._open.items()
+            if alert.alert_id not in alert_ids
+        }
+
+    def stats(self):
+        return {
+            **self._counts,
+            "queued": self._queue.qsize() if self._loop else 0,
+            "unwritten": len(self._outbox_ids),
+            "open_alerts": len(self._open),
+            "scheduled_escalations": len(self._escalations),
+        }
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _backoff(self, attempt):
+        delay = self.backoff_seconds * 2 ** attempt
+        await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    async def _consume(self):
+        while True:
+            events = [await self._queue.get()]
+            while len(events) < self.MAX_EVENTS_PER_BATCH and not self._queue.empty():
+                events.append(self._queue.get_nowait())
+            try:
+                await self._process(events)
+            except Exception as e:
+                # Kept in the outbox and queued again: an alert is never given up on
+                self._counts["requeued"] += len(events)
+                print(f"Alert batch of {len(events)} failed, retrying in {self.retry_seconds:g}s: {e}")
+                self._loop.call_later(self.retry_seconds, self._requeue, events)
+            finally:
+                for _ in events:
+                    self._queue.task_done()
+
+    def _requeue(self, events):
+        for event in events:
+            self._queue.put_nowait(event)
+
+    async def _process(self, events):
+        created = {}
+        repeats = {}
+        outbox_ids = [event[3] for event in events if event[3] is not None]
+        for patient_id, risk_data, received_at, outbox_id in events:
+            level = RISK_LEVELS.index(risk_data["risk_level"])
+            current = self._open.get(patient_id)
+            if current and current.expires_at > received_at and current.level >= level:
+                self._counts["coalesced"] += 1
+                if current.alert_id in created:
+                    created[current.alert_id][3].append(outbox_id)
+                else:
+                    repeats.setdefault(current.alert_id, (patient_id, []))[1].append(outbox_id)
+                continue
+            # Named after the outbox entry, so a second worker writing it finds the alert
+            alert_id = outbox_id or self.service.new_alert_id()
+            created[alert_id] = (alert_id, patient_id, risk_data, [outbox_id])
+            self._open[patient_id] = OpenAlert(level, alert_id, received_at + self.dedup_seconds)
+
+        for attempt in range(self.retries + 1):
+            try:
+                alerts, repeats = await self._call(self.service.write_alerts, list(created.values()), repeats)
+                break
+            except Exception:
+                if attempt == self.retries:
+                    self._forget(created.values())
+                    raise
+                await self._backoff(attempt)
+        # Alerts left out because all their results were written by another worker
+        written = {alert[0] for alert in alerts}.union(repeats)
+        self._forget(alert for alert in created.values() if alert[0] not in written)
+        self._outbox_ids.difference_update(outbox_ids)
+        self._counts["created"] += len(alerts)
+        for listener in self._listeners:
+            try:
+                await listener(alerts, repeats)
+            except Exception as e:
+                print(f"Alert listener {listener!r} failed: {e}")
+
+        now = time.time()
+        for alert_id, patient_id, risk_data, _ in alerts:
+            if risk_data["risk_level"] == "red":
+                self._pushes.append(Push("doctor", patient_id, "EMERGENCY", f"Patient {patient_id} needs attention."))
+                self._schedule_escalation(now + self.escalation_seconds, alert_id, patient_id)
+
+        if len(self._open) > self.MAX_OPEN_ALERTS:
+            self._open = {key: alert for key, alert in self._open.items() if alert.expires_at > now}
+
+    def _forget(self, alerts):
+        """Drops the dedup entries of alerts that were never written, so the next result opens a new one."""
+        for alert_id, patient_id, _, _ in alerts:
+            current = self._open.get(patient_id)
+            if current and current.alert_id == alert_id:
+                del self._open[patient_id]
+
+    def _schedule_escalation(self, due, alert_id, patient_id):
+        heapq.heappush(self._escalations, (due, alert_id, patient_id))
+        self._wakeup.set()
+
+    async def _escalation_loop(self):
+        while True:
+            delay = self._escalations[0][0] - time.time() if self._escalations else None
+            if delay is None or delay > 0:
+                # Sleep until the earliest escalation is due or an earlier one is scheduled
+                # (asyncio.wait rather than wait_for, which can swallow a cancellation)
+                waiter = asyncio.ensure_future(self._wakeup.wait())
+                try:
+                    await asyncio.wait([waiter], timeout=delay)
+                finally:
+                    waiter.cancel()
+                self._wakeup.clear()
+                continue
+
+            _, alert_id, patient_id = heapq.heappop(self._escalations)
+            try:
+                escalate = await self._call(self.service.escalate_alert, alert_id)
+            except Exception as e:
+                print(f"Escalation check for alert {alert_id} failed: {e}")
+                self._schedule_escalation(time.time() + self.backoff_seconds * 60, alert_id, patient_id)
+                continue
+            if escalate:
+                self._counts["escalated"] += 1
+                self._pushes.append(Push(
+                    "caregiver", patient_id, "No response from the care team",
+                    f"An urgent alert for patient {patient_id} has not been answered. "
+                    "Please check on them and contact the hospital."
+                ))
+
+    async def _push_loop(self):
+        while True:
+            await asyncio.sleep(self.push_interval)
+            try:
+                await self._flush_pushes()
+            except Exception as e:
+                print(f"Push delivery failed: {e}")
+
+    async def _flush_pushes(self):
+        if not self._pushes:
+            return
+        pushes, self._pushes = self._pushes, []
+
+        requests = list({(push.patient_id, push.role) for push in pushes})
+        tokens = await self._call(self.service.get_notification_tokens, requests)
+
+        per_device = defaultdict(list)
+        for push in pushes:
+            device_tokens = tokens.get((push.patient_id, push.role))
+            if not device_tokens:
+                self._counts["undeliverable"] += 1
+                print(f"No device registered for the {push.role} of patient {push.patient_id}: {push.title}: {push.body}")
+                continue
+            for token in device_tokens:
+                per_device[token].append(push)
+
+        # Devices receiving the same message share a multicast
+        multicasts = defaultdict(list)
+        for token, device_pushes in per_device.items():
+            multicasts[_message(device_pushes)].append(token)
+
+        for (title, body, data), device_tokens in multicasts.items():
+            for start in range(0, len(device_tokens), MAX_MULTICAST_TOKENS):
+                await self._send(device_tokens[start:start + MAX_MULTICAST_TOKENS], title, body, dict(data))
+
+    async def _send(self, tokens, title, body, data):
+        for attempt in range(self.retries + 1):
+            try:
+                failed = await self._call(self.transport.send, tokens, title, body, data)
+            except Exception as e:
+                print(f"Push attempt {attempt + 1} failed: {e}")
+                failed = tokens
+            self._counts["pushed"] += len(tokens) - len(failed)
+            if not failed:
+                return
+            tokens = failed
+            if attempt < self.retries:
+                await self._backoff(attempt)
+        self._counts["push_failures"] += len(tokens)
+        print(f"Giving up on {len(tokens)} device(s) for push {title!r}")
+
+
+def create_alert_pipeline():
+    """Alert pipeline configured from the environment (see module docstring)."""
+    transport = FcmTransport() if os.getenv("PUSH_TRANSPORT", "stub") == "fcm" else StubTransport()
+    return AlertPipeline(
+        transport=transport,
+        dedup_seconds=float(os.getenv("ALERT_DEDUP_SECONDS", "3600")),
+        escalation_seconds=float(os.getenv("ALERT_ESCALATION_SECONDS", "3600")),
+        push_interval=float(os.getenv("ALERT_PUSH_INTERVAL_SECONDS", "1")),
+        retries=int(os.getenv("ALERT_PUSH_RETRIES", "3")),
+        retry_seconds=float(os.getenv("ALERT_RETRY_SECONDS", "30")),
+        outbox_sweep_seconds=float(os.getenv("ALERT_OUTBOX_SWEEP_SECONDS", "60")),
+    )
+
+
+alert_pipeline = create_alert_pipeline()
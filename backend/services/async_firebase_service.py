@@ -0,0 +1,75 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from services import metrics
+from services.firebase_service import FirebaseService
+
+# Bounded pool so a burst of requests cannot open unlimited Firestore calls
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FIRESTORE_MAX_WORKERS", "16")),
+    thread_name_prefix="firestore",
+)
+
+
+class AsyncFirebaseService:
+    """
+    Awaitable facade over FirebaseService.
+    Each blocking Firestore call runs on a bounded thread pool so that slow
+    queries never stall the event loop. Calls are timed as "firestore.<method>"
+    spans and carry the request context into the pool thread.
+    """
+
+    def __init__(self, service=None, executor=None):
+        self.service = service or FirebaseService()
+        self.executor = executor or _executor
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        with metrics.span("firestore." + func.__name__):
+            return await loop.run_in_executor(self.executor, partial(context.run, func, *args, **kwargs))
+
+    async def save_log(self, patient_id, log, trend_stats=None, log_version=None, alert=None):
+        return await self._run(self.service.save_log, patient_id, log, trend_stats, log_version, alert)
+
+    async def create_log(self, patient_id, document_id, log, trend_stats, risk_data, log_version=None, alert=None):
+        return await self._run(self.service.create_log, patient_id, document_id, log, trend_stats, risk_data, log_version, alert)
+
+    async def get_historical_logs(self, patient_id, projection="scoring", log_version=None):
+        return await self._run(self.service.get_historical_logs, patient_id, projection, log_version)
+
+    async def get_log_version(self, patient_id):
+        return await self._run(self.service.get_log_version, patient_id)
+
+    async def get_trend_stats(self, patient_id):
+        return await self._run(self.service.get_trend_stats, patient_id)
+
+    async def create_alert(self, patient_id, risk_data):
+        return await self._run(self.service.create_alert, patient_id, risk_data)
+
+    async def acknowledge_alerts(self, alert_ids, doctor_id):
+        return await self._run(self.service.acknowledge_alerts, alert_ids, doctor_id)
+
+    async def get_patient_info(self, patient_id):
+        return await self._run(self.service.get_patient_info, patient_id)
+
+    async def get_patients_info(self, patient_ids, fields=None):
+        return await self._run(self.service.get_patients_info, patient_ids, fields)
+
+    async def get_flagged_patients(self, limit=50, cursor=None):
+        return await self._run(self.service.get_flagged_patients, limit, cursor)
+
+    def bulk_writer(self):
+        return self.service.bulk_writer()
+
+    async def flush(self, writer):
+        return await self._run(writer.flush)
+
+    async def calculate_recovery_score(self, patient_id, log_version=None):
+        return await self._run(self.service.calculate_recovery_score, patient_id, log_version)
+
+    async def get_recovery_scores(self, patient_ids):
+        return await self._run(self.service.get_recovery_scores, patient_ids)
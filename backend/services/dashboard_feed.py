@@ -0,0 +1,144 @@
+"""
+Live flagged-patient feed for the doctor dashboard.
+
+One in-memory view of the flagged patients (the /flagged_patients entries) is
+loaded from Firestore when the first dashboard connects and then kept current
+from alert pipeline commits and acknowledgements. Each change is serialized
+once as a Server-Sent Event and handed to every subscriber, so the Firestore
+cost does not grow with the number of open dashboards.
+
+Events: `snapshot` (full view, sent on connect), `upsert` (one patient entry)
+and `remove` (patient_id). Every event carries the view `version`. A client
+that falls too far behind is disconnected and gets a fresh snapshot when it
+reconnects.
+"""
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from services.async_firebase_service import AsyncFirebaseService
+from services.firebase_service import DASHBOARD_PATIENT_FIELDS
+
+
+def _jsonable(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _event(kind, payload):
+    return f"event: {kind}\ndata: {json.dumps(payload, default=_jsonable)}\n\n"
+
+
+class DashboardFeed:
+    # Events buffered per subscriber before it is dropped as too slow
+    MAX_PENDING_EVENTS = 1000
+    # Page size used to load the view from patient_status
+    LOAD_PAGE_SIZE = 500
+
+    def __init__(self, service=None):
+        self.service = service or AsyncFirebaseService()
+        self._view = {}
+        self._version = 0
+        self._subscribers = set()
+        self._loaded = False
+        self._loading = None
+        self._removed_while_loading = set()
+
+    async def load(self):
+        """Fills the view from Firestore once; entries changed meanwhile are kept as they are."""
+        if self._loaded:
+            return
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load_view())
+        try:
+            await asyncio.shield(self._loading)
+        except Exception:
+            self._loading = None
+            raise
+
+    async def _load_view(self):
+        cursor = None
+        while True:
+            page = await self.service.get_flagged_patients(self.LOAD_PAGE_SIZE, cursor)
+            for entry in page["flagged"]:
+                patient_id = entry["patient_id"]
+                if patient_id not in self._view and patient_id not in self._removed_while_loading:
+                    self._view[patient_id] = {key: _jsonable(value) for key, value in entry.items()}
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        self._removed_while_loading.clear()
+        self._loaded = True
+
+    async def subscribe(self):
+        """Queue of SSE-formatted events, starting with a snapshot of the view."""
+        await self.load()
+        queue = asyncio.Queue(self.MAX_PENDING_EVENTS)
+        queue.put_nowait(self.snapshot_event())
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def snapshot(self):
+        flagged = sorted(self._view.values(), key=lambda entry: entry.get("last_update") or "", reverse=True)
+        return {"version": self._version, "flagged": flagged}
+
+    def snapshot_event(self):
+        return _event("snapshot", self.snapshot())
+
+    def _publish(self, kind, payload):
+        self._version += 1
+        event = _event(kind, {"version": self._version, **payload})
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too slow: end its stream (None) so it reconnects for a fresh snapshot
+                self._subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def alerts_written(self, alerts, repeats):
+        """AlertPipeline listener: mirrors the patient_status changes of one commit."""
+        now = datetime.now(timezone.utc).isoformat()
+        new_patients = [
+            patient_id for _, patient_id, _, _ in alerts
+            if patient_id not in self._view
+        ]
+        info = await self.service.get_patients_info(new_patients, DASHBOARD_PATIENT_FIELDS) if new_patients else {}
+
+        for alert_id, patient_id, risk_data, _ in alerts:
+            entry = self._view.get(patient_id)
+            if entry is None:
+                patient = info.get(patient_id, {})
+                entry = {
+                    "patient_id": patient_id,
+                    "patient_name": patient.get("name") or f"Patient {patient_id[-4:]}",
+                    "surgery_type": patient.get("surgery_type") or "Unknown",
+                }
+            self._view[patient_id] = entry = {
+                **entry,
+                "risk_level": risk_data["risk_level"],
+                "last_update": now,
+                "message": risk_data["message"],
+                "alert_id": alert_id,
+            }
+            self._removed_while_loading.discard(patient_id)
+            self._publish("upsert", {"patient": entry})
+
+        for patient_id, _ in repeats.values():
+            entry = self._view.get(patient_id)
+            if entry is not None:
+                entry["last_update"] = now
+                self._publish("upsert", {"patient": entry})
+
+    def remove(self, patient_id):
+        """Drops a patient that is no longer flagged."""
+        if not self._loaded:
+            self._removed_while_loading.add(patient_id)
+        if self._view.pop(patient_id, None) is not None:
+            self._publish("remove", {"patient_id": patient_id})
+
+
+dashboard_feed = DashboardFeed()
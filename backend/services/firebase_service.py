@@ -1,72 +1,547 @@
-import firebase_admin
-from firebase_admin import credentials, firestore, messaging
 import os
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
+from models.log_record import LogRecord
+from services import metrics, startup
+from services.history_cache import create_history_cache
+from services.recovery_score import PENALTY_FIELDS, recovery_score
+from services.response_cache import response_cache
+from services.rolling_stats import TREND_FIELDS, RollingTrendStats
 
 load_dotenv()
 
-# Initialize Firebase Admin SDK (only once)
-if not firebase_admin._apps:
-    try:
-        cred_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH", "firebase_key.json")
-        if os.path.exists(cred_path):
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred)
-        else:
-            print("Firebase credentials file not found. Using mock mode.")
-    except Exception as e:
-        print(f"Firebase Admin SDK initialization error: {e}")
+# firebase_admin (and gRPC behind it) is imported on first use, not at import time,
+# so workers start serving health checks before the Firestore client exists.
+_db = None
+_db_ready = False
+_db_lock = threading.Lock()
+
+
+def _firestore():
+    from firebase_admin import firestore
+    return firestore
+
+
+def _create_client():
+    """Returns the Firestore client, the in-memory stand-in, or None (mock mode)."""
+    if os.getenv("FIRESTORE_BACKEND") == "memory":
+        from services.memory_firestore import MemoryFirestoreClient
+        return MemoryFirestoreClient(latency_ms=float(os.getenv("FIRESTORE_LATENCY_MS", "0")))
+
+    import firebase_admin
+    from firebase_admin import credentials
+
+    # Initialize Firebase Admin SDK (only once)
+    if not firebase_admin._apps:
+        try:
+            cred_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH", "firebase_key.json")
+            if os.path.exists(cred_path):
+                cred = credentials.Certificate(cred_path)
+                firebase_admin.initialize_app(cred)
+            else:
+                print("Firebase credentials file not found. Using mock mode.")
+        except Exception as e:
+            print(f"Firebase Admin SDK initialization error: {e}")
+    return _firestore().client() if firebase_admin._apps else None
+
+
+def get_db():
+    """The shared Firestore client, created on the first call."""
+    global _db, _db_ready
+    if _db_ready:
+        return _db
+    with _db_lock:
+        if not _db_ready:
+            started = time.perf_counter()
+            _db = _create_client()
+            _db_ready = True
+            startup.record("firestore_init_ms", (time.perf_counter() - started) * 1000)
+    return _db
+
+
+# Field projections (select()) per use case; None reads whole documents.
+# daily_logs:
+LOG_PROJECTIONS = {
+    # RollingTrendStats bootstrap: trend values and recovery penalties
+    "trend": tuple(dict.fromkeys(("timestamp",) + TREND_FIELDS + PENALTY_FIELDS)),
+    # Recovery score fallback for patients without a stored score
+    "recovery": ("timestamp",) + PENALTY_FIELDS,
+    # Everything the rule, trend and ML layers read (no stored "risk" blob)
+    "scoring": tuple(name for name in LogRecord.__slots__ if name != "risk"),
+    "detail": None,
+}
+# patient_status and patients documents behind a dashboard entry
+DASHBOARD_STATUS_FIELDS = ("risk_level", "last_update", "message", "alert_id")
+DASHBOARD_PATIENT_FIELDS = ("name", "surgery_type")
+# patients fields used to find notification targets
+NOTIFICATION_PATIENT_FIELDS = ("doctor_id", "caregiver_fcm_tokens")
+
+
+def _stream(query):
+    """Query results as a list; Firestore bills one read per document and at least one per query."""
+    docs = list(query.stream())
+    metrics.count_firestore(reads=max(1, len(docs)))
+    return docs
+
+
+def _get(ref, field_paths=None, transaction=None):
+    metrics.count_firestore(reads=1)
+    if transaction is not None:
+        return ref.get(field_paths=field_paths, transaction=transaction)
+    return ref.get(field_paths=field_paths)
+
+
+def _get_all(db, refs, field_paths=None, transaction=None):
+    if not refs:
+        return []
+    if transaction is not None:
+        docs = list(db.get_all(refs, field_paths=field_paths, transaction=transaction))
+    else:
+        docs = list(db.get_all(refs, field_paths=field_paths))
+    metrics.count_firestore(reads=len(docs))
+    return docs
+
+
+def _commit(batch):
+    metrics.count_firestore(writes=len(batch))
+    return batch.commit()
+
+
+history_cache = create_history_cache()
+
+# Firestore's limit on the writes of one commit (batch or transaction)
+MAX_ALERT_WRITES = 500
+
+
+def _outbox_entry(patient_id, risk_data):
+    """
+    alert_outbox/{log document id}: a yellow/red result saved with its log and
+    deleted by the alert pipeline in the commit that writes the alert, so an
+    alert still queued when a worker stops is picked up again (see
+    services.alert_pipeline).
+    """
+    return {"patient_id": patient_id, "risk": risk_data, "created_at": time.time()}
+
+
+class StaleTrendStats(Exception):
+    """Another log for the patient was written since its trend state was read."""
 
-db = firestore.client() if firebase_admin._apps else None
 
 class FirebaseService:
-    def save_log(self, patient_id, log_data):
-        if db:
-            db.collection("daily_logs").add(log_data)
-        return True
+    def __init__(self, client=None, cache=None):
+        self._client = client
+        self.history_cache = cache or history_cache
+
+    @property
+    def db(self):
+        return self._client if self._client is not None else get_db()
+
+    def _log_status(self, patient_id, log, trend_stats):
+        status = {
+            "patient_id": patient_id,
+            "last_log_at": log.timestamp,
+            # ETag of the patient's read endpoints (services.response_cache)
+            "log_version": _firestore().Increment(1)
+        }
+        if trend_stats is not None:
+            status["trend_stats"] = trend_stats.to_dict()
+            status["recovery_score"] = trend_stats.recovery_score()
+        return status
+
+    def _write_log(self, patient_id, ref, log, trend_stats, log_version, create, alert):
+        """
+        Commits the log, the patient's status update and, with an `alert` (the
+        yellow/red risk result), its alert_outbox entry together. With a
+        log_version (as returned by get_trend_stats) this is a transaction that
+        raises StaleTrendStats when patient_status has moved on since, so the
+        trend window and recovery score are never overwritten by an older state.
+        """
+        status_ref = self._status_ref(patient_id)
+        status = self._log_status(patient_id, log, trend_stats)
+        outbox_ref = self.db.collection("alert_outbox").document(ref.id)
 
-    def get_historical_logs(self, patient_id):
-        if not db:
+        def add_writes(writer):
+            if create:
+                writer.create(ref, log.to_dict())
+            else:
+                writer.set(ref, log.to_dict())
+            writer.set(status_ref, status, merge=True)
+            if alert is not None:
+                writer.set(outbox_ref, _outbox_entry(patient_id, alert))
+
+        if log_version is None:
+            batch = self.db.batch()
+            add_writes(batch)
+            _commit(batch)
+            return
+
+        @_firestore().transactional
+        def write(transaction):
+            current = _get(status_ref, field_paths=["log_version"], transaction=transaction)
+            if (((current.to_dict() or {}).get("log_version") if current.exists else None) or 0) != log_version:
+                raise StaleTrendStats(patient_id)
+            add_writes(transaction)
+
+        write(self.db.transaction())
+        # Counted once committed: the writes of an aborted attempt are not applied
+        metrics.count_firestore(writes=2 if alert is None else 3)
+
+    def save_log(self, patient_id, log, trend_stats=None, log_version=None, alert=None):
+        """
+        Writes one log (LogRecord) with the patient's updated trend state.
+        Returns the new document id (also the id of its alert_outbox entry).
+        """
+        if not self.db:
+            return None
+        ref = self.db.collection("daily_logs").document()
+        self._write_log(patient_id, ref, log, trend_stats, log_version, False, alert)
+        self.history_cache.push(patient_id, log, log_version)
+        response_cache.invalidate(patient_id)
+        return ref.id
+
+    def create_log(self, patient_id, document_id, log, trend_stats, risk_data, log_version=None, alert=None):
+        """
+        save_log for idempotent submissions: the log is created as
+        daily_logs/{document_id} with `risk_data` stored under "risk". If that
+        document already exists (a retry) nothing is written and the stored risk
+        is returned; returns None when the log was written.
+        """
+        if not self.db:
+            return None
+        from google.api_core.exceptions import AlreadyExists
+
+        log.risk = risk_data
+        ref = self.db.collection("daily_logs").document(document_id)
+        try:
+            self._write_log(patient_id, ref, log, trend_stats, log_version, True, alert)
+        except AlreadyExists:
+            existing = _get(ref)
+            return (existing.to_dict() or {}).get("risk") or risk_data
+        self.history_cache.push(patient_id, log, log_version)
+        response_cache.invalidate(patient_id)
+        return None
+
+    def _status_ref(self, patient_id):
+        """patient_status/{patient_id}: latest status per patient, kept up to date on write."""
+        return self.db.collection("patient_status").document(patient_id)
+
+    def get_historical_logs(self, patient_id, projection="scoring", log_version=None):
+        """
+        The patient's 10 newest logs as LogRecords, newest first, read with the
+        LOG_PROJECTIONS field selection `projection` (fields left out are None).
+        The history cache holds "scoring" logs and also serves the narrower
+        projections; "detail" always reads whole documents and returns them
+        as stored (plain dicts, every field kept). With the `log_version` just
+        read from patient_status (as for an ETag), a cached history of another
+        version is read again instead of served.
+        """
+        if not self.db:
             return []
+
+        if projection != "detail":
+            cached = self.history_cache.get(patient_id, log_version)
+            if cached is not None:
+                return cached
         
-        docs = db.collection("daily_logs")\
+        query = self.db.collection("daily_logs")\
                 .where("patient_id", "==", patient_id)\
-                .order_by("timestamp", direction=firestore.Query.DESCENDING)\
-                .limit(10)\
-                .stream()
+                .order_by("timestamp", direction=_firestore().Query.DESCENDING)\
+                .limit(10)
+        fields = LOG_PROJECTIONS[projection]
+        if fields is not None:
+            query = query.select(fields)
         
-        return [doc.to_dict() for doc in docs]
+        if projection == "detail":
+            return [doc.to_dict() for doc in _stream(query)]
+        logs = [LogRecord.from_dict(doc.to_dict()) for doc in _stream(query)]
+        # Only complete scoring histories are cached, tagged with the version
+        # read before the query (they hold at least that version's logs)
+        if projection == "scoring":
+            self.history_cache.set(patient_id, logs, log_version)
+        return logs
+
+    def get_log_version(self, patient_id):
+        """Number of log writes for the patient (patient_status.log_version, 0 if none)."""
+        if not self.db:
+            return 0
+        doc = _get(self._status_ref(patient_id), field_paths=["log_version"])
+        return ((doc.to_dict() or {}).get("log_version") if doc.exists else None) or 0
+
+    def get_trend_stats(self, patient_id):
+        """
+        Rolling trend state stored on the patient_status document, with the
+        log_version it was read at (pass it to save_log/create_log).
+        Built from the log history only the first time (patients without stored stats).
+        """
+        if not self.db:
+            return RollingTrendStats(), 0
+
+        status = _get(self._status_ref(patient_id), field_paths=["trend_stats", "log_version"])
+        data = (status.to_dict() if status.exists else None) or {}
+        log_version = data.get("log_version") or 0
+        # Stats stored before the recovery window existed are rebuilt once as well
+        if data.get("trend_stats") and "recovery" in data["trend_stats"]:
+            return RollingTrendStats.from_dict(data["trend_stats"]), log_version
+        return RollingTrendStats.from_logs(self.get_historical_logs(patient_id, "trend")), log_version
+
+    def _alert_writes(self, patient_id, risk_data):
+        """Alert document and the patient_status fields that flag the patient."""
+        server_timestamp = _firestore().SERVER_TIMESTAMP
+        alert_data = {
+            "patient_id": patient_id,
+            "risk_level": risk_data["risk_level"],
+            "message": risk_data["message"],
+            "status": "pending",
+            "timestamp": server_timestamp
+        }
+        status = {
+            "patient_id": patient_id,
+            "flagged": True,
+            "risk_level": risk_data["risk_level"],
+            "message": risk_data["message"],
+            "last_update": server_timestamp
+        }
+        return alert_data, status
+
+    def new_alert_id(self):
+        """Alert document id allocated client-side, so callers can refer to it before the commit."""
+        if self.db:
+            return self.db.collection("alerts").document().id
+        return uuid.uuid4().hex
 
     def create_alert(self, patient_id, risk_data):
-        if db:
-            alert_data = {
-                "patient_id": patient_id,
-                "risk_level": risk_data["risk_level"],
-                "message": risk_data["message"],
-                "status": "pending",
-                "timestamp": firestore.SERVER_TIMESTAMP
-            }
-            db.collection("alerts").add(alert_data)
-            
-            # Stub for FCM trigger
-            if risk_data["risk_level"] == "red":
-                self.send_push_notification("Doctor", f"EMERGENCY: Patient {patient_id} needs attention.")
-
-    def send_push_notification(self, target_role, message):
-        """
-        Stub for FCM notification logic.
-        """
-        print(f"NOTIFYING {target_role}: {message}")
-        # if db:
-        #    # Actual FCM logic here
-        #    pass
-    
+        alert_id = self.new_alert_id()
+        self.write_alerts([(alert_id, patient_id, risk_data, [None])], {})
+        return alert_id
+
+    def write_alerts(self, alerts, repeats):
+        """
+        Commits new alerts and repeats of open ones for the alert pipeline, in
+        one transaction of at most MAX_ALERT_WRITES writes.
+
+        `alerts` holds (alert_id, patient_id, risk_data, events) and `repeats`
+        maps an open alert id to (patient_id, events); `events` lists the
+        alert_outbox id of each result folded in (None for results without
+        one). A result counts only while its outbox entry still exists, and
+        the entry is deleted in the same commit, so a result another worker
+        has already written (e.g. after sweeping its entry) is skipped. The
+        pipeline names an alert after the outbox id of its first result; when
+        that alert already exists its results are added to it as a repeat.
+
+        Returns the alerts created as (alert_id, patient_id, risk_data,
+        occurrences) and the repeats written as alert_id -> (patient_id, count).
+        """
+        if not self.db:
+            return [(alert_id, patient_id, risk_data, len(events)) for alert_id, patient_id, risk_data, events in alerts], \
+                {alert_id: (patient_id, len(events)) for alert_id, (patient_id, events) in repeats.items()}
+        server_timestamp = _firestore().SERVER_TIMESTAMP
+        increment = _firestore().Increment
+        alerts_ref = self.db.collection("alerts")
+        outbox_ref = self.db.collection("alert_outbox")
+        outbox_ids = [
+            outbox_id
+            for events in [alert[3] for alert in alerts] + [events for _, events in repeats.values()]
+            for outbox_id in events
+            if outbox_id is not None
+        ]
+
+        @_firestore().transactional
+        def write(transaction):
+            refs = [outbox_ref.document(outbox_id) for outbox_id in outbox_ids]
+            pending = {doc.id for doc in _get_all(self.db, refs, ["patient_id"], transaction) if doc.exists}
+            refs = [alerts_ref.document(alert[0]) for alert in alerts]
+            existing = {doc.id for doc in _get_all(self.db, refs, ["patient_id"], transaction) if doc.exists}
+
+            def count(events):
+                return sum(1 for outbox_id in events if outbox_id is None or outbox_id in pending)
+
+            created = []
+            repeated = {}
+            for alert_id, patient_id, risk_data, events in alerts:
+                occurrences = count(events)
+                if not occurrences:
+                    continue
+                if alert_id in existing:
+                    repeated[alert_id] = (patient_id, occurrences)
+                else:
+                    created.append((alert_id, patient_id, risk_data, occurrences))
+            for alert_id, (patient_id, events) in repeats.items():
+                occurrences = count(events)
+                if occurrences:
+                    repeated[alert_id] = (patient_id, repeated.get(alert_id, (patient_id, 0))[1] + occurrences)
+
+            writes = 0
+            for alert_id, patient_id, risk_data, occurrences in created:
+                alert_data, status = self._alert_writes(patient_id, risk_data)
+                alert_data["occurrences"] = occurrences
+                alert_data["last_seen"] = server_timestamp
+                alert_data["escalated"] = False
+                status["alert_id"] = alert_id
+                status["open_alerts"] = increment(1)
+                transaction.set(alerts_ref.document(alert_id), alert_data)
+                transaction.set(self._status_ref(patient_id), status, merge=True)
+                writes += 2
+            for alert_id, (patient_id, occurrences) in repeated.items():
+                transaction.update(alerts_ref.document(alert_id), {
+                    "occurrences": increment(occurrences),
+                    "last_seen": server_timestamp
+                })
+                transaction.set(self._status_ref(patient_id), {"last_update": server_timestamp}, merge=True)
+                writes += 2
+            for outbox_id in pending:
+                transaction.delete(outbox_ref.document(outbox_id))
+            writes += len(pending)
+            if writes > MAX_ALERT_WRITES:
+                raise ValueError(f"{writes} alert writes exceed one commit ({MAX_ALERT_WRITES})")
+            return created, repeated, writes
+
+        created, repeated, writes = write(self.db.transaction())
+        metrics.count_firestore(writes=writes)
+        return created, repeated
+
+    def acknowledge_alerts(self, alert_ids, doctor_id):
+        """
+        Acknowledges pending alerts in one read (get_all) and batched writes.
+        Each patient's open_alerts counter drops by the alerts acknowledged; the
+        patient is unflagged once it reaches zero, so flagged-patient queries only
+        ever see patients with open alerts. Returns {"acknowledged": [...],
+        "skipped": [...], "cleared_patients": [...]} (skipped: unknown or not pending).
+        """
+        result = {"acknowledged": [], "skipped": [], "cleared_patients": []}
+        if not self.db or not alert_ids:
+            result["skipped"] = list(alert_ids)
+            return result
+
+        alerts_ref = self.db.collection("alerts")
+        per_patient = {}
+        refs = [alerts_ref.document(alert_id) for alert_id in dict.fromkeys(alert_ids)]
+        for doc in _get_all(self.db, refs, field_paths=["status", "patient_id"]):
+            data = doc.to_dict() if doc.exists else None
+            if not data or data.get("status") != "pending" or not data.get("patient_id"):
+                result["skipped"].append(doc.id)
+                continue
+            per_patient.setdefault(data["patient_id"], []).append(doc.id)
+            result["acknowledged"].append(doc.id)
+        if not per_patient:
+            return result
+
+        statuses = {
+            doc.id: doc.to_dict() if doc.exists else {}
+            for doc in _get_all(self.db, [self._status_ref(patient_id) for patient_id in per_patient], field_paths=["open_alerts"])
+        }
+
+        server_timestamp = _firestore().SERVER_TIMESTAMP
+        writes = []
+        for patient_id, acknowledged in per_patient.items():
+            for alert_id in acknowledged:
+                writes.append((alerts_ref.document(alert_id), {
+                    "status": "acknowledged",
+                    "acknowledged_by": doctor_id,
+                    "acknowledged_at": server_timestamp
+                }))
+            open_alerts = statuses.get(patient_id, {}).get("open_alerts") or 0
+            if open_alerts > len(acknowledged):
+                status = {"open_alerts": _firestore().Increment(-len(acknowledged))}
+            else:
+                # Also covers statuses written before the counter existed
+                status = {"open_alerts": 0, "flagged": False, "alert_id": _firestore().DELETE_FIELD}
+                result["cleared_patients"].append(patient_id)
+            status["last_update"] = server_timestamp
+            writes.append((self._status_ref(patient_id), status))
+
+        for start in range(0, len(writes), BulkLogWriter.MAX_OPS):
+            batch = self.db.batch()
+            for ref, data in writes[start:start + BulkLogWriter.MAX_OPS]:
+                batch.set(ref, data, merge=True)
+            _commit(batch)
+        return result
+
+    def escalate_alert(self, alert_id):
+        """
+        Marks a red alert as escalated to the caregiver if nobody has acknowledged it.
+        Returns True when the caregiver should be notified.
+        """
+        if not self.db:
+            return False
+        ref = self.db.collection("alerts").document(alert_id)
+        alert = _get(ref, field_paths=["status", "escalated"])
+        data = alert.to_dict() if alert.exists else None
+        if not data or data.get("status") != "pending" or data.get("escalated"):
+            return False
+        ref.update({"escalated": True, "escalated_at": _firestore().SERVER_TIMESTAMP})
+        metrics.count_firestore(writes=1)
+        return True
+
+    def get_pending_escalations(self):
+        """(alert_id, patient_id, created_at) of red alerts still waiting for a doctor."""
+        if not self.db:
+            return []
+        docs = _stream(self.db.collection("alerts")\
+            .where("status", "==", "pending")\
+            .where("risk_level", "==", "red")\
+            .where("escalated", "==", False)\
+            .select(["patient_id", "timestamp"]))
+        pending = []
+        for doc in docs:
+            data = doc.to_dict()
+            pending.append((doc.id, data.get("patient_id"), data.get("timestamp")))
+        return pending
+
+    def get_alert_outbox(self, created_before):
+        """(outbox_id, patient_id, risk_data, created_at) of alert_outbox entries older than `created_before`."""
+        if not self.db:
+            return []
+        docs = _stream(self.db.collection("alert_outbox").where("created_at", "<", created_before))
+        return [
+            (doc.id, data.get("patient_id"), data.get("risk"), data.get("created_at"))
+            for doc, data in ((doc, doc.to_dict() or {}) for doc in docs)
+        ]
+
+    def get_notification_tokens(self, requests):
+        """
+        FCM registration tokens for (patient_id, role) pairs, role being "doctor"
+        or "caregiver". Doctors register devices on users/{uid}.fcm_tokens and are
+        found through patients/{patient_id}.doctor_id; caregiver devices are listed
+        on patients/{patient_id}.caregiver_fcm_tokens. Two get_all calls in total.
+        """
+        tokens = {request: [] for request in requests}
+        if not self.db or not requests:
+            return tokens
+
+        patients = self.get_patients_info(list({patient_id for patient_id, _ in requests}), NOTIFICATION_PATIENT_FIELDS)
+
+        doctor_ids = list({
+            patients[patient_id].get("doctor_id")
+            for patient_id, role in requests
+            if role == "doctor" and patients.get(patient_id, {}).get("doctor_id")
+        })
+        user_refs = [self.db.collection("users").document(doctor_id) for doctor_id in doctor_ids]
+        doctors = {
+            doc.id: doc.to_dict()
+            for doc in _get_all(self.db, user_refs, field_paths=["fcm_tokens"])
+            if doc.exists
+        }
+
+        for patient_id, role in requests:
+            patient = patients.get(patient_id, {})
+            if role == "caregiver":
+                tokens[(patient_id, role)] = list(patient.get("caregiver_fcm_tokens") or [])
+            else:
+                doctor = doctors.get(patient.get("doctor_id"), {})
+                tokens[(patient_id, role)] = list(doctor.get("fcm_tokens") or [])
+        return tokens
+
+    def bulk_writer(self):
+        return BulkLogWriter(self)
+
     def get_patient_info(self, patient_id):
         """Get patient information from Firestore"""
-        if not db:
+        if not self.db:
             return None
         try:
-            doc = db.collection("patients").document(patient_id).get()
+            doc = _get(self.db.collection("patients").document(patient_id))
             if doc.exists:
                 return doc.to_dict()
             return None
@@ -74,72 +549,212 @@ class FirebaseService:
             print(f"Error getting patient info: {e}")
             return None
     
-    def get_flagged_patients(self):
-        """Get all patients with yellow or red risk status"""
-        if not db:
-            return []
+    def get_patients_info(self, patient_ids, fields=None):
+        """
+        Patient documents for many patients with a single get_all (missing ones
+        are left out), limited to `fields` when given.
+        """
+        if not self.db or not patient_ids:
+            return {}
+        refs = [self.db.collection("patients").document(patient_id) for patient_id in patient_ids]
+        field_paths = list(fields) if fields is not None else None
+        return {doc.id: doc.to_dict() or {} for doc in _get_all(self.db, refs, field_paths=field_paths) if doc.exists}
+
+    def get_flagged_patients(self, limit=50, cursor=None):
+        """
+        Get one page of patients with yellow or red risk status.
+        Reads the denormalized patient_status documents (needs a composite index on
+        flagged + last_update) and batch-fetches patient info with a single get_all.
+        Pass the returned next_cursor back as `cursor` to load the following page.
+        """
+        if not self.db:
+            return {"flagged": [], "next_cursor": None}
         try:
-            # Get recent alerts
-            alerts = db.collection("alerts")\
-                .where("status", "==", "pending")\
-                .order_by("timestamp", direction=firestore.Query.DESCENDING)\
-                .limit(50)\
-                .stream()
-            
+            query = self.db.collection("patient_status")\
+                .where("flagged", "==", True)\
+                .order_by("last_update", direction=_firestore().Query.DESCENDING)\
+                .limit(limit)\
+                .select(DASHBOARD_STATUS_FIELDS)
+
+            if cursor:
+                cursor_doc = _get(self._status_ref(cursor), field_paths=["last_update"])
+                if cursor_doc.exists:
+                    query = query.start_after(cursor_doc)
+
+            statuses = [(doc.id, doc.to_dict()) for doc in _stream(query)]
+            patients = self.get_patients_info([patient_id for patient_id, _ in statuses], DASHBOARD_PATIENT_FIELDS)
+
             flagged = []
-            seen_patients = set()
-            
-            for alert_doc in alerts:
-                alert_data = alert_doc.to_dict()
-                patient_id = alert_data.get("patient_id")
-                
-                if patient_id and patient_id not in seen_patients:
-                    seen_patients.add(patient_id)
-                    # Get latest log for this patient
-                    logs = self.get_historical_logs(patient_id)
-                    latest_log = logs[0] if logs else None
-                    
-                    flagged.append({
-                        "patient_id": patient_id,
-                        "patient_name": f"Patient {patient_id[-4:]}",
-                        "surgery_type": "Unknown",  # Should be stored in patient doc
-                        "risk_level": alert_data.get("risk_level", "yellow"),
-                        "last_update": alert_data.get("timestamp", ""),
-                        "message": alert_data.get("message", "")
-                    })
-            
-            return flagged
+            for patient_id, status in statuses:
+                info = patients.get(patient_id, {})
+                flagged.append({
+                    "patient_id": patient_id,
+                    "patient_name": info.get("name") or f"Patient {patient_id[-4:]}",
+                    "surgery_type": info.get("surgery_type") or "Unknown",
+                    "risk_level": status.get("risk_level", "yellow"),
+                    "last_update": status.get("last_update", ""),
+                    "message": status.get("message", ""),
+                    "alert_id": status.get("alert_id")
+                })
+
+            next_cursor = statuses[-1][0] if len(statuses) == limit else None
+            return {"flagged": flagged, "next_cursor": next_cursor}
         except Exception as e:
             print(f"Error getting flagged patients: {e}")
-            return []
+            return {"flagged": [], "next_cursor": None}
+
+    def backfill_patient_status(self):
+        """
+        One-off migration: builds patient_status documents (flag, latest alert and
+        open_alerts counter) from pending alerts written before the denormalized
+        status existed. Returns patients updated.
+        """
+        if not self.db:
+            return 0
+        alerts = _stream(self.db.collection("alerts")\
+            .where("status", "==", "pending")\
+            .order_by("timestamp", direction=_firestore().Query.DESCENDING)\
+            .select(["patient_id", "risk_level", "message", "timestamp"]))
+
+        latest = {}
+        open_alerts = {}
+        for alert_doc in alerts:
+            alert_data = alert_doc.to_dict()
+            patient_id = alert_data.get("patient_id")
+            if not patient_id:
+                continue
+            open_alerts[patient_id] = open_alerts.get(patient_id, 0) + 1
+            latest.setdefault(patient_id, (alert_doc.id, alert_data))
+
+        batch = self.db.batch()
+        pending_ops = 0
+        for patient_id, (alert_id, alert_data) in latest.items():
+            batch.set(self._status_ref(patient_id), {
+                "patient_id": patient_id,
+                "flagged": True,
+                "risk_level": alert_data.get("risk_level", "yellow"),
+                "message": alert_data.get("message", ""),
+                "last_update": alert_data.get("timestamp"),
+                "alert_id": alert_id,
+                "open_alerts": open_alerts[patient_id]
+            }, merge=True)
+            pending_ops += 1
+            if pending_ops == 500:
+                _commit(batch)
+                batch = self.db.batch()
+                pending_ops = 0
+        if pending_ops:
+            _commit(batch)
+        return len(latest)
     
-    def calculate_recovery_score(self, patient_id):
-        """Calculate recovery score based on recent logs"""
-        logs = self.get_historical_logs(patient_id)
-        if not logs or len(logs) < 2:
-            return 50  # Default score
-        
-        # Simple scoring algorithm
-        score = 100
-        recent_logs = logs[:5]  # Last 5 logs
-        
-        for log in recent_logs:
-            # Deduct points for issues
-            if log.get("pain_score", 0) > 7:
-                score -= 10
-            elif log.get("pain_score", 0) > 4:
-                score -= 5
-            
-            if log.get("temperature", 37) > 37.5:
-                score -= 5
-            
-            if log.get("discharge", False):
-                score -= 15
-            
-            if not log.get("antibiotics_taken", True):
-                score -= 10
-            
-            if log.get("swelling", "").lower() in ["moderate", "severe"]:
-                score -= 5
-        
-        return max(0, min(100, score))
+    def calculate_recovery_score(self, patient_id, log_version=None):
+        """Recovery score stored on patient_status by save_log (computed from the logs if absent)"""
+        return self.get_recovery_scores([patient_id], log_version)[patient_id]
+
+    def get_recovery_scores(self, patient_ids, log_version=None):
+        """
+        Recovery scores of many patients from one get_all over patient_status,
+        reading only the recovery_score field. Patients whose status predates the
+        stored score fall back to their log history (read at `log_version`
+        when given, see get_historical_logs).
+        """
+        scores = {}
+        if self.db and patient_ids:
+            refs = [self._status_ref(patient_id) for patient_id in patient_ids]
+            for doc in _get_all(self.db, refs, field_paths=["recovery_score"]):
+                score = (doc.to_dict() or {}).get("recovery_score") if doc.exists else None
+                if score is not None:
+                    scores[doc.id] = score
+        for patient_id in patient_ids:
+            if patient_id not in scores:
+                scores[patient_id] = recovery_score(self.get_historical_logs(patient_id, "recovery", log_version))
+        return scores
+
+
+class BulkLogWriter:
+    """
+    Buffers log and patient_status writes for bulk ingestion and commits them
+    in one Firestore transaction of at most 500 operations. Status documents
+    are coalesced so each patient costs one status write per batch. Like
+    save_log with a log_version, the commit raises StaleTrendStats when a
+    patient's status has moved on since its trend state was read. Alerts go
+    through the alert pipeline, not this writer; their alert_outbox entries
+    are committed here with the logs.
+    """
+    MAX_OPS = 500
+
+    def __init__(self, service):
+        self.service = service
+        self.db = service.db
+        self.clear()
+
+    @property
+    def pending_ops(self):
+        return len(self._writes) + len(self._statuses)
+
+    def add(self, patient_id, log, trend_stats, log_version, document_id=None, alert=None):
+        """
+        Queues one scored log (LogRecord), under `document_id` when given so
+        re-sending it overwrites instead of duplicating, and the alert_outbox
+        entry of its yellow/red `alert` result. `log_version` is the one the
+        patient's trend state was read at (get_trend_stats). Returns True when
+        the batch is full and should be flushed.
+        """
+        self._versions.setdefault(patient_id, log_version)
+        status = self._statuses.setdefault(patient_id, {"patient_id": patient_id})
+        status["last_log_at"] = log.timestamp
+        status["trend_stats"] = trend_stats.to_dict()
+        status["recovery_score"] = trend_stats.recovery_score()
+        status["log_version"] = _firestore().Increment(1)
+        outbox_id = None
+        if self.db:
+            ref = self.db.collection("daily_logs").document(document_id)
+            self._writes.append((ref, log.to_dict()))
+            if alert is not None:
+                outbox_id = ref.id
+                self._writes.append((self.db.collection("alert_outbox").document(outbox_id), _outbox_entry(patient_id, alert)))
+        if alert is not None:
+            self._alerts.append((outbox_id, patient_id, alert))
+
+        # Leave room for the next record's log, outbox and status writes
+        return self.pending_ops + 3 > self.MAX_OPS
+
+    def clear(self):
+        """Drops everything queued (after a failed flush, before the batch is queued again)."""
+        self._writes = []
+        self._statuses = {}
+        self._versions = {}
+        self._alerts = []
+
+    def flush(self):
+        """
+        Commits everything queued so far. Returns the patient ids written and
+        the (outbox_id, patient_id, risk_data) alerts queued with them. Raises
+        StaleTrendStats with the ids of the patients written by someone else
+        since; nothing is committed then and the batch stays queued.
+        """
+        patients = list(self._statuses)
+        alerts = self._alerts
+        if self.db and self.pending_ops:
+            status_refs = {patient_id: self.service._status_ref(patient_id) for patient_id in patients}
+
+            @_firestore().transactional
+            def write(transaction):
+                docs = _get_all(self.db, list(status_refs.values()), ["log_version"], transaction)
+                stored = {doc.id: ((doc.to_dict() or {}).get("log_version") if doc.exists else None) or 0 for doc in docs}
+                stale = [patient_id for patient_id in patients if stored.get(patient_id, 0) != self._versions[patient_id]]
+                if stale:
+                    raise StaleTrendStats(*stale)
+                for ref, data in self._writes:
+                    transaction.set(ref, data)
+                for patient_id, status in self._statuses.items():
+                    transaction.set(status_refs[patient_id], status, merge=True)
+
+            write(self.db.transaction())
+            metrics.count_firestore(writes=self.pending_ops)
+            for patient_id in patients:
+                self.service.history_cache.invalidate(patient_id)
+                response_cache.invalidate(patient_id)
+
+        self.clear()
+        return patients, alerts
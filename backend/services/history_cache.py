@@ -0,0 +1,140 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCacheBackend:
+    """In-process LRU store with per-entry expiry."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """
+    Shared store so several uvicorn workers see the same history (needs `redis`).
+    The "v2" key prefix came with the (log_version, logs) entries of HistoryCache.
+    """
+
+    def __init__(self, url, prefix="history:v2:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class HistoryCache:
+    """
+    Recent logs per patient (LogRecords, newest first), shared by the risk, trend
+    and recovery paths. Writes go through push() so a new log never leaves a
+    stale history behind.
+
+    Each history is tagged with the patient_status.log_version it was read at
+    (None when unknown). A reader that passes the version it just read gets
+    the history only when the tags match, so logs written by another worker
+    are never served from this one's cache.
+    """
+
+    def __init__(self, backend=None, ttl_seconds=300, max_entries=1024, max_logs=10):
+        self.backend = backend or LocalCacheBackend(max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.max_logs = max_logs
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, patient_id, log_version=None):
+        entry = self.backend.get(patient_id)
+        if entry is None or (log_version is not None and entry[0] != log_version):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(entry[1])
+
+    def set(self, patient_id, logs, log_version=None):
+        self.backend.set(patient_id, (log_version, list(logs[:self.max_logs])), self.ttl_seconds)
+
+    def push(self, patient_id, log, log_version=None):
+        """
+        Adds a newly saved log to a cached history, keeping newest-first order.
+        `log_version` is the version the write was conditioned on; the history
+        is kept (as the next version) only if it was tagged with it.
+        """
+        entry = self.backend.get(patient_id)
+        if entry is None:
+            return
+        if log_version is None or entry[0] != log_version:
+            self.invalidate(patient_id)
+            return
+        logs = sorted(
+            [log] + list(entry[1]),
+            key=lambda log: str(log.timestamp or ""),
+            reverse=True,
+        )
+        self.set(patient_id, logs, log_version + 1)
+
+    def invalidate(self, patient_id):
+        self.backend.delete(patient_id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_history_cache():
+    """Builds the shared cache from HISTORY_CACHE_* environment variables."""
+    backend = None
+    redis_url = os.getenv("HISTORY_CACHE_REDIS_URL")
+    if redis_url:
+        try:
+            backend = RedisCacheBackend(redis_url)
+        except ImportError:
+            print("redis is not installed. Using in-process history cache.")
+    return HistoryCache(
+        backend=backend,
+        ttl_seconds=float(os.getenv("HISTORY_CACHE_TTL_SECONDS", "300")),
+        max_entries=int(os.getenv("HISTORY_CACHE_MAX_PATIENTS", "1024")),
+    )
@@ -0,0 +1,88 @@
+"""
+Deduplication of retried log submissions.
+
+A submission carries an idempotency key (the log's `log_id`, or the
+Idempotency-Key header). The key and the patient id fix the daily_logs
+document id, so a retry can never create a second log document.
+
+Two layers remember the response of a key:
+
+    in memory   bounded LRU with expiry (IDEMPOTENCY_MAX_ENTRIES,
+                IDEMPOTENCY_TTL_SECONDS); a retry served from here costs no
+                Firestore reads or writes. Concurrent retries of a submission
+                still being scored wait for it instead of scoring again.
+    Firestore   the log document itself stores the response under "risk".
+                After a restart, or on another worker, the create of the log
+                fails and the stored response is returned without writing.
+"""
+import asyncio
+import hashlib
+import os
+
+from services.history_cache import LocalCacheBackend
+
+
+def log_document_id(patient_id, key):
+    """daily_logs document id of a submission (hex, safe for any key)."""
+    return hashlib.sha256(f"{patient_id}\n{key}".encode("utf-8")).hexdigest()[:40]
+
+
+class IdempotencyStore:
+    def __init__(self, ttl_seconds=86400, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self._responses = LocalCacheBackend(max_entries)
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        return self._responses.get(key)
+
+    def set(self, key, response):
+        self._responses.set(key, response, self.ttl_seconds)
+
+    async def run(self, key, submit):
+        """
+        Response for `key`: remembered, awaited from an in-flight submission,
+        or produced by awaiting submit() (not remembered if it raises).
+        """
+        response = self.get(key)
+        if response is not None:
+            self.hits += 1
+            return response
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            response = await submit()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marks the exception retrieved when no retry was waiting for it
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+        self.set(key, response)
+        future.set_result(response)
+        return response
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "remembered": len(self._responses)}
+
+
+def create_idempotency_store():
+    return IdempotencyStore(
+        ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")),
+        max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000")),
+    )
+
+
+idempotency_store = create_idempotency_store()
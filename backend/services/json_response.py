@@ -0,0 +1,67 @@
+"""
+Fast JSON responses for list-heavy endpoints.
+
+FastAPI passes every returned dict through jsonable_encoder, which walks and
+copies each value in Python before json.dumps walks it again. Routes that
+return many raw Firestore documents return a FastJSONResponse instead: the
+content is encoded in one pass by orjson (stdlib json when orjson is not
+installed), and only the values it cannot encode itself reach firestore_value()
+(Firestore timestamps, sentinels, geo points, references).
+
+Output matches the default response except for number formatting of very
+large and very small floats (1e20 vs 1e+20, both valid JSON) and NaN, which
+is encoded as null instead of failing the request.
+"""
+import json
+from datetime import date, datetime
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def firestore_value(value):
+    """JSON-native form of a value the encoder cannot handle itself."""
+    # DatetimeWithNanoseconds is a datetime subclass orjson rejects
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    # SERVER_TIMESTAMP / DELETE_FIELD left in a document that was not re-read
+    if type(value).__name__ == "Sentinel":
+        return None
+    if hasattr(value, "latitude") and hasattr(value, "longitude"):
+        return {"latitude": value.latitude, "longitude": value.longitude}
+    if hasattr(value, "path") and hasattr(value, "parent"):
+        return value.path
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(content):
+        """JSON bytes of `content`."""
+        return orjson.dumps(content, default=firestore_value, option=_OPTIONS)
+else:
+    _fallback_reported = False
+
+    def dumps(content):
+        """JSON bytes of `content`."""
+        global _fallback_reported
+        if not _fallback_reported:
+            _fallback_reported = True
+            print("orjson is not installed. Using json for fast responses.")
+        return json.dumps(
+            content, default=firestore_value, ensure_ascii=False, separators=(",", ":"),
+        ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded by dumps(); return it from a route to skip jsonable_encoder."""
+
+    def render(self, content):
+        return dumps(content)
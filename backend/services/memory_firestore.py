@@ -0,0 +1,344 @@
+"""
+In-memory stand-in for the subset of the Firestore client used by FirebaseService.
+
+Selected with FIRESTORE_BACKEND=memory so the API can be run and load-tested
+without a Firebase project. FIRESTORE_LATENCY_MS adds a blocking sleep to every
+simulated round trip, which makes the cost of sync calls on the event loop visible.
+"""
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import Aborted, AlreadyExists
+from google.cloud.firestore_v1 import transforms
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+_MISSING = object()
+
+
+def _apply_write(current, data, merge):
+    """Returns the stored document after writing `data`, resolving transforms."""
+    result = dict(current) if (merge and current) else {}
+    for key, value in data.items():
+        if value is transforms.SERVER_TIMESTAMP:
+            result[key] = datetime.now(timezone.utc)
+        elif value is transforms.DELETE_FIELD:
+            result.pop(key, None)
+        elif isinstance(value, transforms.Increment):
+            result[key] = (result.get(key) or 0) + value.value
+        elif isinstance(value, transforms.ArrayUnion):
+            existing = list(result.get(key) or [])
+            result[key] = existing + [v for v in value.values if v not in existing]
+        elif isinstance(value, transforms.ArrayRemove):
+            result[key] = [v for v in (result.get(key) or []) if v not in value.values]
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+class MemoryDocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        return (self._data or {}).get(field_path)
+
+
+class MemoryDocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+        self.path = f"{collection}/{doc_id}"
+
+    def get(self, field_paths=None, transaction=None):
+        self._client._round_trip()
+        return self._snapshot(field_paths, transaction)
+
+    def _snapshot(self, field_paths=None, transaction=None):
+        with self._client._lock:
+            data = self._client._store.get(self._collection, {}).get(self.id)
+            if transaction is not None:
+                transaction._read(self)
+        if data is not None and field_paths is not None:
+            data = {k: v for k, v in data.items() if k in field_paths}
+        return MemoryDocumentSnapshot(self, copy.deepcopy(data))
+
+    def set(self, document_data, merge=False):
+        self._client._round_trip()
+        self._write(document_data, merge)
+
+    def update(self, field_updates):
+        self._client._round_trip()
+        with self._client._lock:
+            if self.id not in self._client._store.get(self._collection, {}):
+                raise KeyError(f"No document to update: {self.path}")
+        self._write(field_updates, True)
+
+    def delete(self):
+        self._client._round_trip()
+        with self._client._lock:
+            self._client._store.get(self._collection, {}).pop(self.id, None)
+            self._client._bump(self)
+
+    def _write(self, data, merge):
+        with self._client._lock:
+            docs = self._client._store.setdefault(self._collection, {})
+            docs[self.id] = _apply_write(docs.get(self.id), data, merge)
+            self._client._bump(self)
+
+
+class MemoryQuery:
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, start_after=None, fields=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit": self._limit,
+            "start_after": self._start_after,
+            "fields": self._fields,
+        }
+        state.update(changes)
+        return MemoryQuery(self._client, self._collection, **state)
+
+    def where(self, field_path, op_string, value):
+        return self._copy(filters=self._filters + ((field_path, _OPERATORS[op_string], value),))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction == "DESCENDING"),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start_after=document_fields_or_snapshot)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def _cursor_values(self):
+        cursor = self._start_after
+        if isinstance(cursor, MemoryDocumentSnapshot):
+            return [cursor.get(field) for field, _ in self._orders], cursor.id
+        return [cursor.get(field) for field, _ in self._orders], cursor.get("__name__")
+
+    def stream(self):
+        self._client._round_trip()
+        with self._client._lock:
+            items = list(self._client._store.get(self._collection, {}).items())
+
+        matched = [
+            (doc_id, data) for doc_id, data in items
+            if all(op(data.get(field), value) for field, op, value in self._filters)
+            and all(data.get(field, _MISSING) is not _MISSING for field, _ in self._orders)
+        ]
+
+        # Stable multi-key sort: apply keys from last to first, document id breaks ties.
+        matched.sort(key=lambda item: item[0])
+        for field, descending in reversed(self._orders):
+            matched.sort(key=lambda item: item[1][field], reverse=descending)
+
+        if self._start_after is not None:
+            values, cursor_id = self._cursor_values()
+            for index, (doc_id, data) in enumerate(matched):
+                if [data[field] for field, _ in self._orders] == values and doc_id == cursor_id:
+                    matched = matched[index + 1:]
+                    break
+            else:
+                matched = [
+                    (doc_id, data) for doc_id, data in matched
+                    if self._after(doc_id, data, values, cursor_id)
+                ]
+
+        if self._limit is not None:
+            matched = matched[:self._limit]
+
+        for doc_id, data in matched:
+            if self._fields is not None:
+                data = {k: v for k, v in data.items() if k in self._fields}
+            reference = MemoryDocumentReference(self._client, self._collection, doc_id)
+            yield MemoryDocumentSnapshot(reference, copy.deepcopy(data))
+
+    def _after(self, doc_id, data, values, cursor_id):
+        for (field, descending), cursor in zip(self._orders, values):
+            value = data[field]
+            if value == cursor:
+                continue
+            return value < cursor if descending else value > cursor
+        # Equal values: the document id breaks the tie, as in Firestore
+        if cursor_id is None:
+            return False
+        descending = self._orders[-1][1] if self._orders else False
+        return doc_id < cursor_id if descending else doc_id > cursor_id
+
+    def get(self):
+        return list(self.stream())
+
+
+class MemoryCollectionReference(MemoryQuery):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, document_id=None):
+        return MemoryDocumentReference(self._client, self._collection, document_id or uuid.uuid4().hex)
+
+    def add(self, document_data, document_id=None):
+        reference = self.document(document_id)
+        reference.set(document_data)
+        return datetime.now(timezone.utc), reference
+
+
+class MemoryWriteBatch:
+    """Buffers writes and applies them in one simulated round trip."""
+
+    MAX_OPERATIONS = 500
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def create(self, reference, document_data):
+        self._queue(reference, "create", document_data, False)
+
+    def set(self, reference, document_data, merge=False):
+        self._queue(reference, "set", document_data, merge)
+
+    def update(self, reference, field_updates):
+        self._queue(reference, "update", field_updates, True)
+
+    def delete(self, reference):
+        self._queue(reference, "delete", None, False)
+
+    def _queue(self, reference, kind, data, merge):
+        if len(self._writes) >= self.MAX_OPERATIONS:
+            raise ValueError("A write batch can contain at most 500 operations")
+        self._writes.append((reference, kind, data, merge))
+
+    def commit(self):
+        self._client._round_trip()
+        with self._client._lock:
+            self._apply()
+        writes, self._writes = self._writes, []
+        return writes
+
+    def _apply(self):
+        # Preconditions are checked first: a failed create applies nothing
+        for reference, kind, _, _ in self._writes:
+            if kind == "create" and reference.id in self._client._store.get(reference._collection, {}):
+                raise AlreadyExists(f"Document already exists: {reference._collection}/{reference.id}")
+        for reference, kind, data, merge in self._writes:
+            docs = self._client._store.setdefault(reference._collection, {})
+            if kind == "delete":
+                docs.pop(reference.id, None)
+            else:
+                docs[reference.id] = _apply_write(docs.get(reference.id), data, merge)
+            self._client._bump(reference)
+
+
+class MemoryTransaction(MemoryWriteBatch):
+    """
+    Optimistic transaction for firestore.transactional: documents read with
+    get(transaction=...) are remembered, and the commit raises Aborted (which
+    transactional retries) when one of them was written in the meantime.
+    """
+
+    def __init__(self, client, max_attempts=5):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._read_only = False
+        self._id = None
+        self._reads = {}
+
+    def _read(self, reference):
+        self._reads.setdefault(reference.path, self._client._versions.get(reference.path, 0))
+
+    def _clean_up(self):
+        self._writes = []
+        self._reads = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = uuid.uuid4().bytes
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        self._client._round_trip()
+        with self._client._lock:
+            for path, version in self._reads.items():
+                if self._client._versions.get(path, 0) != version:
+                    self._clean_up()
+                    raise Aborted(f"Transaction conflict on {path}")
+            self._apply()
+        writes = self._writes
+        self._clean_up()
+        return writes
+
+
+class MemoryFirestoreClient:
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self._store = {}
+        # Write count per document path, for transaction conflict checks
+        self._versions = {}
+        self._lock = threading.RLock()
+        self.round_trips = 0
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def collection(self, name):
+        return MemoryCollectionReference(self, name)
+
+    def _bump(self, reference):
+        self._versions[reference.path] = self._versions.get(reference.path, 0) + 1
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def transaction(self, max_attempts=5):
+        return MemoryTransaction(self, max_attempts)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        """Fetches many documents in a single simulated round trip."""
+        self._round_trip()
+        for reference in references:
+            yield reference._snapshot(field_paths, transaction)
@@ -0,0 +1,366 @@
+"""
+Request instrumentation: timing spans, Prometheus metrics and an opt-in
+sampling profiler for slow requests.
+
+MetricsMiddleware opens a per-request record (a ContextVar, so it follows the
+request into the Firestore thread pool) that collects span timings and
+Firestore read/write counts. When the response is sent they are added to the
+metrics below under the matched route template ("/patients/{patient_id}"), so
+label cardinality stays bounded. Work outside any request (alert pipeline,
+startup) is labelled route="background".
+
+    postop_request_duration_seconds     histogram   route, method, status
+    postop_span_duration_seconds        histogram   span, route
+    postop_firestore_operations_total   counter     route, op (read|write)
+
+Firestore operations are counted the way Firestore bills them: one read per
+document returned (at least one per query) and one write per batched write.
+Reads made by a transaction attempt that is retried are included; its writes
+are counted only for the attempt that commits.
+
+Profiler (off unless PROFILE_SLOW_MS is set): while requests are in flight a
+thread samples the event loop and Firestore worker stacks every
+PROFILE_INTERVAL_MS (default 5). A request slower than PROFILE_SLOW_MS gets
+the samples of its time window written to PROFILE_DIR (default
+backend/profiles) as collapsed stacks ("frame;frame;frame count"), the input
+format of flamegraph.pl and speedscope. Concurrent requests share the event
+loop, so their samples overlap. The files are written by the sampling
+thread, never on the event loop, and reported on stdout like the rest of
+the backend's diagnostics.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+
+# Request latency buckets in seconds (Prometheus client defaults)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+# Spans are much shorter: scoring layers take microseconds
+SPAN_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+BACKGROUND = "background"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (+Inf last), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def count(self, labels):
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "postop_request_duration_seconds", "HTTP request latency by route template.",
+    ("route", "method", "status"))
+SPAN_SECONDS = Histogram(
+    "postop_span_duration_seconds", "Time spent in instrumented calls (Firestore, scoring layers).",
+    ("span", "route"), SPAN_BUCKETS)
+FIRESTORE_OPS = Counter(
+    "postop_firestore_operations_total", "Firestore document reads and writes by route.",
+    ("route", "op"))
+
+REGISTRY = [REQUEST_SECONDS, SPAN_SECONDS, FIRESTORE_OPS]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestRecord:
+    """Spans and Firestore counts of one request, flushed to the metrics when it ends."""
+    __slots__ = ("spans", "reads", "writes", "finished")
+
+    def __init__(self):
+        self.spans = []
+        self.reads = 0
+        self.writes = 0
+        self.finished = False
+
+
+_current = ContextVar("metrics_request", default=None)
+
+
+def _record():
+    record = _current.get()
+    # Tasks spawned by a request inherit its context and may outlive it
+    return None if record is None or record.finished else record
+
+
+def observe_span(name, seconds):
+    record = _record()
+    if record is None:
+        SPAN_SECONDS.observe((name, BACKGROUND), seconds)
+    else:
+        record.spans.append((name, seconds))
+
+
+def count_firestore(reads=0, writes=0):
+    record = _record()
+    if record is None:
+        if reads:
+            FIRESTORE_OPS.inc((BACKGROUND, "read"), reads)
+        if writes:
+            FIRESTORE_OPS.inc((BACKGROUND, "write"), writes)
+    else:
+        record.reads += reads
+        record.writes += writes
+
+
+class span:
+    """
+    Times a block under `name`:
+
+        with metrics.span("risk.rules"):
+            ...
+    """
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe_span(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def _route_of(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no body buffering, so streaming responses pass through)."""
+
+    def __init__(self, app, profiler=None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        record = RequestRecord()
+        token = _current.set(record)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.request_started()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            record.finished = True
+            _current.reset(token)
+            route = _route_of(scope)
+            REQUEST_SECONDS.observe((route, scope["method"], str(status)), elapsed)
+            for name, seconds in record.spans:
+                SPAN_SECONDS.observe((name, route), seconds)
+            if record.reads:
+                FIRESTORE_OPS.inc((route, "read"), record.reads)
+            if record.writes:
+                FIRESTORE_OPS.inc((route, "write"), record.writes)
+            if self.profiler is not None:
+                self.profiler.request_finished(started, elapsed, f"{scope['method']} {route}")
+
+
+# Innermost frames of threads that are only waiting for work
+_IDLE_FRAMES = {
+    ("threading.py", "wait"), ("queue.py", "get"), ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+
+def _fold(frame):
+    """Collapsed stack of a frame, outermost first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+def _idle(frame):
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES
+
+
+class SamplingProfiler:
+    """Samples stacks while requests run and dumps them for the slow ones (see module docstring)."""
+    # Samples kept in memory; older ones fall off (one sample per thread per tick)
+    MAX_SAMPLES = 50000
+
+    def __init__(self, slow_ms, interval_ms=5.0, output_dir=None):
+        self.slow_seconds = slow_ms / 1000
+        self.interval = interval_ms / 1000
+        self.output_dir = Path(output_dir or Path(__file__).resolve().parent.parent / "profiles")
+        self._samples = deque(maxlen=self.MAX_SAMPLES)
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._loop_thread = None
+        self._thread = None
+        # Slow requests waiting for the sampling thread to write their stacks
+        self._pending = []
+        self.dumped = 0
+
+    def request_started(self):
+        with self._lock:
+            self._loop_thread = threading.get_ident()
+            self._active += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def request_finished(self, started, elapsed, label):
+        """Called on the event loop: a slow request's dump is queued for the sampling thread."""
+        with self._lock:
+            self._active -= 1
+            if elapsed >= self.slow_seconds:
+                self._pending.append((started, started + elapsed, label, elapsed))
+                self._wake.notify()
+
+    def _threads(self):
+        """Event loop thread plus the Firestore pool, the threads a request runs on."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self._loop_thread:
+                yield "loop", frame
+            elif names.get(ident, "").startswith("firestore"):
+                yield "firestore", frame
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._active == 0 and not self._pending:
+                    self._wake.wait()
+                pending, self._pending = self._pending, []
+                active = self._active
+            for start, end, label, elapsed in pending:
+                try:
+                    self.dump(start, end, label, elapsed)
+                except OSError as e:
+                    print(f"Slow request {label}: could not write its stacks: {e}")
+            if active:
+                now = time.perf_counter()
+                for thread, frame in self._threads():
+                    if not _idle(frame):
+                        self._samples.append((now, f"{thread};{_fold(frame)}"))
+                time.sleep(self.interval)
+
+    def dump(self, start, end, label, elapsed):
+        """Writes the samples taken in [start, end] as collapsed stacks. Returns the file or None."""
+        counts = {}
+        for when, stack in list(self._samples):
+            if start <= when <= end:
+                counts[stack] = counts.get(stack, 0) + 1
+        if not counts:
+            return None
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")
+        path = self.output_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{int(elapsed * 1000)}ms.folded"
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(counts.items()):
+                f.write(f"{stack} {count}\n")
+        self.dumped += 1
+        print(f"Slow request {label} ({elapsed * 1000:.0f} ms): stacks written to {path}")
+        return path
+
+
+def create_profiler():
+    """Profiler configured from the environment, or None when PROFILE_SLOW_MS is unset."""
+    slow_ms = os.getenv("PROFILE_SLOW_MS")
+    if not slow_ms:
+        return None
+    return SamplingProfiler(
+        float(slow_ms),
+        interval_ms=float(os.getenv("PROFILE_INTERVAL_MS", "5")),
+        output_dir=os.getenv("PROFILE_DIR"),
+    )
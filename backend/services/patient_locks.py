@@ -0,0 +1,37 @@
+"""
+Per-patient locks of this worker.
+
+/submit_log holds a patient's lock from reading the trend state to saving the
+log, and /ingest_logs holds the locks of a batch's patients while it writes
+the batch, so this worker's writes for one patient never race each other.
+Writes from other workers are caught by the log_version check of the commit
+(StaleTrendStats).
+"""
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+
+# patient_id -> [lock, requests holding or waiting for it]
+_patient_locks = {}
+
+
+@asynccontextmanager
+async def patient_lock(patient_id):
+    """Runs this worker's writes for one patient one at a time."""
+    entry = _patient_locks.setdefault(patient_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _patient_locks[patient_id]
+
+
+@asynccontextmanager
+async def patient_locks(patient_ids):
+    """Holds the locks of several patients, taken in sorted order so two holders never deadlock."""
+    async with AsyncExitStack() as stack:
+        for patient_id in sorted(set(patient_ids)):
+            await stack.enter_async_context(patient_lock(patient_id))
+        yield
@@ -0,0 +1,48 @@
+"""
+Recovery score (0-100) from a patient's most recent daily logs.
+
+Each log costs a fixed penalty, so the score is 100 minus the penalties of the
+newest RECOVERY_WINDOW logs. RollingTrendStats keeps those penalties and the
+score is stored on patient_status whenever a log is saved.
+"""
+RECOVERY_WINDOW = 5
+MIN_LOGS = 2
+DEFAULT_SCORE = 50  # fewer than MIN_LOGS logs
+
+# Log fields recovery_penalty reads
+PENALTY_FIELDS = ("pain_score", "temperature", "discharge", "antibiotics_taken", "swelling")
+
+
+def recovery_penalty(log):
+    """Points one log (LogRecord) deducts from the recovery score; missing fields cost nothing."""
+    penalty = 0
+    pain_score = log.pain_score or 0
+    if pain_score > 7:
+        penalty += 10
+    elif pain_score > 4:
+        penalty += 5
+
+    if log.temperature is not None and log.temperature > 37.5:
+        penalty += 5
+
+    if log.discharge:
+        penalty += 15
+
+    if log.antibiotics_taken is False:
+        penalty += 10
+
+    if (log.swelling or "").lower() in ["moderate", "severe"]:
+        penalty += 5
+    return penalty
+
+
+def score_from_penalties(penalties, count):
+    """Score from the newest RECOVERY_WINDOW penalties and the number of logs seen."""
+    if count < MIN_LOGS:
+        return DEFAULT_SCORE
+    return max(0, min(100, 100 - sum(penalties)))
+
+
+def recovery_score(logs):
+    """Score from a newest-first log history."""
+    return score_from_penalties([recovery_penalty(log) for log in logs[:RECOVERY_WINDOW]], len(logs))
@@ -0,0 +1,88 @@
+"""
+Conditional GET and memoized responses for per-patient read endpoints.
+
+A patient's data only changes when one of their logs is written, and every
+log write increments log_version on their patient_status document. That
+version (plus anything else the response depends on, like the rule spec) is
+the ETag of /risk, /patient_logs and /recovery_score:
+
+    If-None-Match matches   304, no body, nothing recomputed
+    memo holds the ETag     the serialized JSON is sent again as is
+    otherwise               the response is built, serialized and memoized
+
+The version is read from patient_status on every request (one single-field
+read), so a log written through any worker changes the ETag right away.
+Memoized bodies stay in process but are only reused under the ETag they were
+built for.
+"""
+import os
+
+from fastapi.responses import Response
+
+from services.history_cache import LocalCacheBackend
+from services.json_response import dumps
+
+
+def etag_matches(if_none_match, etag):
+    """True when an If-None-Match header lists `etag` (weak comparison, as for GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds=300, max_entries=4096):
+        self.ttl_seconds = ttl_seconds
+        self._responses = LocalCacheBackend(max_entries)
+        # Bumped by every log write in this worker; a body built while it
+        # changed may not match the version it was read under and is not kept
+        self._generation = 0
+        self.not_modified = 0
+        self.memo_hits = 0
+        self.rendered = 0
+
+    def invalidate(self, patient_id):
+        self._generation += 1
+
+    async def respond(self, request, key, etag, build):
+        """
+        The response for `key` (e.g. ("risk", patient_id)) at `etag`: a 304 when
+        the client already has it, else memoized or freshly awaited build() JSON.
+        """
+        etag = f'"{etag}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+
+        memo = self._responses.get(key)
+        if memo is not None and memo[0] == etag:
+            self.memo_hits += 1
+            body = memo[1]
+        else:
+            generation = self._generation
+            body = dumps(await build())
+            self.rendered += 1
+            if generation == self._generation:
+                self._responses.set(key, (etag, body), self.ttl_seconds)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self):
+        return {
+            "not_modified": self.not_modified,
+            "memo_hits": self.memo_hits,
+            "rendered": self.rendered,
+            "memoized": len(self._responses),
+        }
+
+
+def create_response_cache():
+    return ResponseCache(
+        ttl_seconds=float(os.getenv("HISTORY_CACHE_TTL_SECONDS", "300")),
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "4096")),
+    )
+
+
+response_cache = create_response_cache()
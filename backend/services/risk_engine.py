@@ -1,63 +1,83 @@
-from services.trend_analyzer import TrendAnalyzer
-from ml.ml_placeholder import predict_ml_risk
+import numpy as np
+
+from scoring import daily_log, timing
+from services import metrics
+from services.rule_spec import RISK_LEVELS, daily_log_rules
+from ml.inference import predict_ml_risk, predict_ml_risk_batch
+
+# Smart Escalation Messaging
+MESSAGES = {
+    "green": "Your recovery is on track. Keep following the plan!",
+    "yellow": "Minor issues detected. Please rest more and monitor closely.",
+    "red": "High risk detected! A doctor has been notified. Please seek immediate attention."
+}
+
+ESCALATIONS = {
+    "green": "Continue monitoring.",
+    "yellow": "Increased monitoring requested. Check temperature every 4 hours.",
+    "red": "Doctor notified via dashboard. Fallback to caregiver if no response in 1 hour."
+}
+
+
+def _observe_layer(layer, seconds):
+    metrics.observe_span(f"risk.{layer}", seconds)
 
-class RiskEngine:
-    def __init__(self):
-        self.trend_analyzer = TrendAnalyzer()
 
+# Every scoring layer is timed as a "risk.<layer>" span
+timing.LAYER_TIMER = _observe_layer
+
+
+class RiskEngine:
     def run_rules(self, log_data):
         """
         Layer 1: Deterministic Rule Engine
-        RED if: temp >= 38, discharge == True, pain >= 9
-        YELLOW if: missed antibiotics, moderate swelling
-        """
-        risk = 0 # 0=Green, 1=Yellow, 2=Red
-        
-        # Red Flags
-        if (log_data.temperature >= 38 or 
-            log_data.discharge == True or 
-            log_data.pain_score >= 9 or
-            log_data.redness.lower() == "severe"):
-            return 2
-            
-        # Yellow Flags
-        if (not log_data.antibiotics_taken or 
-            log_data.swelling.lower() in ["moderate", "severe"] or
-            log_data.pain_score >= 6 or
-            log_data.fatigue.lower() == "high"):
-            risk = 1
-            
-        return risk
-
-    def calculate_risk(self, current_log, historical_logs):
+        Thresholds come from the "daily_log" section of rules/risk_rules.json
+        (RED: temp >= 38, discharge, pain >= 9, severe redness;
+        YELLOW: missed antibiotics, moderate swelling, pain >= 6, high fatigue)
+        Returns 0=Green, 1=Yellow, 2=Red
+        """
+        return daily_log_rules.get().run_rules(log_data)
+
+    def calculate_risk(self, current_log, historical_logs=None, trend_stats=None):
         """
         Calculates final risk using Rule, Trend, and ML layers.
+        `current_log` is a LogRecord (or DailyLog); the trend layer reads `trend_stats` (RollingTrendStats) when given,
+        otherwise the newest-first `historical_logs`.
+        The layers are scoring.daily_log's, with the ML layer from ml.inference.
         """
-        rule_risk = self.run_rules(current_log)
-        trend_risk = self.trend_analyzer.analyze(historical_logs)
-        ml_risk = predict_ml_risk(current_log.dict())
-        
-        final_risk_val = max(rule_risk, trend_risk, ml_risk)
-        
-        risk_map = {0: "green", 1: "yellow", 2: "red"}
-        risk_level = risk_map[final_risk_val]
-        
-        # Smart Escalation Messaging
-        messages = {
-            "green": "Your recovery is on track. Keep following the plan!",
-            "yellow": "Minor issues detected. Please rest more and monitor closely.",
-            "red": "High risk detected! A doctor has been notified. Please seek immediate attention."
-        }
-        
-        escalations = {
-            "green": "Continue monitoring.",
-            "yellow": "Increased monitoring requested. Check temperature every 4 hours.",
-            "red": "Doctor notified via dashboard. Fallback to caregiver if no response in 1 hour."
-        }
-        
-        return {
-            "risk_level": risk_level,
-            "risk_score": float(final_risk_val),
-            "message": messages[risk_level],
-            "escalation_action": escalations[risk_level]
-        }
+        return risk_result(daily_log.risk_level(current_log, historical_logs, trend_stats, predict=predict_ml_risk))
+
+    def run_rules_batch(self, logs):
+        """
+        Vectorized run_rules over columnar logs.
+        `logs` maps DailyLog field names to equal-length arrays.
+        """
+        return daily_log_rules.get().run_rules_batch(logs)
+
+    def calculate_risk_batch(self, logs, pain_history=None, temperature_history=None, history_lengths=None):
+        """
+        Scores many logs at once; returns the same dicts as calculate_risk.
+        Histories are right-aligned matrices (see trend_analyzer.history_matrix).
+        """
+        return risk_results(self.risk_values_batch(logs, pain_history, temperature_history, history_lengths))
+
+    def risk_values_batch(self, logs, pain_history=None, temperature_history=None, history_lengths=None):
+        """calculate_risk_batch as an array of risk values (0=Green, 1=Yellow, 2=Red)."""
+        return daily_log.risk_levels_batch(logs, pain_history, temperature_history, history_lengths,
+                                           predict_batch=predict_ml_risk_batch)
+
+
+def risk_result(value):
+    """calculate_risk dict for a risk value."""
+    risk_level = RISK_LEVELS[value]
+    return {
+        "risk_level": risk_level,
+        "risk_score": float(value),
+        "message": MESSAGES[risk_level],
+        "escalation_action": ESCALATIONS[risk_level]
+    }
+
+
+def risk_results(values):
+    """calculate_risk dicts for an array of risk values."""
+    return [risk_result(value) for value in np.asarray(values).tolist()]
@@ -0,0 +1,66 @@
+from collections import deque
+
+from services.recovery_score import RECOVERY_WINDOW, recovery_penalty, score_from_penalties
+from services.trend_analyzer import TREND_WINDOW, least_squares_slope
+
+TREND_FIELDS = ("pain_score", "temperature")
+
+
+class RollingTrendStats:
+    """
+    Per-patient trend state updated once per new log.
+
+    Keeps the last TREND_WINDOW values of each trend field, oldest first, and the
+    total number of logs seen. The window is fixed, so push() and slope() are
+    constant time and give the same slopes as TrendAnalyzer over the newest logs.
+    The recovery penalties of the newest logs are kept the same way, so the
+    recovery score is maintained on write as well.
+    Serializes to a small dict stored on the patient_status document.
+    """
+
+    def __init__(self, count=0, values=None, window=TREND_WINDOW, recovery=()):
+        self.window = window
+        self.count = count
+        self.values = {
+            field: deque((values or {}).get(field, []), maxlen=window)
+            for field in TREND_FIELDS
+        }
+        self.recovery = deque(recovery, maxlen=RECOVERY_WINDOW)
+
+    def push(self, log):
+        """Adds one log (LogRecord) as the newest entry."""
+        self.count += 1
+        for field in TREND_FIELDS:
+            self.values[field].append(float(getattr(log, field) or 0))
+        self.recovery.append(recovery_penalty(log))
+
+    def slope(self, field):
+        return least_squares_slope(list(self.values[field]))
+
+    def recovery_score(self):
+        return score_from_penalties(self.recovery, self.count)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "window": self.window,
+            "values": {field: list(values) for field, values in self.values.items()},
+            "recovery": list(self.recovery),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            count=data.get("count", 0),
+            values=data.get("values"),
+            window=data.get("window", TREND_WINDOW),
+            recovery=data.get("recovery", ()),
+        )
+
+    @classmethod
+    def from_logs(cls, logs):
+        """Builds the state from a newest-first LogRecord history (one-time bootstrap)."""
+        stats = cls()
+        for log in reversed(logs):
+            stats.push(log)
+        return stats
@@ -0,0 +1,9 @@
+# The rule spec is compiled by the shared scoring core (scoring/rules.py)
+from scoring.rules import (
+    DEFAULT_RULES_PATH,
+    RISK_LEVELS,
+    CategoryTable,
+    DailyLogRules,
+    RuleSpec,
+    daily_log_rules,
+)
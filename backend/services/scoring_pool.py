@@ -0,0 +1,247 @@
+"""
+Risk scoring on a pool of worker processes.
+
+Scoring is pure Python and numpy on the CPU, so on the event loop it holds
+the GIL and every other request waits for it. With SCORING_WORKERS set
+("auto" for one per core) scoring jobs go over the executor's call queue to
+worker processes instead; the default, 0, keeps scoring inline as before.
+
+Workers are spawned when the app starts and pre-warmed by their initializer:
+each builds its RiskEngine, compiles the rule spec and loads the ML model
+once, so no job pays for it. Rule spec edits are picked up per process as
+usual (daily_log_rules.get() follows the file).
+
+    single logs   submit_log sends the LogRecord and rolling trend state
+                  (a few hundred bytes pickled) and awaits the risk dict.
+    batches       columns and history matrices are copied once into one
+                  shared memory block (SharedColumns); workers attach to it
+                  by name and each scores a slice of rows into a shared
+                  result array, so nothing per row is pickled. Batches below
+                  SCORING_POOL_MIN_BATCH rows are scored inline, where the
+                  copy would cost more than it saves.
+
+Spans recorded inside a worker stay in that process; the request path sees
+the whole job as the "scoring.pool" span.
+"""
+import asyncio
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from ml.inference import get_model
+from models.log_model import DailyLog
+from services import metrics
+from services.risk_engine import RiskEngine
+from services.rule_spec import daily_log_rules
+
+# Row-aligned arrays stored next to the log columns in a shared block
+RISK = "__risk"
+PAIN_HISTORY = "__pain_history"
+TEMPERATURE_HISTORY = "__temperature_history"
+HISTORY_LENGTHS = "__history_lengths"
+
+# DailyLog fields the scoring layers read, with the numpy type of their column
+SCORING_COLUMNS = {
+    name: {int: np.float64, float: np.float64, bool: np.bool_}.get(field.annotation, np.str_)
+    for name, field in DailyLog.model_fields.items()
+    if name not in ("patient_id", "timestamp", "log_id")
+}
+
+# Smallest slice worth a job of its own
+MIN_SHARD_ROWS = 1000
+
+
+def columns_from_records(records):
+    """
+    Log columns (field name -> numpy array) for scoring a list of LogRecords.
+    Missing numbers become NaN and missing flags False, as in the batch rules.
+    """
+    columns = {}
+    for name, dtype in SCORING_COLUMNS.items():
+        values = [getattr(record, name) for record in records]
+        if dtype is np.float64:
+            columns[name] = np.array([math.nan if value is None else value for value in values], dtype=dtype)
+        elif dtype is np.bool_:
+            columns[name] = np.array([value is True for value in values], dtype=dtype)
+        else:
+            columns[name] = np.array(["" if value is None else value for value in values], dtype=dtype)
+    return columns
+
+
+class SharedColumns:
+    """
+    Named numpy arrays packed into one shared memory block.
+    `layout` (picklable) lets another process map the same arrays with attach().
+    """
+
+    def __init__(self, arrays):
+        self.layout = []
+        size = 0
+        for name, array in arrays.items():
+            # 16-byte alignment keeps every array's rows aligned for numpy
+            size = -(-size // 16) * 16
+            self.layout.append((name, array.dtype.str, array.shape, size))
+            size += array.nbytes
+        self.shm = SharedMemory(create=True, size=max(size, 1))
+        self.name = self.shm.name
+        for (name, dtype, shape, offset), array in zip(self.layout, arrays.values()):
+            np.ndarray(shape, dtype, buffer=self.shm.buf, offset=offset)[...] = array
+
+    def copy(self, name):
+        """A private copy of one array (views must not outlive the block)."""
+        return attach(self.shm, self.layout)[name].copy()
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def attach(shm, layout):
+    """Arrays of a SharedColumns layout viewed over `shm`."""
+    return {
+        name: np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
+        for name, dtype, shape, offset in layout
+    }
+
+
+# Worker process state, set up once by _init_worker
+_engine = None
+
+
+def _init_worker():
+    global _engine
+    _engine = RiskEngine()
+    daily_log_rules.get()
+    get_model()
+
+
+def _ready():
+    return os.getpid()
+
+
+def _score_one(record, historical_logs, trend_stats):
+    return _engine.calculate_risk(record, historical_logs, trend_stats)
+
+
+def _score_rows(shm, layout, start, stop):
+    arrays = {name: array[start:stop] for name, array in attach(shm, layout).items()}
+    risk = arrays.pop(RISK)
+    pain_history = arrays.pop(PAIN_HISTORY, None)
+    temperature_history = arrays.pop(TEMPERATURE_HISTORY, None)
+    history_lengths = arrays.pop(HISTORY_LENGTHS, None)
+    risk[:] = _engine.risk_values_batch(arrays, pain_history, temperature_history, history_lengths)
+
+
+def _score_slice(name, layout, start, stop):
+    """Scores rows [start, stop) of a shared batch into its risk array."""
+    shm = SharedMemory(name=name)
+    try:
+        # The views live in _score_rows' frame, so they are gone before close()
+        _score_rows(shm, layout, start, stop)
+    finally:
+        shm.close()
+    return stop - start
+
+
+class ScoringPool:
+    def __init__(self, workers=0, min_batch=2000):
+        self.workers = workers
+        self.min_batch = min_batch
+        self.jobs = 0
+        self.rows = 0
+        self._engine = RiskEngine()
+        self._executor = None
+
+    @property
+    def running(self):
+        return self._executor is not None
+
+    def start(self):
+        """Spawns and pre-warms the workers (blocking; a no-op with 0 workers)."""
+        if self.workers <= 0 or self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+        )
+        # One job per worker makes the executor spawn (and warm) all of them now
+        for future in [self._executor.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+        print(f"Scoring pool: {self.workers} worker processes ready")
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    async def score(self, record, trend_stats=None, historical_logs=None):
+        """RiskEngine.calculate_risk for one log, on a worker when the pool runs."""
+        if self._executor is None:
+            return self._engine.calculate_risk(record, historical_logs, trend_stats)
+        self.jobs += 1
+        self.rows += 1
+        with metrics.span("scoring.pool"):
+            future = self._executor.submit(_score_one, record, historical_logs, trend_stats)
+            return await asyncio.wrap_future(future)
+
+    def score_columns(self, columns, pain_history=None, temperature_history=None, history_lengths=None):
+        """
+        RiskEngine.risk_values_batch split across the workers through shared
+        memory (blocking). Columns may be lists or numpy arrays.
+        """
+        n = len(next(iter(columns.values())))
+        if self._executor is None or n < self.min_batch:
+            return self._engine.risk_values_batch(columns, pain_history, temperature_history, history_lengths)
+
+        arrays = {name: np.asarray(values) for name, values in columns.items()}
+        if pain_history is not None:
+            arrays[PAIN_HISTORY] = np.asarray(pain_history, dtype=np.float64)
+            arrays[TEMPERATURE_HISTORY] = np.asarray(temperature_history, dtype=np.float64)
+            arrays[HISTORY_LENGTHS] = np.asarray(history_lengths, dtype=np.int64)
+        arrays[RISK] = np.zeros(n, dtype=np.int64)
+
+        shards = max(1, min(self.workers, n // MIN_SHARD_ROWS))
+        bounds = np.linspace(0, n, shards + 1).astype(int).tolist()
+        with metrics.span("scoring.pool"):
+            shared = SharedColumns(arrays)
+            try:
+                futures = [
+                    self._executor.submit(_score_slice, shared.name, shared.layout, start, stop)
+                    for start, stop in zip(bounds, bounds[1:])
+                ]
+                for future in futures:
+                    future.result()
+                self.jobs += len(futures)
+                self.rows += n
+                return shared.copy(RISK)
+            finally:
+                shared.close()
+
+    async def score_columns_async(self, columns, pain_history=None, temperature_history=None, history_lengths=None):
+        """score_columns from the event loop; pool batches are awaited off the loop."""
+        n = len(next(iter(columns.values())))
+        if self._executor is None or n < self.min_batch:
+            return self._engine.risk_values_batch(columns, pain_history, temperature_history, history_lengths)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self.score_columns, columns, pain_history, temperature_history, history_lengths)
+
+    def stats(self):
+        return {"workers": self.workers, "running": self.running, "jobs": self.jobs, "rows": self.rows}
+
+
+def create_scoring_pool():
+    """Pool configured from SCORING_WORKERS ("auto" = one per core) and SCORING_POOL_MIN_BATCH."""
+    workers = os.getenv("SCORING_WORKERS", "0")
+    return ScoringPool(
+        workers=(os.cpu_count() or 1) if workers == "auto" else int(workers),
+        min_batch=int(os.getenv("SCORING_POOL_MIN_BATCH", "2000")),
+    )
+
+
+scoring_pool = create_scoring_pool()
@@ -0,0 +1,29 @@
+"""
+Startup-time report for the API process.
+
+main.py imports this module first, so mark() measures from the beginning of
+application import (`*_at_ms` keys); record() stores durations such as the
+Firestore client setup. Each phase is recorded once (first value wins) and
+served by GET /startup.
+"""
+import time
+
+_started = time.perf_counter()
+_phases = {}
+
+
+def since_start_ms():
+    return (time.perf_counter() - _started) * 1000
+
+
+def record(name, milliseconds):
+    _phases.setdefault(name, round(milliseconds, 1))
+
+
+def mark(name):
+    """Records the time from process import to now under `name`."""
+    record(name, since_start_ms())
+
+
+def report():
+    return dict(_phases)
@@ -0,0 +1,43 @@
+import itertools
+import os
+
+import pytest
+
+# Every test runs against the in-memory Firestore stand-in (services.memory_firestore)
+os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+
+_patient_ids = itertools.count()
+
+CALM_LOG = {
+    "pain_score": 2, "temperature": 36.8, "redness": "None", "swelling": "Mild", "discharge": False,
+    "mobility": "Normal", "sleep_hours": 7.5, "appetite": "Good", "fatigue": "Low", "mood": "Good",
+    "antibiotics_taken": True, "pain_meds_taken": True, "dressing_changed": True,
+}
+
+
+@pytest.fixture
+def patient_id():
+    """A patient no other test has written for (the stand-in lives for the whole session)."""
+    return f"patient-{next(_patient_ids)}"
+
+
+@pytest.fixture
+def daily_log(patient_id):
+    """daily_log(day, **changes): a /submit_log body for `patient_id`, `day` days after 1 Oct."""
+    def build(day=0, **changes):
+        return {**CALM_LOG, "patient_id": patient_id, "timestamp": f"2026-10-{day + 1:02d}T09:00:00", **changes}
+    return build
+
+
+@pytest.fixture(scope="session")
+def db():
+    from services.firebase_service import get_db
+    return get_db()
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+    return TestClient(main.app)
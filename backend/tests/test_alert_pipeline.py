@@ -0,0 +1,141 @@
+"""Alert dedup and the alert outbox (services.alert_pipeline)."""
+import asyncio
+import time
+
+import pytest
+
+from models.log_model import DailyLog
+from models.log_record import LogRecord
+from services.alert_pipeline import AlertPipeline
+from services.firebase_service import FirebaseService
+from services.rolling_stats import RollingTrendStats
+
+YELLOW = {"risk_level": "yellow", "risk_score": 1.0, "message": "Minor issues detected."}
+RED = {"risk_level": "red", "risk_score": 2.0, "message": "High risk detected!"}
+
+
+class FlakyService(FirebaseService):
+    """write_alerts fails the first `failures` times."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def write_alerts(self, *args):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Firestore unavailable")
+        return super().write_alerts(*args)
+
+
+def alerts_of(db, patient_id):
+    return [doc.to_dict() for doc in db.collection("alerts").stream() if doc.to_dict()["patient_id"] == patient_id]
+
+
+def outbox(db):
+    return [doc.id for doc in db.collection("alert_outbox").stream()]
+
+
+def save(daily_log, risk_data):
+    """Stores a log with its alert_outbox entry, as the logs router does; returns the entry id."""
+    log = LogRecord.from_model(DailyLog(**daily_log()))
+    return FirebaseService().save_log(log.patient_id, log, RollingTrendStats(), alert=risk_data)
+
+
+def run(pipeline, submissions, wait=0.0):
+    """Submits (patient_id, risk_data, outbox_id) results, lets the workers run `wait` seconds and stops."""
+    async def main():
+        await pipeline.start()
+        for submission in submissions:
+            pipeline.submit(*submission)
+            # One commit per result, so dedup spans commits as well
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(wait)
+        await pipeline.stop()
+    asyncio.run(main())
+    return pipeline.stats()
+
+
+def test_repeats_bump_the_open_alert(db, patient_id):
+    pipeline = AlertPipeline(outbox_sweep_seconds=3600)
+    stats = run(pipeline, [(patient_id, YELLOW), (patient_id, YELLOW), (patient_id, YELLOW)])
+
+    [alert] = alerts_of(db, patient_id)
+    assert alert["occurrences"] == 3
+    assert stats["created"] == 1
+    assert stats["coalesced"] == 2
+
+
+def test_higher_level_opens_a_new_alert(db, patient_id):
+    run(AlertPipeline(outbox_sweep_seconds=3600), [(patient_id, YELLOW), (patient_id, RED), (patient_id, YELLOW)])
+
+    alerts = sorted(alerts_of(db, patient_id), key=lambda alert: alert["risk_level"])
+    assert [(alert["risk_level"], alert["occurrences"]) for alert in alerts] == [("red", 2), ("yellow", 1)]
+
+
+def test_expired_or_acknowledged_alert_is_not_reused(db, patient_id):
+    pipeline = AlertPipeline(outbox_sweep_seconds=3600)
+    now = time.time()
+    run(pipeline, [(patient_id, YELLOW, None, now - 7200), (patient_id, YELLOW, None, now)])
+    assert len(alerts_of(db, patient_id)) == 2
+
+    pipeline.acknowledged([pipeline._open[patient_id].alert_id])
+    run(pipeline, [(patient_id, YELLOW)])
+    assert len(alerts_of(db, patient_id)) == 3
+
+
+def test_failed_writes_are_retried_until_written(db, patient_id, daily_log):
+    outbox_id = save(daily_log, RED)
+    pipeline = AlertPipeline(service=FlakyService(failures=3), retries=1, backoff_seconds=0.001,
+                             retry_seconds=0.02, outbox_sweep_seconds=3600)
+
+    stats = run(pipeline, [(patient_id, RED, outbox_id)], wait=0.3)
+
+    assert stats["requeued"] >= 1
+    assert stats["unwritten"] == 0
+    assert len(alerts_of(db, patient_id)) == 1
+    assert outbox_id not in outbox(db)
+
+
+def test_outbox_entry_left_by_a_stopped_worker_is_swept(db, patient_id, daily_log):
+    outbox_id = save(daily_log, RED)
+    entry = db.collection("alert_outbox").document(outbox_id)
+    entry.set({"created_at": time.time() - 120}, merge=True)
+
+    stats = run(AlertPipeline(outbox_sweep_seconds=60), [], wait=0.2)
+
+    assert stats["recovered"] >= 1
+    assert [alert["risk_level"] for alert in alerts_of(db, patient_id)] == ["red"]
+    assert outbox_id not in outbox(db)
+
+
+def test_outbox_entry_written_by_two_workers_is_one_alert(db, patient_id, daily_log):
+    outbox_id = save(daily_log, RED)
+
+    # The owner and a worker that swept the entry both write it
+    first = run(AlertPipeline(outbox_sweep_seconds=3600), [(patient_id, RED, outbox_id)])
+    second = run(AlertPipeline(outbox_sweep_seconds=3600), [(patient_id, RED, outbox_id)])
+
+    [alert] = alerts_of(db, patient_id)
+    assert alert["occurrences"] == 1
+    assert (first["created"], second["created"]) == (1, 0)
+    status = db.collection("patient_status").document(patient_id).get().to_dict()
+    assert status["open_alerts"] == 1
+
+
+def test_full_batch_fits_one_commit(db, patient_id):
+    def results(count):
+        # New alerts of distinct patients, each with an outbox entry: three writes apiece
+        for index in range(count):
+            outbox_id = f"{patient_id}-{count}-{index}"
+            db.collection("alert_outbox").document(outbox_id).set({"patient_id": patient_id})
+            yield outbox_id, outbox_id, RED, [outbox_id]
+
+    created, _ = FirebaseService().write_alerts(list(results(AlertPipeline.MAX_EVENTS_PER_BATCH)), {})
+    assert len(created) == AlertPipeline.MAX_EVENTS_PER_BATCH
+    assert not [outbox_id for outbox_id in outbox(db) if outbox_id.startswith(patient_id)]
+
+    with pytest.raises(ValueError):
+        FirebaseService().write_alerts(list(results(AlertPipeline.MAX_EVENTS_PER_BATCH + 1)), {})
+    # Nothing of the oversized batch was written
+    assert len([outbox_id for outbox_id in outbox(db) if outbox_id.startswith(patient_id)]) == AlertPipeline.MAX_EVENTS_PER_BATCH + 1
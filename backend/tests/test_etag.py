@@ -0,0 +1,74 @@
+"""ETags of the per-patient read endpoints (services.response_cache)."""
+import pytest
+
+from models.log_model import DailyLog
+from models.log_record import LogRecord
+from services.firebase_service import FirebaseService
+from services.history_cache import HistoryCache
+
+PATHS = ["/risk/{}", "/patient_logs/{}", "/recovery_score/{}"]
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_matching_etag_gets_304(client, patient_id, daily_log, path):
+    client.post("/submit_log", json=daily_log())
+    path = path.format(patient_id)
+    first = client.get(path)
+
+    again = client.get(path, headers={"If-None-Match": first.headers["etag"]})
+
+    assert first.status_code == 200
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["etag"] == first.headers["etag"]
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_new_log_changes_etag(client, patient_id, daily_log, path):
+    client.post("/submit_log", json=daily_log(0))
+    path = path.format(patient_id)
+    first = client.get(path)
+
+    client.post("/submit_log", json=daily_log(1, pain_score=9))
+    after = client.get(path, headers={"If-None-Match": first.headers["etag"]})
+
+    assert after.status_code == 200
+    assert after.headers["etag"] != first.headers["etag"]
+    assert after.content != first.content
+
+
+def write_as_another_worker(log):
+    """Saves a log the way a second uvicorn worker would: its own history cache, nothing shared here."""
+    worker = FirebaseService(cache=HistoryCache())
+    record = LogRecord.from_model(DailyLog(**log))
+    trend_stats, log_version = worker.get_trend_stats(record.patient_id)
+    trend_stats.push(record)
+    worker.save_log(record.patient_id, record, trend_stats, log_version)
+
+
+def test_write_by_another_worker_changes_etag_and_body(client, patient_id, daily_log):
+    client.post("/submit_log", json=daily_log(0))
+    risk = client.get(f"/risk/{patient_id}")
+    logs = client.get(f"/patient_logs/{patient_id}")
+    recovery = client.get(f"/recovery_score/{patient_id}")
+    assert risk.json()["risk_level"] == "green"
+
+    write_as_another_worker(daily_log(1, pain_score=10, temperature=39.5, discharge=True))
+    risk_after = client.get(f"/risk/{patient_id}", headers={"If-None-Match": risk.headers["etag"]})
+    logs_after = client.get(f"/patient_logs/{patient_id}", headers={"If-None-Match": logs.headers["etag"]})
+    recovery_after = client.get(f"/recovery_score/{patient_id}", headers={"If-None-Match": recovery.headers["etag"]})
+
+    assert risk_after.status_code == logs_after.status_code == recovery_after.status_code == 200
+    assert risk_after.json()["risk_level"] == "red"
+    assert len(logs_after.json()["logs"]) == 2
+    assert recovery_after.json()["recovery_score"] != recovery.json()["recovery_score"]
+    # The new body is memoized under the new ETag, not the old body
+    assert client.get(f"/risk/{patient_id}").json() == risk_after.json()
+
+
+def test_patient_without_logs(client, patient_id):
+    response = client.get(f"/risk/{patient_id}")
+
+    assert response.status_code == 200
+    assert response.json()["message"] == "No logs yet"
+    assert client.get(f"/risk/{patient_id}", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
@@ -0,0 +1,59 @@
+"""Bulk /ingest_logs: batches written with the same log_version check as /submit_log."""
+import json
+
+from models.log_model import DailyLog
+from models.log_record import LogRecord
+from routers import ingest
+from services.firebase_service import BulkLogWriter, FirebaseService
+
+
+def status(db, patient_id):
+    return db.collection("patient_status").document(patient_id).get().to_dict()
+
+
+def upload(client, logs):
+    body = "\n".join(json.dumps(log) for log in logs)
+    response = client.post("/ingest_logs", content=body)
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_raced_by_another_worker_is_rescored(client, db, patient_id, daily_log, monkeypatch):
+    flush = ingest.firebase_service.flush
+
+    async def flush_after_another_worker(writer):
+        # A log saved elsewhere after the upload read the trend state
+        monkeypatch.setattr(ingest.firebase_service, "flush", flush)
+        worker = FirebaseService()
+        record = LogRecord.from_model(DailyLog(**daily_log(0, pain_score=9)))
+        trend_stats, log_version = worker.get_trend_stats(patient_id)
+        trend_stats.push(record)
+        worker.save_log(patient_id, record, trend_stats, log_version)
+        return await flush(writer)
+
+    monkeypatch.setattr(ingest.firebase_service, "flush", flush_after_another_worker)
+    results = upload(client, [daily_log(1), daily_log(2)])
+
+    assert [result["status"] for result in results] == ["ok", "ok"]
+    stored = status(db, patient_id)
+    assert stored["log_version"] == 2
+    # Neither the other worker's log nor the upload's is lost from the trend state
+    assert stored["trend_stats"]["count"] == 3
+
+
+def test_failed_batch_is_not_kept_in_the_trend_state(client, db, patient_id, daily_log, monkeypatch):
+    # Three logs of one patient per batch
+    monkeypatch.setattr(BulkLogWriter, "MAX_OPS", 6)
+    flush = ingest.firebase_service.flush
+
+    async def fail_once(writer):
+        monkeypatch.setattr(ingest.firebase_service, "flush", flush)
+        raise RuntimeError("Firestore unavailable")
+
+    monkeypatch.setattr(ingest.firebase_service, "flush", fail_once)
+    results = upload(client, [daily_log(day) for day in range(6)])
+
+    assert results[0] == {"status": "error", "detail": "Batch write failed: Firestore unavailable", "lines": [1, 2, 3]}
+    assert [result["status"] for result in results[1:]] == ["ok"] * 3
+    stored = status(db, patient_id)
+    assert stored["log_version"] == 1
+    assert stored["trend_stats"]["count"] == 3
@@ -0,0 +1,42 @@
+"""/score_batch against the per-log scoring path."""
+import numpy as np
+import pytest
+
+from ml import inference
+from ml.features import FEATURE_NAMES
+from ml.model import LogisticRiskModel
+from models.log_model import DailyLog
+from models.log_record import LogRecord
+from services.risk_engine import RiskEngine
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """A loaded model that pages on the columns the rules never read."""
+    coef = np.zeros((3, len(FEATURE_NAMES)))
+    for field, weight in [("sleep_hours", -1.0), ("mobility", 3.0), ("appetite", 1.0), ("mood", 1.0),
+                          ("pain_meds_taken", -2.0), ("dressing_changed", -2.0)]:
+        coef[2, FEATURE_NAMES.index(field)] = weight
+    model = LogisticRiskModel(FEATURE_NAMES, np.zeros(len(FEATURE_NAMES)), np.ones(len(FEATURE_NAMES)),
+                              coef, [0.0, -10.0, 0.0])
+    monkeypatch.setattr(inference, "_model", model)
+    monkeypatch.setattr(inference, "_loaded", True)
+    return model
+
+
+def test_batch_and_single_log_scores_agree(client, daily_log, model):
+    logs = [
+        daily_log(),
+        daily_log(mobility="Bedridden", sleep_hours=3, mood="Very Poor", pain_meds_taken=False),
+        daily_log(mobility="Limited", appetite="Poor", dressing_changed=False),
+        daily_log(sleep_hours=9, appetite="Excellent", mood="Excellent"),
+    ]
+    fields = [field for field in DailyLog.model_fields if field not in ("timestamp", "log_id")]
+    batch = {field: [log[field] for log in logs] for field in fields}
+
+    response = client.post("/score_batch", json=batch)
+
+    engine = RiskEngine()
+    expected = [engine.calculate_risk(LogRecord.from_model(DailyLog(**log)))["risk_level"] for log in logs]
+    assert [result["risk_level"] for result in response.json()["results"]] == expected
+    assert "red" in expected and "green" in expected
@@ -0,0 +1,76 @@
+"""Idempotent /submit_log and the trend state written with every log."""
+import asyncio
+
+import httpx
+
+import main
+from routers import logs
+from services.idempotency import IdempotencyStore
+
+
+def stored_logs(db, patient_id):
+    return list(db.collection("daily_logs").where("patient_id", "==", patient_id).stream())
+
+
+def status(db, patient_id):
+    return db.collection("patient_status").document(patient_id).get().to_dict()
+
+
+def test_repeated_log_id_is_scored_and_written_once(client, db, patient_id, daily_log):
+    first = client.post("/submit_log", json=daily_log(log_id="a1"))
+    repeat = client.post("/submit_log", json=daily_log(log_id="a1"))
+
+    assert first.status_code == repeat.status_code == 200
+    assert repeat.json() == first.json()
+    assert len(stored_logs(db, patient_id)) == 1
+    assert status(db, patient_id)["log_version"] == 1
+
+
+def test_idempotency_key_header(client, db, patient_id, daily_log):
+    headers = {"Idempotency-Key": "k1"}
+    first = client.post("/submit_log", json=daily_log(), headers=headers).json()
+
+    assert client.post("/submit_log", json=daily_log(), headers=headers).json() == first
+    assert len(stored_logs(db, patient_id)) == 1
+
+
+def test_repeat_after_restart_returns_stored_response(client, db, patient_id, daily_log, monkeypatch):
+    first = client.post("/submit_log", json=daily_log(log_id="a1", pain_score=9)).json()
+    trend_stats = status(db, patient_id)["trend_stats"]
+
+    # A new worker remembers nothing; the stored log answers the retry
+    monkeypatch.setattr(logs, "idempotency_store", IdempotencyStore())
+    repeat = client.post("/submit_log", json=daily_log(log_id="a1", pain_score=1)).json()
+
+    assert repeat == first
+    assert len(stored_logs(db, patient_id)) == 1
+    assert status(db, patient_id)["trend_stats"] == trend_stats
+
+
+def test_log_without_key_is_always_new(client, db, patient_id, daily_log):
+    client.post("/submit_log", json=daily_log())
+    client.post("/submit_log", json=daily_log())
+
+    assert len(stored_logs(db, patient_id)) == 2
+
+
+async def post_all(bodies):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(client.post("/submit_log", json=body) for body in bodies))
+
+
+def test_concurrent_retries_write_one_log(db, patient_id, daily_log):
+    responses = asyncio.run(post_all([daily_log(log_id="c1")] * 5))
+
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.text for response in responses}) == 1
+    assert len(stored_logs(db, patient_id)) == 1
+
+
+def test_concurrent_logs_all_reach_trend_stats(db, patient_id, daily_log):
+    responses = asyncio.run(post_all([daily_log(day, pain_score=day % 10) for day in range(12)]))
+
+    assert {response.status_code for response in responses} == {200}
+    assert status(db, patient_id)["log_version"] == 12
+    assert status(db, patient_id)["trend_stats"]["count"] == 12
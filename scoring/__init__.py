@@ -0,0 +1,24 @@
+"""
+Post-op risk scoring shared by the backend (backend/) and the web app
+(WEBATHON/backend), driven by rules/risk_rules.json.
+
+Every log is converted once into the schema of schema.LogInput (the backend's
+LogRecord already carries its daily-log fields under the same names) and
+scored by:
+
+    vitals.evaluate       early-warning risk band, score, confidence and
+                          alerts ("vitals" rules; web app)
+    daily_log.risk_level  green/yellow/red from rules, trend and ML layers
+                          ("daily_log" rules; backend)
+
+Both have a batch form over numpy columns. Layers report their time through
+timing.LAYER_TIMER. `python -m scoring.golden` checks every path, and the web
+app's Node port, against the golden corpus in scoring/corpus.
+
+The apps import it as an installed package: `pip install -e .` from the repo
+root (their requirements files do this).
+"""
+from scoring.daily_log import risk_level, risk_levels_batch
+from scoring.rules import RISK_LEVELS, daily_log_rules, vitals_rules
+from scoring.schema import LogInput
+from scoring.vitals import evaluate, evaluate_batch
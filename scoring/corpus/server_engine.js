@@ -0,0 +1,27 @@
+// Scores golden cases (JSON on stdin) with the web app's Node engine for
+// `python -m scoring.golden --node`. server.js is loaded with express stubbed
+// out, so no server is started.
+const fs = require('fs');
+const path = require('path');
+
+const serverPath = path.resolve(__dirname, '..', '..', 'WEBATHON', 'backend', 'server.js');
+
+const app = { use() {}, get() {}, post() {}, listen() {} };
+const express = () => app;
+express.json = () => null;
+const stubs = { express, cors: () => null, fs: { ...fs, watchFile() {} } };
+
+const source = fs.readFileSync(serverPath, 'utf8').replace(/^﻿/, '');
+const load = new Function(
+  'require', '__dirname', 'process',
+  `${source}\nreturn { evaluate_patient_ultra, mapPayloadToEngineInput };`,
+);
+const engine = load((name) => stubs[name] || require(name), path.dirname(serverPath), process);
+
+const cases = JSON.parse(fs.readFileSync(0, 'utf8'));
+const results = cases.map(({ log, history, surgery_type }) => engine.evaluate_patient_ultra(
+  engine.mapPayloadToEngineInput(log),
+  history.map(engine.mapPayloadToEngineInput),
+  surgery_type,
+));
+process.stdout.write(JSON.stringify(results));
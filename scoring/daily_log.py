@@ -0,0 +1,179 @@
+"""
+Traffic-light risk of a daily log ("daily_log" section of the rule spec), as
+the backend reports it: 0=Green, 1=Yellow, 2=Red.
+
+Layers, in order: rules (deterministic thresholds), trend (least-squares
+slopes of pain and temperature), ml (an optional model), then the highest
+level wins. Each is timed through timing.LAYER_TIMER when set.
+
+The log can be a LogInput or anything carrying schema.DAILY_LOG_FIELDS under
+those names (the backend's LogRecord and DailyLog). Histories here are
+newest first, as the backend reads them.
+"""
+import numpy as np
+
+from scoring.rules import daily_log_rules
+from scoring.timing import lap_timer
+
+TREND_WINDOW = 5
+
+
+def _slope_weights(n):
+    """Centered x values for a least-squares fit against 0..n-1."""
+    x = np.arange(n, dtype=float)
+    return x - x.mean()
+
+
+def least_squares_slope(values):
+    """Closed-form linear regression slope of values against 0..n-1 (np.polyfit(x, y, 1)[0])."""
+    if len(values) < 2:
+        return 0
+    y = np.array(values, dtype=float)
+    w = _slope_weights(len(y))
+    return float((w * y).sum() / (w * w).sum())
+
+
+def calculate_trend_slope(logs, field_name):
+    """
+    Calculates the slope of a given field from a list of logs.
+    Expects logs to be sorted by timestamp (oldest first); missing values count as 0.
+    """
+    return least_squares_slope([float(getattr(log, field_name) or 0) for log in logs])
+
+
+def calculate_trend_slope_batch(matrix, lengths):
+    """
+    Row-wise calculate_trend_slope over right-aligned value matrices.
+    `lengths` is the number of real (trailing) entries in each row.
+    """
+    slopes = np.zeros(matrix.shape[0])
+    for n in np.unique(lengths):
+        if n < 2:
+            continue
+        rows = lengths == n
+        w = _slope_weights(n)
+        y = np.nan_to_num(matrix[rows][:, -n:])
+        slopes[rows] = (y * w).sum(axis=1) / (w * w).sum()
+    return slopes
+
+
+class TrendAnalyzer:
+    def analyze(self, historical_logs=None, stats=None):
+        """
+        Analyzes historical logs (newest first) for increasing trends.
+        When rolling trend stats (count, slope(field)) are given, no log list is needed.
+        """
+        rules = daily_log_rules.get()
+        if stats is not None:
+            if stats.count < rules.trend_min_logs:
+                return 0
+            return self._classify(stats.slope('pain_score'), stats.slope('temperature'), rules)
+
+        if not historical_logs or len(historical_logs) < rules.trend_min_logs:
+            return 0  # Not enough data for trend
+
+        # Analyze last 3-5 logs, oldest first
+        recent_logs = historical_logs[:TREND_WINDOW][::-1]
+
+        pain_slope = calculate_trend_slope(recent_logs, 'pain_score')
+        temp_slope = calculate_trend_slope(recent_logs, 'temperature')
+        return self._classify(pain_slope, temp_slope, rules)
+
+    def _classify(self, pain_slope, temp_slope, rules):
+        # If pain is increasing sharply (slope > 0.5 by default)
+        if pain_slope > rules.pain_slope:
+            return rules.trend_level # Yellow escalation
+
+        # If temp is increasing sharply
+        if temp_slope > rules.temperature_slope:
+            return rules.trend_level
+
+        return 0
+
+    def analyze_batch(self, pain_history, temperature_history, history_lengths):
+        """
+        Vectorized analyze() for many patients.
+        Histories are right-aligned (n_patients, k) matrices, oldest first with the
+        newest log in the last column; `history_lengths` holds each full history length.
+        """
+        rules = daily_log_rules.get()
+        history_lengths = np.asarray(history_lengths)
+        window = np.minimum(history_lengths, min(TREND_WINDOW, pain_history.shape[1]))
+
+        pain_slope = calculate_trend_slope_batch(pain_history, window)
+        temp_slope = calculate_trend_slope_batch(temperature_history, window)
+
+        rising = (pain_slope > rules.pain_slope) | (temp_slope > rules.temperature_slope)
+        return np.where((history_lengths >= rules.trend_min_logs) & rising, rules.trend_level, 0)
+
+
+def stack_values(series, width=TREND_WINDOW):
+    """
+    Stacks the last `width` values of each sequence into a right-aligned
+    matrix padded with NaN. Returns the matrix and the full sequence lengths.
+    """
+    matrix = np.full((len(series), width), np.nan)
+    for row, values in enumerate(series):
+        tail = values[-width:]
+        if len(tail):
+            matrix[row, width - len(tail):] = tail
+    return matrix, np.array([len(values) for values in series], dtype=np.int64)
+
+
+def history_matrix(histories, field_name, width=TREND_WINDOW):
+    """
+    stack_values over one field of each newest-first log history (as passed
+    to analyze()); missing values become 0.
+    """
+    return stack_values(
+        [[float(getattr(log, field_name) or 0) for log in reversed(logs)] for logs in histories],
+        width,
+    )
+
+
+_trend_analyzer = TrendAnalyzer()
+
+
+def risk_level(log, historical_logs=None, trend_stats=None, predict=None):
+    """
+    Risk level of one log. The trend layer reads `trend_stats` when given,
+    otherwise the newest-first `historical_logs`; `predict(log)` is the ML
+    layer (a level), skipped when None.
+    """
+    lap = lap_timer()
+    rule_risk = daily_log_rules.get().run_rules(log)
+    if lap:
+        lap("rules")
+    trend_risk = _trend_analyzer.analyze(historical_logs, stats=trend_stats)
+    if lap:
+        lap("trend")
+    ml_risk = predict(log) if predict is not None else 0
+    if lap:
+        lap("ml")
+    return max(rule_risk, trend_risk, ml_risk)
+
+
+def risk_levels_batch(logs, pain_history=None, temperature_history=None, history_lengths=None, predict_batch=None):
+    """
+    risk_level over columnar logs (field name -> equal-length arrays), as an
+    array. Histories are right-aligned matrices (see history_matrix);
+    `predict_batch(logs, n)` is the ML layer.
+    """
+    lap = lap_timer()
+    rule_risk = daily_log_rules.get().run_rules_batch(logs)
+    n = len(rule_risk)
+    if lap:
+        lap("rules_batch")
+
+    if pain_history is None:
+        trend_risk = np.zeros(n, dtype=rule_risk.dtype)
+    else:
+        trend_risk = _trend_analyzer.analyze_batch(pain_history, temperature_history, history_lengths)
+    if lap:
+        lap("trend_batch")
+
+    ml_risk = predict_batch(logs, n) if predict_batch is not None else np.zeros(n, dtype=rule_risk.dtype)
+    if lap:
+        lap("ml_batch")
+
+    return np.maximum(np.maximum(rule_risk, trend_risk), ml_risk)
@@ -0,0 +1,173 @@
+"""
+Golden-output check of the scoring core.
+
+Run from the repo root:
+
+    python -m scoring.golden            # Python scalar and batch paths
+    python -m scoring.golden --node     # also the web app's Node port (server.js)
+    python -m scoring.golden --update   # rewrite the expected outputs
+
+scoring/corpus/cases.jsonl holds one case per line: a symptom log in the app's
+shape, its oldest-first history (one log per day before it), the log's age
+in hours and a surgery type, with the expected vitals.evaluate result and,
+when the log has every daily-log field (its yes/no flags may be missing),
+the daily-log risk. The outputs were
+recorded from the engines the core replaced, without an ML model (the corpus
+does not depend on ml/risk_model.npz). Each case is converted to LogInputs
+once and scored by every path from them.
+"""
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+from scoring.daily_log import history_matrix, risk_level, risk_levels_batch
+from scoring.rules import RISK_LEVELS
+from scoring.schema import DAILY_LOG_FIELDS, DAILY_LOG_FLAGS, LogInput
+from scoring.vitals import HISTORY_FIELDS, evaluate, evaluate_batch, stack_history
+
+CORPUS = Path(__file__).resolve().parent / "corpus" / "cases.jsonl"
+NODE_ENGINE = Path(__file__).resolve().parent / "corpus" / "server_engine.js"
+
+
+def load_cases(path=CORPUS):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def payloads(case, now):
+    """The case's log and history as timestamped symptom-log payloads."""
+    def stamped(log, age_hours):
+        return {**log, "timestamp": (now - timedelta(hours=age_hours)).isoformat()}
+
+    history = case["history"]
+    return (
+        stamped(case["log"], case["age_hours"]),
+        [stamped(log, 24 * (len(history) - index)) for index, log in enumerate(history)],
+    )
+
+
+def daily_log_result(value):
+    return {"risk_level": RISK_LEVELS[value], "risk_score": float(value)}
+
+
+def has_daily_log_fields(log, history):
+    return all(getattr(log, name) is not None for name in DAILY_LOG_FIELDS if name not in DAILY_LOG_FLAGS) and all(
+        entry.pain_score is not None and entry.temperature is not None for entry in history
+    )
+
+
+def score_python(cases, now):
+    """{path: [result per case]} for the scalar and batch paths."""
+    converted = []
+    for case in cases:
+        log, history = payloads(case, now)
+        converted.append((LogInput.from_symptom_log(log), [LogInput.from_symptom_log(entry) for entry in history]))
+
+    results = {
+        "vitals": [
+            evaluate(log, history, surgery_type=case["surgery_type"])
+            for case, (log, history) in zip(cases, converted)
+        ],
+        "daily_log": [
+            daily_log_result(risk_level(log, history[::-1])) if has_daily_log_fields(log, history) else None
+            for log, history in converted
+        ],
+    }
+
+    logs = [log for log, _ in converted]
+    histories = [history for _, history in converted]
+    columns = {
+        name: np.array([np.nan if getattr(log, name) is None else getattr(log, name) for log in logs], dtype=float)
+        for name in HISTORY_FIELDS + ["missed_doses", "logged_at"]
+    }
+    columns["breathlessness"] = np.array([log.breathlessness for log in logs])
+    columns["discharge"] = np.array([log.discharge for log in logs])
+    matrices, lengths = stack_history(histories)
+    results["vitals_batch"] = evaluate_batch(
+        columns, matrices, lengths,
+        surgery_type=[case["surgery_type"] for case in cases],
+        now=now.timestamp(),
+    )
+
+    rows = [row for row, (log, history) in enumerate(converted) if has_daily_log_fields(log, history)]
+    daily_columns = {name: [getattr(logs[row], name) for row in rows] for name in DAILY_LOG_FIELDS}
+    newest_first = [histories[row][::-1] for row in rows]
+    pain_history, history_lengths = history_matrix(newest_first, "pain_score")
+    temperature_history, _ = history_matrix(newest_first, "temperature")
+    values = risk_levels_batch(daily_columns, pain_history, temperature_history, history_lengths).tolist()
+    batch = [None] * len(cases)
+    for row, value in zip(rows, values):
+        batch[row] = daily_log_result(value)
+    results["daily_log_batch"] = batch
+    return results
+
+
+def score_node(cases, now):
+    """evaluate_patient_ultra of WEBATHON/backend/server.js for every case."""
+    node = shutil.which("node")
+    if node is None:
+        raise SystemExit("node is not installed")
+    jobs = []
+    for case in cases:
+        log, history = payloads(case, now)
+        jobs.append({"log": log, "history": history, "surgery_type": case["surgery_type"]})
+    completed = subprocess.run(
+        [node, str(NODE_ENGINE)], input=json.dumps(jobs), capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout)
+
+
+def compare(cases, results):
+    """Mismatches as (case name, path, expected, got)."""
+    expected_key = {"vitals": "vitals", "vitals_batch": "vitals", "node": "vitals",
+                    "daily_log": "daily_log", "daily_log_batch": "daily_log"}
+    mismatches = []
+    for path, outputs in results.items():
+        for case, got in zip(cases, outputs):
+            expected = case["expected"][expected_key[path]]
+            if got != expected:
+                mismatches.append((case["name"], path, expected, got))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the scoring core against its golden corpus")
+    parser.add_argument("--node", action="store_true", help="also check the Node engine of the web app")
+    parser.add_argument("--update", action="store_true", help="record the current scalar outputs as expected")
+    parser.add_argument("--corpus", default=str(CORPUS))
+    args = parser.parse_args(argv)
+
+    cases = load_cases(args.corpus)
+    now = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    results = score_python(cases, now)
+    elapsed = time.perf_counter() - started
+
+    if args.update:
+        with open(args.corpus, "w", encoding="utf-8") as f:
+            for case, vitals, daily_log in zip(cases, results["vitals"], results["daily_log"]):
+                case["expected"] = {"vitals": vitals, "daily_log": daily_log}
+                f.write(json.dumps(case, separators=(",", ":")) + "\n")
+        print(f"Recorded {len(cases)} cases in {args.corpus}")
+        return 0
+
+    if args.node:
+        results["node"] = score_node(cases, now)
+
+    mismatches = compare(cases, results)
+    for name, path, expected, got in mismatches[:20]:
+        print(f"{name} [{path}]\n  expected {expected}\n  got      {got}")
+    print(f"{len(cases)} cases, paths {', '.join(results)} in {elapsed * 1000:.0f} ms: "
+          f"{len(mismatches)} mismatches")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+
+from scoring.schema import attribute
+
+DEFAULT_RULES_PATH = Path(__file__).resolve().parents[1] / "rules" / "risk_rules.json"
+
+RISK_LEVELS = ["green", "yellow", "red"]
+
+
+def _literal(value):
+    """Only numbers and booleans from the spec are spliced into generated code."""
+    if not isinstance(value, (bool, int, float)):
+        raise ValueError(f"Expected a number or boolean in risk rules, got {value!r}")
+    return repr(value)
+
+
+def _flag_expression(subject, operand):
+    """
+    A boolean condition. A missing (None/NaN) flag counts as not set, as in
+    the baseline rules (`not log.antibiotics_taken` was a YELLOW trigger).
+    """
+    return f"{subject} {'==' if operand else '!='} True"
+
+
+def flags(values):
+    """Array form of the flag rule: True where the flag is set; None/NaN are not set."""
+    values = np.asarray(values)
+    if values.dtype != bool:
+        values = np.asarray(values == True, dtype=bool)  # noqa: E712 - elementwise, NaN/None compare unequal
+    return values
+
+
+def _define(name, lines, namespace=None):
+    """Compiles generated source lines into a function."""
+    namespace = dict(namespace or {})
+    exec(compile("\n".join(lines), f"<risk rules: {name}>", "exec"), namespace)
+    return namespace[name]
+
+
+# ---------------------------------------------------------------------------
+# "daily_log" section: the backend's rule, trend and ML layers
+# ---------------------------------------------------------------------------
+
+class CategoryTable(dict):
+    """
+    Case-insensitive membership table for a categorical rule.
+    Maps raw field values to True/False; a spelling is lowercased once, the
+    first time it is seen, and answered by a plain dict lookup afterwards.
+    """
+
+    MAX_SPELLINGS = 1024
+
+    def __init__(self, name, accepted):
+        super().__init__()
+        self.name = name
+        self.accepted = frozenset(value.lower() for value in accepted)
+        for value in accepted:
+            for spelling in (value.lower(), value.title(), value.upper()):
+                self[spelling] = True
+
+    def __missing__(self, value):
+        hit = str(value).lower() in self.accepted
+        if len(self) < self.MAX_SPELLINGS:
+            self[value] = hit
+        return hit
+
+    def match_array(self, values):
+        uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        return np.array([self[value] for value in uniques.tolist()], dtype=bool)[inverse]
+
+
+class DailyLogRules:
+    """
+    The "daily_log" section of the rule spec compiled for the daily-log layers.
+
+    run_rules is generated Python with the spec's thresholds inlined; categorical
+    conditions go through CategoryTable lookups instead of per-call .lower().
+    `conditions` keeps (level, field, op, operand) for the vectorized path.
+    """
+
+    def __init__(self, spec):
+        self.conditions = []
+        self.tables = {}
+        for level in reversed(range(1, len(RISK_LEVELS))):
+            for rule in spec["rules"].get(RISK_LEVELS[level], []):
+                self.conditions.append(self._condition(level, rule))
+        self.run_rules = self._generate()
+
+        trend = spec["trend"]
+        self.trend_min_logs = trend["min_logs"]
+        self.trend_level = RISK_LEVELS.index(trend["level"])
+        self.pain_slope = trend["slopes"]["pain_score"]
+        self.temperature_slope = trend["slopes"]["temperature"]
+
+    def _condition(self, level, rule):
+        field = attribute(rule["field"])
+        for op in ("min", "below", "equals", "in"):
+            if op in rule:
+                operand = rule[op]
+                if op == "in":
+                    operand = CategoryTable(f"_in_{len(self.tables)}", operand)
+                    self.tables[operand.name] = operand
+                return level, field, op, operand
+        raise ValueError(f"Rule for {field!r} has no condition: {rule}")
+
+    def _expression(self, field, op, operand):
+        subject = f"log.{field}"
+        if op == "min":
+            return f"{subject} >= {_literal(operand)}"
+        if op == "below":
+            return f"{subject} < {_literal(operand)}"
+        if op == "in":
+            return f"{operand.name}[{subject}]"
+        if isinstance(operand, bool):
+            return _flag_expression(subject, operand)
+        return f"{subject} == {_literal(operand)}"
+
+    def _generate(self):
+        lines = ["def run_rules(log):"]
+        for level in reversed(range(1, len(RISK_LEVELS))):
+            terms = [
+                self._expression(field, op, operand)
+                for rule_level, field, op, operand in self.conditions
+                if rule_level == level
+            ]
+            if terms:
+                lines += [f"    if {' or '.join(terms)}:", f"        return {level}"]
+        lines.append("    return 0")
+        return _define("run_rules", lines, self.tables)
+
+    def run_rules_batch(self, logs):
+        """Vectorized run_rules over columnar logs (field name -> sequence)."""
+        n = len(next(iter(logs.values())))
+        levels = np.zeros(n, dtype=np.int64)
+        for level, field, op, operand in self.conditions:
+            values = logs[field]
+            if op == "in":
+                hit = operand.match_array(values)
+            elif op == "equals" and isinstance(operand, bool):
+                hit = flags(values) == operand
+            else:
+                values = np.asarray(values, dtype=float)
+                if op == "min":
+                    hit = values >= operand
+                elif op == "below":
+                    hit = values < operand
+                else:
+                    hit = values == operand
+            levels = np.where(hit & (levels < level), level, levels)
+        return levels
+
+
+# ---------------------------------------------------------------------------
+# "vitals" section: the web app's early-warning layers
+# ---------------------------------------------------------------------------
+
+# One condition of the spec; (op, operand) drive both the generated scalar
+# code and the vectorized form in vector_test(). `field` is the LogInput
+# attribute (spec names are resolved by schema.attribute).
+Step = namedtuple("Step", "field op operand points alert overrides")
+
+
+def _condition(rule, field=None):
+    """Parses one {"min"|"below"|"equals"|"truthy": operand} condition."""
+    field = attribute(rule.get("field", field))
+    for op in ("min", "below", "equals", "truthy"):
+        if op in rule:
+            return Step(field, op, rule[op], rule.get("points", 0), rule.get("alert"), bool(rule.get("overrides")))
+    raise ValueError(f"Rule for {field!r} has no condition: {rule}")
+
+
+def _expression(step, subject):
+    if step.op == "min":
+        return f"{subject} >= {_literal(step.operand)}"
+    if step.op == "below":
+        return f"{subject} < {_literal(step.operand)}"
+    if step.op == "truthy":
+        return subject if step.operand else f"not {subject}"
+    if isinstance(step.operand, bool):
+        return _flag_expression(subject, step.operand)
+    return f"{subject} == {_literal(step.operand)}"
+
+
+def vector_test(step, values):
+    """Array form of a Step over a column (callers mask missing entries)."""
+    if step.op == "min":
+        return values >= step.operand
+    if step.op == "below":
+        return values < step.operand
+    if step.op == "truthy":
+        return values.astype(bool) == bool(step.operand)
+    if isinstance(step.operand, bool):
+        return flags(values) == step.operand
+    return values == step.operand
+
+
+def _ladders(entries):
+    return tuple(
+        (attribute(entry["field"]), tuple(_condition(step, entry["field"]) for step in entry["steps"]))
+        for entry in entries
+    )
+
+
+def _ladder_function(name, ladders):
+    """
+    (data) -> (score, reasons): first matching step per field, in spec order.
+    A matching step marked `overrides` replaces the whole result.
+    """
+    lines = [f"def {name}(data):", "    score = 0", "    reasons = []"]
+    for field_name, steps in ladders:
+        if not steps:
+            continue
+        lines += [f"    value = data.{field_name}", "    if value is not None:"]
+        for index, step in enumerate(steps):
+            lines.append(f"        {'elif' if index else 'if'} {_expression(step, 'value')}:")
+            if step.overrides:
+                lines.append(f"            return {_literal(step.points)}, [{step.alert!r}]")
+            else:
+                lines += [f"            score += {_literal(step.points)}", f"            reasons.append({step.alert!r})"]
+    lines.append("    return score, reasons")
+    return _define(name, lines)
+
+
+def _validation_function(validation):
+    """(data) -> list of alerts for out-of-range readings."""
+    lines = ["def validate(data):", "    issues = []"]
+    for field_name, low, high, alert in validation:
+        lines += [
+            f"    value = data.{field_name}",
+            f"    if value is not None and not ({_literal(low)} <= value <= {_literal(high)}):",
+            f"        issues.append({alert!r})",
+        ]
+    lines.append("    return issues")
+    return _define("validate", lines)
+
+
+def _critical_function(checks):
+    """(data) -> list of alerts for findings that force the top risk band."""
+    lines = ["def critical_alerts(data):", "    alerts = []"]
+    for check in checks:
+        lines += [
+            f"    value = data.{check.field}",
+            f"    if value is not None and {_expression(check, 'value')}:",
+            f"        alerts.append({check.alert!r})",
+        ]
+    lines.append("    return alerts")
+    return _define("critical_alerts", lines)
+
+
+def _surgery_function(check, missing):
+    """(data) -> (points, alert) or None for one surgery type."""
+    lines = ["def surgery_check(data):", f"    value = data.{check.field}"]
+    if missing is not None:
+        lines += ["    if value is None:", f"        value = {_literal(missing)}"]
+    lines += [
+        f"    if value is not None and {_expression(check, 'value')}:",
+        f"        return {_literal(check.points)}, {check.alert!r}",
+        "    return None",
+    ]
+    return _define("surgery_check", lines)
+
+
+class VitalsRules:
+    """
+    The "vitals" section of the rule spec compiled for the vitals layers.
+
+    vitals.evaluate calls functions generated from the spec, so scalar
+    scoring runs the same literal comparisons as hand-written code. The Step
+    tables (first match per field wins) drive vitals.evaluate_batch.
+    """
+
+    def __init__(self, spec):
+        self.stale_hours = spec["stale_hours"]
+        self.validation = tuple(
+            (attribute(rule["field"]), rule["min"], rule["max"], rule["alert"]) for rule in spec["validation"]
+        )
+        self.critical = tuple(_condition(rule) for rule in spec["critical"])
+        self.physiology = _ladders(spec["physiology"])
+        self.symptoms = _ladders(spec["symptoms"])
+
+        self.validate = _validation_function(self.validation)
+        self.critical_alerts = _critical_function(self.critical)
+        self.physiology_score = _ladder_function("physiology_score", self.physiology)
+        self.symptom_score = _ladder_function("symptom_score", self.symptoms)
+
+        trend = spec["trend"]
+        fever, pain = trend["fever"], trend["pain"]
+        self.trend_min_history = trend["min_history"]
+        self.fever_trend = (
+            fever["min"],
+            fever["active"]["min"], fever["active"]["points"], fever["active"]["alert"],
+            fever["otherwise"]["points"], fever["otherwise"]["alert"],
+        )
+        self.pain_trend = (
+            pain["active"]["min"], pain["active"]["points"], pain["active"]["alert"],
+            pain["otherwise"]["points"], pain["otherwise"]["alert"],
+        )
+
+        baseline = spec["baseline"]
+        self.baseline = (baseline["heart_rate_margin"], baseline["points"], baseline["alert"])
+
+        self.surgery = {
+            surgery_type: (_condition(rule), rule.get("missing"))
+            for surgery_type, rule in spec.get("surgery", {}).items()
+        }
+        self.surgery_checks = {
+            surgery_type: _surgery_function(check, missing)
+            for surgery_type, (check, missing) in self.surgery.items()
+        }
+
+        self.risk_bands = tuple((band["min_score"], band["risk"]) for band in spec["risk_bands"])
+        # Critical findings force the top band regardless of score
+        self.critical_risk = self.risk_bands[0][1]
+
+        confidence = spec["confidence"]
+        self.confidence = (
+            confidence["base"],
+            confidence["short_history"],
+            confidence["missing_field"],
+            confidence["stale"],
+            confidence["invalid"],
+        )
+        self.recommended_actions = dict(spec["recommended_actions"])
+
+    def risk_for(self, score, critical):
+        if critical:
+            return self.critical_risk
+        for min_score, risk in self.risk_bands:
+            if score >= min_score:
+                return risk
+        return self.risk_bands[-1][1]
+
+
+# ---------------------------------------------------------------------------
+# Loading
+# ---------------------------------------------------------------------------
+
+class RuleSpec:
+    """
+    Compiled rules that follow edits to the spec file without a restart.
+
+    get() stats the file at most every `check_interval` seconds and recompiles
+    when its mtime changes. A spec that fails to load keeps the previous rules
+    in effect; only the first load raises.
+    """
+
+    def __init__(self, path, compile_rules, section, check_interval=2.0):
+        self.path = Path(path)
+        self.compile_rules = compile_rules
+        self.section = section
+        self.check_interval = check_interval
+        self.version = None
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._compiled = None
+        self.reload()
+
+    @property
+    def fingerprint(self):
+        """Changes whenever the spec file does (spec version and mtime)."""
+        return f"{self.version}-{self._mtime}"
+
+    def get(self):
+        if time.monotonic() >= self._next_check:
+            self._refresh()
+        return self._compiled
+
+    def reload(self):
+        """Recompiles unconditionally."""
+        with self._lock:
+            self._load(self.path.stat().st_mtime)
+
+    def _refresh(self):
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                mtime = self.path.stat().st_mtime
+            except OSError as e:
+                print(f"Keeping previous risk rules, cannot stat {self.path}: {e}")
+                return
+            if mtime == self._mtime:
+                return
+            # A broken edit is reported once, then retried when the file changes again
+            self._mtime = mtime
+            try:
+                self._load(mtime)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Keeping previous risk rules, reload of {self.path} failed: {e}")
+
+    def _load(self, mtime):
+        with open(self.path, encoding="utf-8") as f:
+            spec = json.load(f)
+        self._compiled = self.compile_rules(spec[self.section])
+        self.version = spec.get("version")
+        self._mtime = mtime
+
+
+def load_rules(compile_rules, section):
+    """One section of RISK_RULES_PATH (default: rules/risk_rules.json at the repo root)."""
+    return RuleSpec(
+        os.getenv("RISK_RULES_PATH", str(DEFAULT_RULES_PATH)),
+        compile_rules,
+        section,
+        check_interval=float(os.getenv("RISK_RULES_CHECK_SECONDS", "2")),
+    )
+
+
+daily_log_rules = load_rules(DailyLogRules, "daily_log")
+vitals_rules = load_rules(VitalsRules, "vitals")
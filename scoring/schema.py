@@ -0,0 +1,132 @@
+from datetime import datetime, timezone
+import time
+
+# Attributes the scoring layers read. Names follow the daily log (Android app
+# and backend DailyLog); the vitals readings are None when not taken.
+FIELDS = (
+    "temperature",
+    "spo2",
+    "pain_score",
+    "heart_rate",
+    "breathlessness",
+    "discharge",
+    "missed_doses",
+    "redness",
+    "swelling",
+    "mobility",
+    "sleep_hours",
+    "appetite",
+    "fatigue",
+    "mood",
+    "antibiotics_taken",
+    "pain_meds_taken",
+    "dressing_changed",
+    # POSIX seconds of the log, None when unknown
+    "logged_at",
+)
+
+# Fields the daily_log rules, trend and ML layers read; a backend LogRecord or
+# DailyLog carries them under these names and is scored as is
+DAILY_LOG_FIELDS = (
+    "pain_score", "temperature", "redness", "swelling", "discharge", "mobility", "sleep_hours",
+    "appetite", "fatigue", "mood", "antibiotics_taken", "pain_meds_taken", "dressing_changed",
+)
+# Yes/no daily-log fields; a missing one counts as not set (see rules.flags)
+DAILY_LOG_FLAGS = ("discharge", "antibiotics_taken", "pain_meds_taken", "dressing_changed")
+
+# Names the "vitals" section of the rule spec uses for schema fields
+SPEC_ALIASES = {"pain": "pain_score", "wound_discharge": "discharge"}
+
+
+def attribute(field):
+    """Schema attribute for a field named in the rule spec."""
+    field = SPEC_ALIASES.get(field, field)
+    if not field.isidentifier():
+        raise ValueError(f"Invalid field name in risk rules: {field!r}")
+    return field
+
+
+def parse_time(value, naive_tz=None):
+    """
+    POSIX seconds of a datetime (Firestore timestamps included), an ISO-8601
+    string or a number; None when it has none. Naive times are local unless
+    `naive_tz` says otherwise.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None and naive_tz is not None:
+        value = value.replace(tzinfo=naive_tz)
+    return value.timestamp()
+
+
+class LogInput:
+    """
+    One log in the form every scoring layer reads (see FIELDS).
+
+    Each app converts a log once, where it enters the app, and keeps the
+    LogInput for later requests (as history, in caches) instead of mapping the
+    stored document again. Layers read it by attribute.
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, **values):
+        for name in FIELDS:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    def from_symptom_log(cls, data):
+        """
+        From a symptom_logs document or request of the web app. The engine's
+        own names (pain, wound_discharge, timestamp) are accepted as well; a
+        log without a readable time is taken as written now.
+        """
+        get = data.get
+        log = cls.__new__(cls)
+        log.temperature = get("temperature")
+        log.spo2 = get("spo2")
+        pain = get("pain")
+        log.pain_score = pain if pain is not None else get("pain_score")
+        log.heart_rate = get("heart_rate")
+        log.breathlessness = bool(get("breathlessness", False))
+        log.discharge = bool(get("wound_discharge", get("discharge", False)))
+        missed_doses = get("missed_doses")
+        log.missed_doses = missed_doses if missed_doses is not None else (1 if get("antibiotics_taken") is False else 0)
+        log.redness = get("redness", get("redness_level"))
+        log.swelling = get("swelling", get("swelling_level"))
+        log.mobility = get("mobility", get("mobility_level"))
+        log.sleep_hours = get("sleep_hours")
+        log.appetite = get("appetite")
+        log.fatigue = get("fatigue")
+        log.mood = get("mood")
+        log.antibiotics_taken = get("antibiotics_taken")
+        log.pain_meds_taken = get("pain_meds_taken")
+        log.dressing_changed = get("dressing_changed")
+        logged_at = parse_time(get("createdAt", get("timestamp")))
+        log.logged_at = logged_at if logged_at is not None else time.time()
+        return log
+
+    @classmethod
+    def from_daily_log(cls, log):
+        """From a backend DailyLog or LogRecord (its timestamp is naive UTC)."""
+        values = {name: getattr(log, name) for name in DAILY_LOG_FIELDS}
+        values["missed_doses"] = 1 if log.antibiotics_taken is False else 0
+        values["logged_at"] = parse_time(log.timestamp, naive_tz=timezone.utc)
+        return cls(**values)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in FIELDS}
+
+    def __eq__(self, other):
+        if not isinstance(other, LogInput):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELDS)
+
+    def __repr__(self):
+        return f"LogInput(logged_at={self.logged_at!r})"
@@ -0,0 +1,20 @@
+import time
+
+# Optional per-layer timing hook: LAYER_TIMER(layer, seconds) is called after
+# each scoring layer. Left as None, the layers are not timed.
+LAYER_TIMER = None
+
+
+def lap_timer():
+    """Function reporting the time since the previous lap to LAYER_TIMER (None when unset)."""
+    timer = LAYER_TIMER
+    if timer is None:
+        return None
+    last = time.perf_counter()
+
+    def lap(layer):
+        nonlocal last
+        now = time.perf_counter()
+        timer(layer, now - last)
+        last = now
+    return lap
@@ -0,0 +1,513 @@
+"""
+Early-warning scoring of vital signs and wound symptoms ("vitals" section of
+the rule spec), as the web app reports it: risk band, score, confidence and
+alerts for one LogInput.
+
+Layers, in order: validate, baseline, staleness, critical, physiology (NEWS-
+like score), symptoms, trend, baseline_surgery, decision. Each is timed
+through timing.LAYER_TIMER when set.
+"""
+import statistics
+import time
+import warnings
+
+import numpy as np
+
+from scoring.rules import vector_test, vitals_rules
+from scoring.timing import lap_timer
+
+# Readings whose absence lowers confidence: reported name -> LogInput attribute
+REQUIRED_FIELDS = {"temperature": "temperature", "spo2": "spo2", "pain": "pain_score", "heart_rate": "heart_rate"}
+
+# Thresholds, points and alert texts come from the shared rule spec
+# (rules/risk_rules.json); edits are picked up without a restart.
+RULES = vitals_rules
+
+
+def compute_dynamic_baseline(history, window=5):
+    """Median baseline from recent stable days (history is oldest first)."""
+    if not history:
+        return None
+
+    def is_stable(h):
+        temp = h.temperature
+        spo2 = h.spo2
+        return (temp is None or temp < 38) and (spo2 is None or spo2 >= 94)
+
+    recent = [h for h in history[-window:] if is_stable(h)] or history[-window:]
+
+    def med(values):
+        vals = [value for value in values if value is not None]
+        return statistics.median(vals) if vals else None
+
+    return {
+        "heart_rate": med([h.heart_rate for h in recent]),
+        "temperature": med([h.temperature for h in recent]),
+        "spo2": med([h.spo2 for h in recent]),
+    }
+
+
+def validate_inputs(data, rules=None):
+    """Reject physiologically impossible values."""
+    return (rules or RULES.get()).validate(data)
+
+
+def hours_since(logged_at):
+    if logged_at is None:
+        return None
+    return (time.time() - logged_at) / 3600
+
+
+def news_like_score(data, rules=None):
+    """Physiological early warning scoring."""
+    return (rules or RULES.get()).physiology_score(data)
+
+
+def trend_analysis(history, current_data, rules=None):
+    """Clinically calibrated trend detection."""
+    rules = rules or RULES.get()
+    if not history or len(history) < rules.trend_min_history:
+        return 0, []
+
+    temps = [h.temperature for h in history if h.temperature is not None]
+    pains = [h.pain_score for h in history if h.pain_score is not None]
+
+    return _trend_penalties(temps[-3:], pains[-3:], current_data, rules)
+
+
+def trend_analysis_from_stats(stats, current_data, rules=None):
+    """trend_analysis() driven by rolling patient stats instead of the history list."""
+    rules = rules or RULES.get()
+    if stats.count < rules.trend_min_history:
+        return 0, []
+    return _trend_penalties(list(stats.last_temps), list(stats.last_pains), current_data, rules)
+
+
+def _trend_penalties(temps, pains, current_data, rules):
+    """Scores the last (up to) three temperature and pain readings, oldest first."""
+    penalties = 0
+    reasons = []
+
+    current_temp = current_data.temperature
+    current_pain = current_data.pain_score
+
+    fever_min, active_min, active_points, active_alert, points, alert = rules.fever_trend
+    if len(temps) >= 3 and all(t >= fever_min for t in temps):
+        if current_temp and current_temp >= active_min:
+            penalties += active_points
+            reasons.append(active_alert)
+        else:
+            penalties += points
+            reasons.append(alert)
+
+    active_min, active_points, active_alert, points, alert = rules.pain_trend
+    if len(pains) >= 3 and pains[-1] > pains[-2] > pains[-3]:
+        if current_pain and current_pain >= active_min:
+            penalties += active_points
+            reasons.append(active_alert)
+        else:
+            penalties += points
+            reasons.append(alert)
+
+    return penalties, reasons
+
+
+def evaluate(data, history=None, surgery_type="general", baseline=None, stats=None):
+    """
+    Rule-based post-op risk for one LogInput.
+
+    `history` holds the patient's earlier LogInputs, oldest first. Rolling
+    stats (count, last_temps, last_pains, baseline(); the web app's
+    PatientStats) can be passed as `stats` to score without a history list.
+    """
+    if data is None:
+        return {
+            "risk": "NORMAL",
+            "score": 0,
+            "confidence": 0,
+            "alerts": ["No data provided"],
+            "missing_fields": [],
+            "recommended_action": "Provide patient data",
+        }
+
+    lap = lap_timer()
+    rules = RULES.get()
+    alerts = []
+    score = 0
+
+    validation_issues = rules.validate(data)
+    alerts.extend(validation_issues)
+    if lap:
+        lap("validate")
+
+    if baseline is None:
+        if stats is not None:
+            baseline = stats.baseline()
+        elif history:
+            baseline = compute_dynamic_baseline(history)
+    if lap:
+        lap("baseline")
+
+    missing = [name for name, field in REQUIRED_FIELDS.items() if getattr(data, field) is None]
+
+    hrs = hours_since(data.logged_at)
+    stale = hrs is not None and hrs > rules.stale_hours
+    if stale:
+        alerts.append("Data is stale")
+    if lap:
+        lap("staleness")
+
+    critical_alerts = rules.critical_alerts(data)
+    critical = bool(critical_alerts)
+    alerts.extend(critical_alerts)
+    if lap:
+        lap("critical")
+
+    phys_score, phys_reasons = rules.physiology_score(data)
+    score += phys_score
+    alerts.extend(phys_reasons)
+    if lap:
+        lap("physiology")
+
+    symptom_score, symptom_reasons = rules.symptom_score(data)
+    score += symptom_score
+    alerts.extend(symptom_reasons)
+    if lap:
+        lap("symptoms")
+
+    if stats is not None:
+        t_score, t_alerts = trend_analysis_from_stats(stats, data, rules)
+    else:
+        t_score, t_alerts = trend_analysis(history or [], data, rules)
+    score += t_score
+    alerts.extend(t_alerts)
+    if lap:
+        lap("trend")
+
+    margin, points, alert = rules.baseline
+    heart_rate = data.heart_rate
+    if baseline and heart_rate and baseline.get("heart_rate"):
+        if heart_rate > baseline["heart_rate"] + margin:
+            score += points
+            alerts.append(alert)
+
+    surgery_check = rules.surgery_checks.get(surgery_type)
+    finding = surgery_check(data) if surgery_check else None
+    if finding:
+        score += finding[0]
+        alerts.append(finding[1])
+    if lap:
+        lap("baseline_surgery")
+
+    risk = rules.risk_for(score, critical)
+
+    history_length = stats.count if stats is not None else len(history or [])
+    base, short_history, missing_field, stale_penalty, invalid_penalty = rules.confidence
+
+    confidence = base
+    if history_length < rules.trend_min_history:
+        confidence -= short_history
+
+    confidence -= len(missing) * missing_field
+
+    if stale:
+        confidence -= stale_penalty
+
+    if validation_issues:
+        confidence -= invalid_penalty
+
+    confidence = max(0, confidence)
+    if lap:
+        lap("decision")
+
+    return {
+        "risk": risk,
+        "score": score,
+        "confidence": confidence,
+        "alerts": alerts,
+        "missing_fields": missing,
+        "recommended_action": rules.recommended_actions[risk],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Batch scoring
+#
+# The batch path takes columnar float arrays (NaN marks a missing reading) and
+# reproduces evaluate() row by row using array operations only. History is
+# passed as right-aligned (n_patients, k) matrices: the newest entry sits in
+# the last column and shorter histories are left-padded with NaN.
+# ---------------------------------------------------------------------------
+
+HISTORY_FIELDS = ["temperature", "spo2", "pain_score", "heart_rate"]
+
+
+def stack_history(histories, fields=HISTORY_FIELDS, width=None):
+    """Builds right-aligned history matrices from per-patient lists of LogInputs."""
+    lengths = np.array([len(h) for h in histories], dtype=np.int64)
+    if width is None:
+        width = int(lengths.max()) if len(lengths) else 0
+
+    matrices = {name: np.full((len(histories), width), np.nan) for name in fields}
+    for row, history in enumerate(histories):
+        tail = history[-width:] if width else []
+        offset = width - len(tail)
+        for col, entry in enumerate(tail, start=offset):
+            for name in fields:
+                value = getattr(entry, name)
+                if value is not None:
+                    matrices[name][row, col] = value
+
+    return matrices, lengths
+
+
+def _column(data, name, n, fill=np.nan, dtype=float):
+    values = data.get(name)
+    if values is None:
+        return np.full(n, fill, dtype=dtype)
+    return np.asarray(values, dtype=dtype)
+
+
+def _last_valid(matrix, count):
+    """Returns the last `count` non-NaN values per row (oldest first) and the valid count."""
+    rows = matrix.shape[0]
+    out = np.full((rows, count), np.nan)
+    valid = ~np.isnan(matrix)
+    n_valid = valid.sum(axis=1)
+    if matrix.shape[1] == 0:
+        return out, n_valid
+
+    rank = np.cumsum(valid[:, ::-1], axis=1)[:, ::-1]
+    for j in range(1, count + 1):
+        selected = valid & (rank == j)
+        has = selected.any(axis=1)
+        idx = selected.argmax(axis=1)
+        out[has, count - j] = matrix[has, idx[has]]
+    return out, n_valid
+
+
+def _baseline_heart_rate(history, lengths, window=5):
+    """Vectorized compute_dynamic_baseline(...)["heart_rate"]; NaN where None."""
+    rows = len(lengths)
+    width = history["heart_rate"].shape[1]
+    if width == 0:
+        return np.full(rows, np.nan)
+
+    cols = np.arange(width)
+    real = cols[None, :] >= (width - lengths)[:, None]
+    in_window = real & (cols[None, :] >= width - window)
+
+    temp = history["temperature"][:, -width:]
+    spo2 = history["spo2"][:, -width:]
+    stable = in_window & (np.isnan(temp) | (temp < 38)) & (np.isnan(spo2) | (spo2 >= 94))
+    use = np.where(stable.any(axis=1)[:, None], stable, in_window)
+
+    hr = np.where(use, history["heart_rate"], np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanmedian(hr, axis=1)
+
+
+def _any(masks, n):
+    return np.logical_or.reduce([np.zeros(n, dtype=bool)] + masks)
+
+
+def _present(values):
+    if values.dtype == bool:
+        return np.ones(len(values), dtype=bool)
+    return ~np.isnan(values)
+
+
+def _ladder_masks(ladders, columns):
+    """
+    Vectorized form of the generated ladder functions: returns the score and (mask, alert) pairs in
+    scalar alert order. Rows hit by an `overrides` step keep only that step.
+    """
+    n = len(next(iter(columns.values())))
+    entries = []
+    overridden = np.zeros(n, dtype=bool)
+    override_points = np.zeros(n, dtype=np.int64)
+
+    for field_name, steps in ladders:
+        values = columns[field_name]
+        remaining = _present(values)
+        for step in steps:
+            mask = remaining & vector_test(step, values)
+            remaining &= ~mask
+            if step.overrides:
+                mask &= ~overridden
+                override_points[mask] = step.points
+                overridden |= mask
+            entries.append((mask, step))
+
+    score = np.zeros(n, dtype=np.int64)
+    pairs = []
+    for mask, step in entries:
+        if not step.overrides:
+            mask = mask & ~overridden
+            score += step.points * mask
+        pairs.append((mask, step.alert))
+
+    return np.where(overridden, override_points, score), pairs
+
+
+def evaluate_batch(data, history=None, history_lengths=None,
+                   surgery_type="general", baseline_heart_rate=None, now=None):
+    """
+    Scores many patients at once with the same rules as evaluate().
+
+    `data` maps LogInput attributes to 1-D arrays: temperature, spo2,
+    pain_score and heart_rate (NaN when missing), breathlessness and discharge
+    (bool), missed_doses and an optional `logged_at`. `history` maps
+    HISTORY_FIELDS to right-aligned matrices (see stack_history) with
+    `history_lengths` giving the real number of entries per patient.
+    """
+    n = len(next(iter(data.values()))) if data else 0
+    if n == 0:
+        return []
+
+    rules = RULES.get()
+    columns = {
+        "temperature": _column(data, "temperature", n),
+        "spo2": _column(data, "spo2", n),
+        "pain_score": _column(data, "pain_score", n),
+        "heart_rate": _column(data, "heart_rate", n),
+        "breathlessness": _column(data, "breathlessness", n, False, bool),
+        "discharge": _column(data, "discharge", n, False, bool),
+        "missed_doses": _column(data, "missed_doses", n, 0),
+    }
+    temp, pain, hr = columns["temperature"], columns["pain_score"], columns["heart_rate"]
+    logged_at = _column(data, "logged_at", n)
+
+    if history is None:
+        history = {name: np.full((n, 0), np.nan) for name in HISTORY_FIELDS}
+        history_lengths = np.zeros(n, dtype=np.int64)
+    elif history_lengths is None:
+        history_lengths = np.full(n, history["temperature"].shape[1], dtype=np.int64)
+    history_lengths = np.asarray(history_lengths, dtype=np.int64)
+
+    surgery_type = np.asarray(surgery_type)
+
+    with np.errstate(invalid="ignore"):
+        missing = [~_present(columns[field]) for field in REQUIRED_FIELDS.values()]
+        has_hr = ~np.isnan(hr)
+
+        # Validation
+        validation = []
+        for field_name, low, high, alert in rules.validation:
+            values = columns[field_name]
+            validation.append((_present(values) & ~((values >= low) & (values <= high)), alert))
+        invalid = _any([mask for mask, _ in validation], n)
+
+        if now is None:
+            now = time.time()
+        hrs = (now - logged_at) / 3600
+        stale = ~np.isnan(hrs) & (hrs > rules.stale_hours)
+
+        critical_alerts = [
+            (_present(columns[check.field]) & vector_test(check, columns[check.field]), check.alert)
+            for check in rules.critical
+        ]
+        critical = _any([mask for mask, _ in critical_alerts], n)
+
+        phys, phys_alerts = _ladder_masks(rules.physiology, columns)
+        symptoms, symptom_alerts = _ladder_masks(rules.symptoms, columns)
+
+        # Trend layer
+        enough = history_lengths >= rules.trend_min_history
+        last_temps, n_temps = _last_valid(history["temperature"], 3)
+        last_pains, n_pains = _last_valid(history["pain_score"], 3)
+
+        fever_min, fever_active_min, fever_active_points, fever_active_alert, fever_points, fever_alert = rules.fever_trend
+        fever_trend = enough & (n_temps >= 3) & np.all(last_temps >= fever_min, axis=1)
+        fever_active = fever_trend & (temp != 0) & (temp >= fever_active_min)
+        fever_recent = fever_trend & ~fever_active
+
+        pain_active_min, pain_active_points, pain_active_alert, pain_points, pain_alert = rules.pain_trend
+        pain_trend = (
+            enough & (n_pains >= 3)
+            & (last_pains[:, 2] > last_pains[:, 1]) & (last_pains[:, 1] > last_pains[:, 0])
+        )
+        pain_worse = pain_trend & (pain != 0) & (pain >= pain_active_min)
+        pain_monitor = pain_trend & ~pain_worse
+
+        # Personal baseline
+        if baseline_heart_rate is None:
+            base_hr = _baseline_heart_rate(history, history_lengths)
+        else:
+            base_hr = np.asarray(baseline_heart_rate, dtype=float)
+        margin, baseline_points, baseline_alert = rules.baseline
+        hr_elevated = (
+            has_hr & (hr != 0) & ~np.isnan(base_hr) & (base_hr != 0) & (hr > base_hr + margin)
+        )
+
+        surgery_alerts = []
+        for name, (check, missing_value) in rules.surgery.items():
+            values = columns[check.field]
+            present = _present(values)
+            if missing_value is not None:
+                values = np.where(present, values, missing_value)
+                present = np.ones(n, dtype=bool)
+            mask = (surgery_type == name) & present & vector_test(check, values)
+            surgery_alerts.append((mask, check))
+
+    score = (
+        phys + symptoms
+        + fever_active_points * fever_active + fever_points * fever_recent
+        + pain_active_points * pain_worse + pain_points * pain_monitor
+        + baseline_points * hr_elevated
+        + sum(check.points * mask for mask, check in surgery_alerts)
+    ).astype(np.int64)
+
+    risk = np.select(
+        [critical] + [score >= min_score for min_score, _ in rules.risk_bands],
+        [rules.critical_risk] + [band for _, band in rules.risk_bands],
+        rules.risk_bands[-1][1],
+    )
+
+    base, short_history, missing_field, stale_penalty, invalid_penalty = rules.confidence
+    confidence = (
+        base
+        - short_history * ~enough
+        - missing_field * sum(m.astype(np.int64) for m in missing)
+        - stale_penalty * stale
+        - invalid_penalty * invalid
+    )
+    confidence = np.maximum(confidence, 0)
+
+    alert_masks = (
+        validation
+        + [(stale, "Data is stale")]
+        + critical_alerts
+        + phys_alerts
+        + symptom_alerts
+        + [
+            (fever_active, fever_active_alert),
+            (fever_recent, fever_alert),
+            (pain_worse, pain_active_alert),
+            (pain_monitor, pain_alert),
+            (hr_elevated, baseline_alert),
+        ]
+        + [(mask, check.alert) for mask, check in surgery_alerts]
+    )
+    alerts = [[] for _ in range(n)]
+    for mask, message in alert_masks:
+        for i in np.flatnonzero(mask):
+            alerts[i].append(message)
+
+    missing_fields = [[] for _ in range(n)]
+    for mask, name in zip(missing, REQUIRED_FIELDS):
+        for i in np.flatnonzero(mask):
+            missing_fields[i].append(name)
+
+    return [
+        {
+            "risk": level,
+            "score": int(s),
+            "confidence": int(c),
+            "alerts": a,
+            "missing_fields": m,
+            "recommended_action": rules.recommended_actions[level],
+        }
+        for level, s, c, a, m in zip(risk.tolist(), score, confidence, alerts, missing_fields)
+    ]
@@ -0,0 +1,39 @@
+"""The scoring core against its golden corpus (python -m scoring.golden)."""
+import math
+import shutil
+
+import numpy as np
+import pytest
+
+from scoring import golden
+from scoring.rules import daily_log_rules
+from scoring.schema import DAILY_LOG_FIELDS, LogInput
+
+CALM_LOG = {
+    "pain_score": 2, "temperature": 36.8, "redness": "None", "swelling": "Mild", "discharge": False,
+    "mobility": "Normal", "sleep_hours": 7.5, "appetite": "Good", "fatigue": "Low", "mood": "Good",
+    "antibiotics_taken": True, "pain_meds_taken": True, "dressing_changed": True,
+}
+
+
+def test_python_paths_match_corpus():
+    assert golden.main([]) == 0
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_node_engine_matches_corpus():
+    assert golden.main(["--node"]) == 0
+
+
+@pytest.mark.parametrize("missing", [None, math.nan])
+@pytest.mark.parametrize("field, expected", [("antibiotics_taken", 1), ("discharge", 0)])
+def test_missing_flag_counts_as_not_set_in_both_paths(field, expected, missing):
+    rules = daily_log_rules.get()
+    log = LogInput(**{**CALM_LOG, field: missing})
+    columns = {name: [getattr(log, name)] for name in DAILY_LOG_FIELDS}
+
+    assert rules.run_rules(log) == expected
+    assert rules.run_rules_batch(columns).tolist() == [expected]
+    # As columns_from_records and the exported analytics columns carry them
+    columns[field] = np.array([missing], dtype=object if missing is None else float)
+    assert rules.run_rules_batch(columns).tolist() == [expected]